@@ -2,6 +2,7 @@
 ASGI config for foody project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Besides the Django application it serves the order events stream, see ``orders.events``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -13,4 +14,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foody.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from orders.events import order_events  # noqa: E402, the apps have to be loaded first
+
+ORDER_EVENTS_PATH: str = '/events/orders/'
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == ORDER_EVENTS_PATH:
+        await order_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,351 @@
+import glob
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from foody.permissions import IsStrictAdministrator
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+SLOWEST_QUERIES: int = 3
+
+
+class RouteStats(object):
+    __slots__ = ('statuses', 'latency_buckets', 'latency_sum', 'size_buckets', 'size_sum', 'queries', 'sql_time')
+
+    def __init__(self) -> None:
+        self.statuses: Dict[str, int] = {}
+        self.latency_buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum: float = 0
+        self.size_buckets: List[int] = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_sum: int = 0
+        self.queries: int = 0
+        self.sql_time: float = 0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def merge(self, data: dict) -> None:
+        for status, count in data['statuses'].items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, data['latency_buckets'])]
+        self.size_buckets = [a + b for a, b in zip(self.size_buckets, data['size_buckets'])]
+        for name in ('latency_sum', 'size_sum', 'queries', 'sql_time'):
+            setattr(self, name, getattr(self, name) + data[name])
+
+
+def _is_process_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        return _is_windows_process_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _is_windows_process_alive(pid: int) -> bool:
+    # os.kill sends CTRL_C_EVENT for the signal 0 on Windows, so the process is probed by its handle instead
+    import ctypes
+
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        # The process of another user exists but cannot be opened
+        return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED
+    try:
+        exit_code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == 259  # STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+@contextmanager
+def _exclusive_lock(path: str) -> Iterator[None]:
+    """
+    Holds the lock of the file, it blocks until the other processes release it
+    """
+    # The modules are platform specific, so they are imported only when the snapshots are shared through METRICS_DIR
+    with open(path, 'w') as lock:
+        if os.name == 'nt':
+            import msvcrt
+            while True:
+                try:
+                    # It gives up after 10 attempts, one per second
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+
+class MetricsRegistry(object):
+    """
+    Keeps the request metrics of the process. With `METRICS_DIR` every process flushes a snapshot of its metrics to
+    that directory, so the metrics of all gunicorn workers are aggregated by whichever of them serves `/metrics`.
+
+    A snapshot is named by the pid and a random id of the process, so a new process with a reused pid never
+    overwrites the snapshot of a stopped one. The snapshots of the stopped processes are merged into
+    `compacted.json` and removed when the metrics are collected, so the counters never go backwards
+    """
+    COMPACTED: str = 'compacted.json'
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._last_flush: float = 0
+        self._pid: int = 0
+        self._snapshot_name: str = ''
+
+    @property
+    def snapshot_name(self) -> str:
+        # The registry is created before the server forks the workers, so the id is taken in the worker
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._snapshot_name = f'snapshot-{self._pid}-{uuid.uuid4().hex}.json'
+        return self._snapshot_name
+
+    def record(self, route: str, method: str, status: int, latency: float, size: int, queries: int,
+               sql_time: float) -> None:
+        with self._lock:
+            stats = self._routes.get((route, method))
+            if stats is None:
+                stats = self._routes[(route, method)] = RouteStats()
+            stats.statuses[str(status)] = stats.statuses.get(str(status), 0) + 1
+            stats.latency_buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats.latency_sum += latency
+            stats.size_buckets[bisect_left(SIZE_BUCKETS, size)] += 1
+            stats.size_sum += size
+            stats.queries += queries
+            stats.sql_time += sql_time
+        if settings.METRICS_DIR and time.monotonic() - self._last_flush > settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        with self._lock:
+            snapshot = [[route, method, stats.as_dict()] for (route, method), stats in self._routes.items()]
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        self._write(os.path.join(settings.METRICS_DIR, self.snapshot_name), snapshot)
+
+    @staticmethod
+    def _write(path: str, data) -> None:
+        with open(f'{path}.tmp', 'w') as output:
+            json.dump(data, output)
+        os.replace(f'{path}.tmp', path)
+
+    def _read_snapshots(self) -> List[list]:
+        """
+        Merges the snapshots of the stopped processes into the compacted snapshot and reads it with the snapshots of
+        the running processes. The names of the merged snapshots are kept in the compacted snapshot until they are
+        removed, so a snapshot is never merged twice, even if the compaction is interrupted
+
+        :return: the compacted snapshot and the snapshots of the running processes
+        """
+        path = os.path.join(settings.METRICS_DIR, self.COMPACTED)
+        # Only one process compacts at a time, the snapshots are flushed without the lock by atomic renames
+        with _exclusive_lock(os.path.join(settings.METRICS_DIR, '.lock')):
+            compacted = {'merged': [], 'routes': []}
+            if os.path.exists(path):
+                with open(path) as compacted_file:
+                    compacted = json.load(compacted_file)
+
+            names = [name for name in map(os.path.basename,
+                                          glob.glob(os.path.join(settings.METRICS_DIR, 'snapshot-*.json')))
+                     if name not in compacted['merged']]
+            stopped = [name for name in names if not _is_process_alive(int(name.split('-')[1]))]
+            if stopped:
+                routes = _merge([compacted['routes']] + [self._read(name) for name in stopped])
+                compacted = {'merged': compacted['merged'] + stopped,
+                             'routes': [[route, method, stats.as_dict()] for (route, method), stats in routes.items()]}
+                self._write(path, compacted)
+            if compacted['merged']:
+                for name in compacted['merged']:
+                    if os.path.exists(os.path.join(settings.METRICS_DIR, name)):
+                        os.remove(os.path.join(settings.METRICS_DIR, name))
+                compacted['merged'] = []
+                self._write(path, compacted)
+            return [compacted['routes']] + [self._read(name) for name in names if name not in stopped]
+
+    @staticmethod
+    def _read(name: str) -> list:
+        with open(os.path.join(settings.METRICS_DIR, name)) as snapshot_file:
+            return json.load(snapshot_file)
+
+    def collect(self) -> Dict[Tuple[str, str], RouteStats]:
+        """
+        :return: metrics of this process merged with the snapshots of the other processes
+        """
+        if not settings.METRICS_DIR:
+            with self._lock:
+                snapshots = [[[route, method, stats.as_dict()] for (route, method), stats in self._routes.items()]]
+        else:
+            self.flush()
+            snapshots = self._read_snapshots()
+        return _merge(snapshots)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+def _merge(snapshots: List[list]) -> Dict[Tuple[str, str], RouteStats]:
+    routes: Dict[Tuple[str, str], RouteStats] = {}
+    for snapshot in snapshots:
+        for route, method, data in snapshot:
+            routes.setdefault((route, method), RouteStats()).merge(data)
+    return routes
+
+
+registry = MetricsRegistry()
+
+
+class _QueryRecorder(object):
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.time: float = 0
+        self.slowest: List[Tuple[float, str]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.time += duration
+            if len(self.slowest) < SLOWEST_QUERIES:
+                heapq.heappush(self.slowest, (duration, sql))
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, sql))
+
+
+def get_route(request) -> str:
+    """
+    :return: name of the view serving the request, with the action for the DRF viewsets, e.g. `ProductView.list`
+    """
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return 'unmatched'
+    func = resolver_match.func
+    view_class = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    if view_class is None:
+        return resolver_match.view_name or func.__name__
+    actions = getattr(func, 'actions', None)
+    if actions:
+        return f'{view_class.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    return view_class.__name__
+
+
+class MetricsMiddleware(object):
+    """
+    Records latency, SQL queries and response size of every request, labeled by the route. Requests slower than
+    `METRICS_SLOW_REQUEST_THRESHOLD` are logged with their slowest SQL statements
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = _QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        latency = time.perf_counter() - started
+
+        route = get_route(request)
+        size = len(response.content) if not response.streaming else 0
+        registry.record(route, request.method, response.status_code, latency, size, recorder.count, recorder.time)
+        if latency > settings.METRICS_SLOW_REQUEST_THRESHOLD:
+            logger.warning('Slow request %s %s (%s) took %.3f s, %s queries in %.3f s. Slowest queries: %s',
+                           request.method, request.get_full_path(), route, latency, recorder.count, recorder.time,
+                           ' | '.join(f'{duration:.3f} s {sql}' for duration, sql in sorted(recorder.slowest,
+                                                                                           reverse=True)))
+        return response
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram(lines: List[str], name: str, labels: str, buckets, counts: List[int], total: float) -> None:
+    cumulative = 0
+    for bound, count in zip(list(buckets) + ['+Inf'], counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {total}')
+    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+
+def render_metrics(routes: Dict[Tuple[str, str], RouteStats]) -> str:
+    """
+    :return: the metrics in the Prometheus text exposition format
+    """
+    requests = ['# HELP foody_http_requests_total Number of the served requests',
+                '# TYPE foody_http_requests_total counter']
+    latency = ['# HELP foody_http_request_duration_seconds Latency of the requests',
+               '# TYPE foody_http_request_duration_seconds histogram']
+    size = ['# HELP foody_http_response_size_bytes Size of the response bodies',
+            '# TYPE foody_http_response_size_bytes histogram']
+    queries = ['# HELP foody_http_sql_queries_total Number of the SQL queries made by the requests',
+               '# TYPE foody_http_sql_queries_total counter']
+    sql_time = ['# HELP foody_http_sql_duration_seconds_total Time spent in the SQL queries made by the requests',
+                '# TYPE foody_http_sql_duration_seconds_total counter']
+    for (route, method), stats in sorted(routes.items()):
+        labels = f'route="{_escape(route)}",method="{method}"'
+        for status, count in sorted(stats.statuses.items()):
+            requests.append(f'foody_http_requests_total{{{labels},status="{status}"}} {count}')
+        _histogram(latency, 'foody_http_request_duration_seconds', labels, LATENCY_BUCKETS, stats.latency_buckets,
+                   stats.latency_sum)
+        _histogram(size, 'foody_http_response_size_bytes', labels, SIZE_BUCKETS, stats.size_buckets, stats.size_sum)
+        queries.append(f'foody_http_sql_queries_total{{{labels}}} {stats.queries}')
+        sql_time.append(f'foody_http_sql_duration_seconds_total{{{labels}}} {stats.sql_time}')
+    return '\n'.join(requests + latency + size + queries + sql_time) + '\n'
+
+
+def _is_metrics_reader(request) -> bool:
+    if settings.METRICS_TOKEN:
+        return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}')
+    # Without the token only the administrators read the metrics
+    drf_request = Request(request, authenticators=[authentication() for authentication
+                                                   in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return IsStrictAdministrator().has_permission(drf_request, None)
+    except AuthenticationFailed:
+        return False
+
+
+def metrics(request):
+    if not _is_metrics_reader(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,5 +1,91 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from functools import reduce
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 
 class PagePagination(PageNumberPagination):
     page_size_query_param = 'size'
+
+
+class TimestampCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (timestamp, id), newest first. Unlike the DRF cursor, which keeps only the first ordering
+    field in the cursor and skips the rows with the same value by an offset, the cursor holds the values of all
+    the ordering fields, so every page is a range read of the (timestamp, id) index
+    """
+    ordering = ('-timestamp', '-id')
+    page_size_query_param = 'size'
+
+    def get_ordering(self, request, queryset, view):
+        # The ordering filter of the view is used only when the client asks for an ordering
+        ordering = list(super().get_ordering(request, queryset, view)
+                        if request.query_params.get('ordering') else self.ordering)
+        # The primary key breaks the ties, so that every position is unique
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return tuple(ordering)
+
+    def decode_cursor(self, request):
+        # The position is applied by `paginate_queryset`, the base class only orders, limits and builds the links
+        cursor = super().decode_cursor(request)
+        return cursor._replace(position=None) if cursor is not None else None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = self.get_ordering(request, queryset, view)
+        cursor = super().decode_cursor(request)
+        position = cursor.position if cursor is not None else None
+        if position is not None:
+            try:
+                values = json.loads(position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self._get_position_filter(values, cursor.reverse))
+
+        page = super().paginate_queryset(queryset, request, view)
+        if page is not None and position is not None:
+            # The page follows the position, so there is a page on the other side of it
+            if cursor.reverse:
+                self.has_next, self.next_position = True, position
+            else:
+                self.has_previous, self.previous_position = True, position
+            self.display_page_controls = self.template is not None
+        return page
+
+    def _get_position_filter(self, values: list, reverse: bool) -> Q:
+        """
+        :return: rows after the position (timestamp, id) in the order of the page, e.g.
+        `timestamp < t OR (timestamp = t AND id < i)` for the newest first
+        """
+        conditions = []
+        for index, order in enumerate(self.ordering):
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            equal = {field.lstrip('-'): value for field, value in zip(self.ordering[:index], values)}
+            conditions.append(Q(**equal, **{f'{order.lstrip("-")}__{lookup}': values[index]}))
+        return reduce(lambda left, right: left | right, conditions)
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [order.lstrip('-') for order in ordering]
+        if isinstance(instance, dict):
+            return json.dumps([str(instance[field]) for field in fields])
+        return json.dumps([str(getattr(instance, field)) for field in fields])
+
+
+class CursorPaginationMixin(object):
+    """
+    Switches a view to the cursor pagination when the client asks for it by `pagination=cursor` or follows
+    a cursor link. Otherwise the default page number pagination is used
+    """
+    cursor_pagination_class = TimestampCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            query_params = self.request.query_params
+            if 'cursor' in query_params or query_params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+        return super().paginator
@@ -2,6 +2,7 @@ from rest_framework import permissions
 from rest_framework.permissions import SAFE_METHODS
 
 from users.models import User, UserRole
+from users.roles import resolve_user_role
 
 
 class IsAuthenticatedAndConfirmed(permissions.IsAuthenticated):
@@ -11,8 +12,9 @@ class IsAuthenticatedAndConfirmed(permissions.IsAuthenticated):
 
 class IsExecutor(permissions.BasePermission):
     def has_permission(self, request, view) -> bool:
-        user_role = UserRole.objects.filter(user=request.user, is_confirmed=True).first()
-        return user_role.role in (UserRole.UserRoleChoice.executor.name, UserRole.UserRoleChoice.administrator.name)
+        user_role = resolve_user_role(request.user, request)
+        return bool(user_role) and user_role.is_confirmed and \
+            user_role.role in (UserRole.UserRoleChoice.executor.name, UserRole.UserRoleChoice.administrator.name)
 
 
 class IsAdministrator(permissions.BasePermission):
@@ -20,13 +22,22 @@ class IsAdministrator(permissions.BasePermission):
         if request.method in SAFE_METHODS:
             return True
         else:
-            return self.is_administrator(request.user)
+            return self.is_administrator(request.user, request)
 
     @staticmethod
-    def is_administrator(user: User) -> bool:
-        return UserRole.objects.filter(user=user,
-                                       role=UserRole.UserRoleChoice.administrator.name,
-                                       is_confirmed=True).exists()
+    def is_administrator(user: User, request=None) -> bool:
+        user_role = resolve_user_role(user, request)
+        return bool(user_role) and user_role.is_confirmed and \
+            user_role.role == UserRole.UserRoleChoice.administrator.name
+
+
+class IsStrictAdministrator(permissions.BasePermission):
+    """
+    Unlike `IsAdministrator`, it requires the administrator role for the safe methods too
+    """
+
+    def has_permission(self, request, view) -> bool:
+        return IsAdministrator.is_administrator(request.user, request)
 
 
 class IsOwner(permissions.BasePermission):
@@ -0,0 +1,105 @@
+from functools import lru_cache
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.response import Response
+
+# Converters which give the same result as `to_representation` of the exact field classes, without the method call
+_PRIMITIVE_CONVERTERS = {
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+    serializers.CharField: str,
+    serializers.BooleanField: bool,
+    serializers.ReadOnlyField: None,
+}
+
+
+class _FieldReader(NamedTuple):
+    name: str
+    column: str
+    convert: Optional[Callable]
+
+
+class ValuesReader(object):
+    """
+    Builds the representation of the rows fetched by `QuerySet.values()`, without instantiating the models and
+    walking the field tree of the serializer. The output is the same as the output of the serializer
+    """
+
+    def __init__(self, fields: List[_FieldReader]) -> None:
+        self._fields = fields
+        self.columns: List[str] = list(dict.fromkeys(field.column for field in fields))
+
+    def read(self, row: dict) -> dict:
+        data = {}
+        for name, column, convert in self._fields:
+            value = row[column]
+            data[name] = value if value is None or convert is None else convert(value)
+        return data
+
+    def read_many(self, rows: Iterable[dict]) -> List[dict]:
+        return [self.read(row) for row in rows]
+
+
+def _compile_field(field: serializers.Field, model) -> Optional[_FieldReader]:
+    if isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer,
+                          serializers.ManyRelatedField, serializers.HiddenField)) or len(field.source_attrs) != 1:
+        return None
+    source = field.source_attrs[0]
+    try:
+        model_field = model._meta.pk if source == 'pk' else model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete or model_field.many_to_many:
+        return None
+
+    if isinstance(field, serializers.RelatedField):
+        if type(field) is not serializers.PrimaryKeyRelatedField:
+            return None
+        # The related field represents the primary key, which is the value of the foreign key column
+        convert = field.pk_field.to_representation if field.pk_field is not None else None
+        return _FieldReader(field.field_name, model_field.attname, convert)
+
+    if model_field.is_relation:
+        return None
+    return _FieldReader(field.field_name, model_field.attname,
+                        _PRIMITIVE_CONVERTERS.get(type(field), field.to_representation))
+
+
+@lru_cache(maxsize=None)
+def get_values_reader(serializer_class) -> Optional[ValuesReader]:
+    """
+    Compiles the reader of the given model serializer
+
+    :param serializer_class: model serializer whose output is reproduced
+    :return: the reader or None if some of the fields cannot be read from the values, e.g. method or nested fields
+    """
+    if not issubclass(serializer_class, serializers.ModelSerializer):
+        return None
+    serializer = serializer_class(context={})
+    fields = []
+    for field in serializer._readable_fields:
+        field_reader = _compile_field(field, serializer.Meta.model)
+        if field_reader is None:
+            return None
+        fields.append(field_reader)
+    return ValuesReader(fields)
+
+
+class ValuesListMixin(object):
+    """
+    Serves the list action from `QuerySet.values()` by the compiled `ValuesReader`, if the serializer allows that.
+    Serializers with method, nested or property fields are served by the regular `list`
+    """
+
+    def list(self, request, *args, **kwargs):
+        reader = get_values_reader(self.get_serializer_class())
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = self.filter_queryset(self.get_queryset()).values(*reader.columns)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(reader.read_many(page))
+        return Response(reader.read_many(rows))
@@ -0,0 +1,93 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+# Apps whose models may be read from the replicas. Users and tokens are always read from the primary,
+# so a fresh login or role change is seen immediately
+REPLICA_APPS = ('products', 'orders')
+# Caches which are not shared by the processes of a server
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+_use_read_replica: ContextVar[bool] = ContextVar('use_read_replica', default=False)
+
+
+@contextmanager
+def use_primary():
+    """
+    Reads from the primary database in the block, even if the current request is routed to the replicas
+    """
+    token = _use_read_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_read_replica.reset(token)
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        if _use_read_replica.get() and settings.DATABASE_REPLICAS and model._meta.app_label in REPLICA_APPS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def _get_sticky_key(request) -> str:
+    client = request.META.get('HTTP_AUTHORIZATION') or request.META.get('REMOTE_ADDR', '')
+    return f'replica-sticky:{hashlib.sha1(client.encode()).hexdigest()}'
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    Routes the reads of the safe requests to the views with `use_read_replica = True` to the replicas. Once
+    a client has written, its requests read from the primary for `DATABASE_REPLICA_STICKY_SECONDS`
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _use_read_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_read_replica.reset(token)
+        if settings.DATABASE_REPLICAS and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+                and response.status_code < 400:
+            cache.set(_get_sticky_key(request), True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if settings.DATABASE_REPLICAS and request.method in ('GET', 'HEAD', 'OPTIONS') \
+                and getattr(view_class, 'use_read_replica', False) and not cache.get(_get_sticky_key(request)):
+            _use_read_replica.set(True)
+        return None
+
+
+@checks.register(checks.Tags.caches, checks.Tags.database)
+def check_sticky_cache(app_configs, **kwargs):
+    """
+    The clients which have written are remembered in the default cache, so every process has to see the same cache.
+    Otherwise the next read served by another process may go to a replica which has not received the write yet
+    """
+    if settings.DATABASE_REPLICAS and settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            'The read replicas need a default cache shared by all the processes',
+            hint='Set CACHE_BACKEND and CACHE_LOCATION, e.g. to the memcached, database or file based cache',
+            id='foody.E001',
+        )]
+    return []
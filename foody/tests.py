@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
+from unittest import mock
+
+from django.db.utils import load_backend
+from django.test import override_settings, SimpleTestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from foody.metrics import registry, MetricsRegistry
+from foody.routers import ReplicaRouter, check_sticky_cache
+from products.models import Product, Category
+from users.models import UserRole
+from utils.tests import ApiTestCase
+
+
+class MetricsTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        registry.reset()
+        self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.administrator)
+        Product.objects.create(name='Product', description='Description', price=1, cooking_time=60)
+
+    def test_metrics(self):
+        self.client.get('/products/')
+        self.client.get('/products/')
+        self.client.get('/products/0/')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        self.assertIn('foody_http_requests_total{route="ProductView.list",method="GET",status="200"} 2', lines)
+        self.assertIn('foody_http_requests_total{route="ProductView.retrieve",method="GET",status="404"} 1', lines)
+        self.assertIn('foody_http_request_duration_seconds_count{route="ProductView.list",method="GET"} 2', lines)
+        self.assertIn('foody_http_request_duration_seconds_bucket{route="ProductView.list",method="GET",le="+Inf"} 2',
+                      lines)
+        queries = [line for line in lines if line.startswith('foody_http_sql_queries_total{route="ProductView.list"')]
+        self.assertGreater(int(queries[0].rsplit(' ', 1)[1]), 0)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        client = APIClient()
+        self.assertEqual(client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, status.HTTP_200_OK)
+
+    def test_metrics_are_for_administrators_without_token(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer forged').status_code,
+                         status.HTTP_403_FORBIDDEN)
+        client = self._create_user_model(email='client@email.com', is_email_confirmed=True)
+        UserRole.objects.create(user=client, role=UserRole.UserRoleChoice.client.name, is_confirmed=True)
+        self._login(client)
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_slow_request_is_logged(self):
+        with override_settings(METRICS_SLOW_REQUEST_THRESHOLD=0), self.assertLogs('foody.metrics') as logs:
+            self.client.get('/products/')
+        self.assertIn('ProductView.list', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_metrics_of_processes_are_aggregated(self):
+        with tempfile.TemporaryDirectory() as metrics_dir, override_settings(METRICS_DIR=metrics_dir):
+            # Snapshot of another worker process, which is running
+            self._write_snapshot(metrics_dir, os.getppid())
+            self.client.get('/products/')
+
+            lines = self.client.get('/metrics').content.decode().splitlines()
+        self.assertIn('foody_http_requests_total{route="ProductView.list",method="GET",status="200"} 4', lines)
+
+    def test_snapshots_of_stopped_processes_are_compacted(self):
+        stopped = subprocess.Popen(['true'])
+        stopped.wait()
+        with tempfile.TemporaryDirectory() as metrics_dir, override_settings(METRICS_DIR=metrics_dir):
+            self._write_snapshot(metrics_dir, stopped.pid)
+            self.client.get('/products/')
+
+            for _ in range(2):
+                lines = self.client.get('/metrics').content.decode().splitlines()
+                self.assertIn('foody_http_requests_total{route="ProductView.list",method="GET",status="200"} 4',
+                              lines)
+            self.assertEqual(sorted(name for name in os.listdir(metrics_dir) if name.endswith('.json')),
+                             ['compacted.json', registry.snapshot_name])
+
+    def test_snapshot_names_are_unique_per_process(self):
+        self.assertNotEqual(MetricsRegistry().snapshot_name, registry.snapshot_name)
+
+    @staticmethod
+    def _write_snapshot(metrics_dir: str, pid: int) -> None:
+        with open(os.path.join(metrics_dir, f'snapshot-{pid}-other.json'), 'w') as snapshot_file:
+            json.dump([['ProductView.list', 'GET', {
+                'statuses': {'200': 3}, 'latency_buckets': [3] + [0] * 11, 'latency_sum': 0.003,
+                'size_buckets': [0] * 6, 'size_sum': 0, 'queries': 6, 'sql_time': 0.001,
+            }]], snapshot_file)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.administrator)
+        # The replica is chosen, but the queries go to the test database
+        choice_patcher = mock.patch('foody.routers.random.choice', return_value='default')
+        self.choice = choice_patcher.start()
+        self.addCleanup(choice_patcher.stop)
+
+        self.reads = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record_read(router, model, **hints):
+            choices = self.choice.call_count
+            database = db_for_read(router, model, **hints)
+            self.reads.append((model._meta.app_label, self.choice.call_count > choices))
+            return database
+
+        read_patcher = mock.patch.object(ReplicaRouter, 'db_for_read', autospec=True, side_effect=record_read)
+        read_patcher.start()
+        self.addCleanup(read_patcher.stop)
+
+    def test_catalog_reads_are_routed_to_replicas(self):
+        self.client.get('/products/categories/')
+        self.assertIn(('products', True), self.reads)
+        # Users and tokens are read from the primary
+        self.assertIn(('authtoken', False), self.reads)
+        self.assertNotIn(('authtoken', True), self.reads)
+
+        self.reads.clear()
+        self.client.get('/users/')
+        self.assertFalse(any(routed for _, routed in self.reads))
+
+    def test_reads_after_write_are_sticky(self):
+        self.client.post('/products/categories/', {'name': 'Category', 'icon_url': 'http://icon'})
+        self.reads.clear()
+        self.client.get('/products/categories/')
+        self.assertIn(('products', False), self.reads)
+        self.assertFalse(any(routed for _, routed in self.reads))
+
+    def test_sticky_reads_need_shared_cache(self):
+        # The tests use the in-memory cache
+        self.assertEqual([error.id for error in check_sticky_cache(None)], ['foody.E001'])
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(check_sticky_cache(None), [])
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(CACHES=caches):
+            self.assertEqual(check_sticky_cache(None), [])
+
+    def test_router_outside_of_requests(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Category), 'default')
+        self.assertEqual(router.db_for_write(Category), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'products'))
+
+
+class SqliteProductionProfileTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+
+    def _connect(self, **settings):
+        backend = load_backend('foody.sqlite3')
+        wrapper = backend.DatabaseWrapper({
+            'ENGINE': 'foody.sqlite3', 'NAME': self.path, 'OPTIONS': {}, 'TIME_ZONE': None,
+            'AUTOCOMMIT': True, 'CONN_MAX_AGE': 0, 'ATOMIC_REQUESTS': False, **settings
+        })
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def _pragma(self, wrapper, name: str):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        wrapper = self._connect()
+        self.assertEqual(self._pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self._pragma(wrapper, 'busy_timeout'), 5000)
+        # NORMAL
+        self.assertEqual(self._pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self._pragma(wrapper, 'cache_size'), -64 * 1024)
+
+    def test_pragmas_are_overridden_by_settings(self):
+        wrapper = self._connect(PRAGMAS={'busy_timeout': 100})
+        self.assertEqual(self._pragma(wrapper, 'busy_timeout'), 100)
+
+    def test_transactions_take_write_lock_immediately(self):
+        wrapper = self._connect()
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+        wrapper._start_transaction_under_autocommit()
+
+        # The transaction has not written anything yet, but another writer is already locked out
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+            other.execute('INSERT INTO item (id) VALUES (1)')
+        wrapper.connection.rollback()
+        other.execute('INSERT INTO item (id) VALUES (1)')
@@ -1,10 +1,13 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
-from users.views import AuthToken
+from foody.metrics import metrics
+from users.views import AuthToken, refresh_token, revoke_token
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -19,12 +22,18 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('api-token-auth/', AuthToken.as_view(), name='api_token_auth'),
+    path('api-token-refresh/', refresh_token, name='api_token_refresh'),
+    path('api-token-revoke/', revoke_token, name='api_token_revoke'),
     path('users/', include('users.urls')),
     path('products/', include('products.urls')),
     path('admin/', admin.site.urls),
     path('orders/', include('orders.urls')),
+    path('metrics', metrics, name='metrics'),
 
     path(r'swagger<str:format>', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path(r'swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path(r'redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
+
+# Serves the images of the local image storage in the debug mode
+urlpatterns += static(settings.IMAGE_STORAGE_URL, document_root=settings.IMAGE_STORAGE_ROOT)
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from orders.models import Order, OrderExecution, History
+from orders.models import Order, OrderExecution, History, DailyProductSales, DailyExecutorThroughput
 
 admin.site.register(Order)
 admin.site.register(OrderExecution)
 admin.site.register(History)
+admin.site.register(DailyProductSales)
+admin.site.register(DailyExecutorThroughput)
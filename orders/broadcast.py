@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from typing import Dict, Iterable, Set, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription(object):
+    """
+    Receives the messages published to a set of channels. It is consumed from the event loop it was created in
+    """
+
+    def __init__(self, broadcast: 'BaseBroadcast', channels: Iterable[str]) -> None:
+        self.channels: Set[str] = set(channels)
+        self._broadcast = broadcast
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def put(self, message: dict) -> None:
+        # Messages are published from the sync threads, so they are handed over to the loop of the subscriber
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        Waits for the next message
+
+        :param timeout: seconds to wait for, forever if not given
+        :return: the message or None if the timeout has passed
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self._broadcast.unsubscribe(self)
+
+
+class BaseBroadcast(object):
+    def publish(self, channel: str, message: dict) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        raise NotImplementedError
+
+
+class InMemoryBroadcast(BaseBroadcast):
+    """
+    Delivers the messages to the subscribers of the same process. It is meant for the tests and for single node
+    deployments running one ASGI worker
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+
+    def publish(self, channel: str, message: dict) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscriptions.pop(channel, None)
+
+
+_broadcast: Optional[BaseBroadcast] = None
+
+
+def get_broadcast() -> BaseBroadcast:
+    global _broadcast
+    if _broadcast is None:
+        _broadcast = import_string(settings.ORDER_EVENTS_BROADCAST)()
+    return _broadcast
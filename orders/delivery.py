@@ -0,0 +1,67 @@
+from typing import Iterable, List
+
+from django.db import transaction, connection
+from django.utils import timezone
+
+from orders import eta
+from orders.events import publish_execution_status
+from orders.models import Order, OrderExecution, History
+from orders.rollups import record_history
+
+
+class OrderExecutionsNotFound(Exception):
+    def __init__(self, ids: List[int]) -> None:
+        super().__init__(f'Order executions with pk: {", ".join(map(str, ids))} not found')
+        self.ids = ids
+
+
+def deliver_order_executions(order_execution_ids: Iterable[int]) -> List[History]:
+    """
+    Marks the order executions as delivered: moves their orders to the history and removes the orders and
+    the executions. The number of the queries does not depend on the number of the executions
+
+    :param order_execution_ids: executions to deliver
+    :raise OrderExecutionsNotFound: if some of the executions do not exist or have been delivered in the meantime.
+    Nothing is delivered then
+    :return: created history items
+    """
+    order_execution_ids = set(order_execution_ids)
+    order_executions = list(OrderExecution.objects.filter(pk__in=order_execution_ids)
+                            .select_related('order', 'executor'))
+    missing = order_execution_ids - {order_execution.pk for order_execution in order_executions}
+    if missing:
+        raise OrderExecutionsNotFound(sorted(missing))
+
+    finish_time = timezone.now()
+    with transaction.atomic():
+        # The delete is the first statement of the transaction, so no read lock is held while it waits for the write
+        # lock. If another request has delivered some of the executions in the meantime, fewer rows are deleted
+        deleted = OrderExecution.objects.filter(pk__in=order_execution_ids)._raw_delete(connection.alias)
+        if deleted != len(order_executions):
+            transaction.set_rollback(True)
+            raise OrderExecutionsNotFound(sorted(order_execution_ids))
+
+        history = History.objects.bulk_create([History(
+            product_id=order_execution.order.product_id,
+            user_id=order_execution.order.user_id,
+            count=order_execution.order.count,
+            price=order_execution.order.price,
+            cooking_time=order_execution.order.cooking_time,
+            executor=order_execution.executor,
+            finish_time=finish_time,
+            delivery_address=order_execution.order.delivery_address
+        ) for order_execution in order_executions])
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # The inserted rows are found by the finish time, which is shared only by this batch
+            history = list(History.objects.filter(finish_time=finish_time,
+                                                  executor_id__in={item.executor_id for item in history})
+                           .order_by('id'))
+        record_history(history)
+        order_ids = [order_execution.order_id for order_execution in order_executions]
+        Order.objects.filter(pk__in=order_ids)._raw_delete(connection.alias)
+        eta.orders_removed(order_ids)
+
+        for order_execution in order_executions:
+            publish_execution_status(order_execution.order_id, order_execution.order.user_id, order_execution.pk,
+                                     OrderExecution.Status.delivered)
+    return history
@@ -0,0 +1,326 @@
+"""
+Estimated ready time of the orders.
+
+The kitchen is modelled as the executors cooking in parallel. Every executor cooks the taken orders one by one:
+the cooking ones first, then the pending ones in the order they were taken. The untaken orders wait in one queue
+in the order they were created, and are spread over the executors as the executors become free. Cooking times are
+in seconds.
+
+The model is kept in memory and updated incrementally from the order events: every event and every estimate of
+an untaken order costs O(log n), where n is the number of the untaken orders. The positions in the queue of
+an executor are computed once after it changes, so an estimate of a taken order costs O(1) after that.
+
+The model is loaded from the database in a background thread, and the estimates are not available until then.
+The events of the process keep it up to date afterwards. Every process has its own model, so the events of the other
+processes are picked up by rebuilding the model in the background thread every `ORDER_ETA_RELOAD_INTERVAL` seconds.
+"""
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from foody.routers import use_primary
+from orders.models import Order, OrderExecution
+from users.models import UserRole
+
+logger = logging.getLogger(__name__)
+
+
+class FenwickTree(object):
+    """
+    Array of numbers, which can grow at the end, with the prefix sums in O(log n)
+    """
+
+    def __init__(self, values: Iterable[int] = ()) -> None:
+        # The tree is 1-based, the node i holds the sum of the values (i - lowbit(i), i]
+        self._tree: List[int] = [0]
+        for value in values:
+            self._tree.append(value)
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def __len__(self) -> int:
+        return len(self._tree) - 1
+
+    def append(self, value: int) -> int:
+        """
+        :return: index of the appended value
+        """
+        index = len(self._tree)
+        self._tree.append(value + self.prefix_sum(index - 1) - self.prefix_sum(index - (index & -index)))
+        return index - 1
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index: int) -> int:
+        """
+        :return: sum of the values before the given index
+        """
+        result, i = 0, index
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+
+class ExecutorQueue(object):
+    """
+    Work of one executor: the cooking orders first, then the pending ones in the order they were taken
+    """
+    _COOKING, _PENDING = 0, 1
+
+    def __init__(self) -> None:
+        self._entries: Dict[int, tuple] = {}
+        self._sequence = itertools.count()
+        # The positions are computed on the first estimate after a change: the order maps to the number of
+        # the cooking orders up to it and the cooking time of the pending orders up to it
+        self._positions: Optional[Dict[int, Tuple[int, int]]] = None
+        self._cooking: List[Tuple[int, datetime]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def push(self, order_id: int, cooking_time: int, cooking_since: Optional[datetime] = None) -> None:
+        self._entries[order_id] = (self._PENDING if cooking_since is None else self._COOKING, next(self._sequence),
+                                   order_id, cooking_time, cooking_since)
+        self._positions = None
+
+    def remove(self, order_id: int) -> Tuple[int, Optional[datetime]]:
+        """
+        :return: cooking time of the removed order and since when it is cooked
+        """
+        entry = self._entries.pop(order_id)
+        self._positions = None
+        return entry[3], entry[4]
+
+    def cooking_since(self, order_id: int) -> Optional[datetime]:
+        return self._entries[order_id][4]
+
+    def get_eta(self, order_id: int, now: datetime) -> datetime:
+        if self._positions is None:
+            self._positions, self._cooking, pending = {}, [], 0
+            for state, _, queued_order_id, cooking_time, cooking_since in sorted(self._entries.values()):
+                if state == self._COOKING:
+                    self._cooking.append((cooking_time, cooking_since))
+                else:
+                    pending += cooking_time
+                self._positions[queued_order_id] = (len(self._cooking), pending)
+        cooking, pending = self._positions[order_id]
+        # Only the cooking orders depend on the time, and there are a few of them
+        ahead = sum(_remaining(cooking_time, cooking_since, now)
+                    for cooking_time, cooking_since in self._cooking[:cooking])
+        return now + timedelta(seconds=ahead + pending)
+
+
+def _remaining(cooking_time: int, cooking_since: Optional[datetime], now: datetime) -> float:
+    if cooking_since is None:
+        return cooking_time
+    return max(0.0, cooking_time - (now - cooking_since).total_seconds())
+
+
+class OrderEtaEngine(object):
+    def __init__(self, executors: Iterable[int] = ()) -> None:
+        self._lock = threading.RLock()
+        self._executors: Set[int] = set(executors)
+        self._untaken_work = FenwickTree()
+        self._untaken: Dict[int, Tuple[int, int]] = {}
+        self._queues: Dict[int, ExecutorQueue] = {}
+        self._placement: Dict[int, int] = {}
+        # Total cooking time of the taken orders and the orders being cooked, to know the backlog of the executors
+        self._taken_work: int = 0
+        self._cooking: Dict[int, Tuple[int, datetime]] = {}
+        self._ready: Dict[int, datetime] = {}
+
+    @classmethod
+    def load(cls) -> 'OrderEtaEngine':
+        """
+        Builds the model from the database
+        """
+        with use_primary():
+            engine = cls(UserRole.objects.filter(role=UserRole.UserRoleChoice.executor.name, is_confirmed=True)
+                         .values_list('user_id', flat=True))
+            untaken = list(Order.objects.filter(is_taken=False).order_by('timestamp', 'id')
+                           .values_list('id', 'cooking_time'))
+            engine._untaken_work = FenwickTree(cooking_time for _, cooking_time in untaken)
+            engine._untaken = {order_id: (index, cooking_time)
+                               for index, (order_id, cooking_time) in enumerate(untaken)}
+            for order_id, executor_id, cooking_time, status, changed_at in OrderExecution.objects \
+                    .filter(status__in=[OrderExecution.Status.pending, OrderExecution.Status.cooking,
+                                        OrderExecution.Status.finished]).order_by('id') \
+                    .values_list('order_id', 'executor_id', 'order__cooking_time', 'status', 'status_changed_at'):
+                engine.set_execution(order_id, executor_id, cooking_time, status, changed_at)
+        return engine
+
+    def add_order(self, order_id: int, cooking_time: int) -> None:
+        with self._lock:
+            if order_id not in self._untaken and order_id not in self._placement and order_id not in self._ready:
+                self._untaken[order_id] = (self._untaken_work.append(cooking_time), cooking_time)
+
+    def set_execution(self, order_id: int, executor_id: int, cooking_time: int, status: str,
+                      changed_at: Optional[datetime] = None) -> None:
+        """
+        Applies the new status of the execution of the order
+
+        :param changed_at: when the status has changed, i.e. since when the order is cooked or when it is ready
+        """
+        changed_at = changed_at or timezone.now()
+        with self._lock:
+            previous_since = None
+            if self._placement.get(order_id) == executor_id:
+                previous_since = self._queues[executor_id].cooking_since(order_id)
+            ready_at = self._ready.get(order_id, changed_at)
+            self._remove(order_id)
+
+            if status in (OrderExecution.Status.pending, OrderExecution.Status.cooking):
+                cooking_since = (previous_since or changed_at) if status == OrderExecution.Status.cooking else None
+                self._executors.add(executor_id)
+                self._queues.setdefault(executor_id, ExecutorQueue()).push(order_id, cooking_time, cooking_since)
+                self._placement[order_id] = executor_id
+                self._taken_work += cooking_time
+                if cooking_since is not None:
+                    self._cooking[order_id] = (cooking_time, cooking_since)
+            elif status == OrderExecution.Status.finished:
+                self._ready[order_id] = ready_at
+
+    def remove_orders(self, order_ids: Iterable[int]) -> None:
+        with self._lock:
+            for order_id in order_ids:
+                self._remove(order_id)
+
+    def _remove(self, order_id: int) -> None:
+        if order_id in self._untaken:
+            index, cooking_time = self._untaken.pop(order_id)
+            self._untaken_work.add(index, -cooking_time)
+            if len(self._untaken_work) > 2 * len(self._untaken) + 16:
+                self._compact_untaken()
+        if order_id in self._placement:
+            queue = self._queues[self._placement.pop(order_id)]
+            cooking_time, _ = queue.remove(order_id)
+            self._taken_work -= cooking_time
+            self._cooking.pop(order_id, None)
+        self._ready.pop(order_id, None)
+
+    def _compact_untaken(self) -> None:
+        # The slots of the removed orders outnumber the live ones, so the tree is built again from the live ones only.
+        # It happens after every n removals at most, so a removal still costs O(log n) on average
+        untaken = sorted(self._untaken.items(), key=lambda item: item[1][0])
+        self._untaken_work = FenwickTree(cooking_time for _, (_, cooking_time) in untaken)
+        self._untaken = {order_id: (index, cooking_time)
+                         for index, (order_id, (_, cooking_time)) in enumerate(untaken)}
+
+    def _backlog(self, now: datetime) -> float:
+        # Only a few orders are cooked at a time, one or so per executor
+        return self._taken_work - sum(cooking_time - _remaining(cooking_time, cooking_since, now)
+                                      for cooking_time, cooking_since in self._cooking.values())
+
+    def get_eta(self, order_id: int, now: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        :return: estimated time when the order is ready or None if the order is unknown, e.g. delivered
+        """
+        now = now or timezone.now()
+        with self._lock:
+            if order_id in self._ready:
+                return self._ready[order_id]
+            if order_id in self._placement:
+                return self._queues[self._placement[order_id]].get_eta(order_id, now)
+            if order_id in self._untaken:
+                index, cooking_time = self._untaken[order_id]
+                # The work which is in front of the order is shared by all the executors
+                ahead = self._backlog(now) + self._untaken_work.prefix_sum(index)
+                return now + timedelta(seconds=ahead / max(1, len(self._executors)) + cooking_time)
+        return None
+
+
+_engine: Optional[OrderEtaEngine] = None
+_engine_lock = threading.Lock()
+_loader: Optional[threading.Thread] = None
+# The events which are committed while the model is loaded. They are applied to it again once it is loaded
+_missed_events: Optional[List[Callable[[OrderEtaEngine], None]]] = None
+
+
+def get_engine() -> Optional[OrderEtaEngine]:
+    """
+    :return: the model or None if it is not loaded yet. The first call starts the loading
+    """
+    if _engine is None:
+        _start_loader()
+    return _engine
+
+
+def reset_engine(engine: Optional[OrderEtaEngine] = None) -> None:
+    """
+    Replaces the model, e.g. by an already loaded one. Without it, the model is loaded again on the next use
+    """
+    global _engine
+    with _engine_lock:
+        _engine = engine
+
+
+def _start_loader() -> None:
+    global _loader
+    with _engine_lock:
+        if _loader is None:
+            _loader = threading.Thread(target=_run_loader, name='order-eta-loader', daemon=True)
+            _loader.start()
+
+
+def _run_loader() -> None:
+    global _engine, _loader, _missed_events
+    try:
+        while True:
+            with _engine_lock:
+                _missed_events = []
+            engine = OrderEtaEngine.load()
+            with _engine_lock:
+                for apply in _missed_events:
+                    apply(engine)
+                _engine, _missed_events = engine, None
+            if not settings.ORDER_ETA_RELOAD_INTERVAL:
+                break
+            time.sleep(settings.ORDER_ETA_RELOAD_INTERVAL)
+    except Exception:
+        # The next use of the model starts the loading again
+        logger.exception('Order ETA model has not been loaded')
+    finally:
+        with _engine_lock:
+            _loader, _missed_events = None, None
+        connections.close_all()
+
+
+def _apply_on_commit(apply: Callable[[OrderEtaEngine], None], using: Optional[str] = None) -> None:
+    def run():
+        with _engine_lock:
+            engine = _engine
+            if _missed_events is not None:
+                _missed_events.append(apply)
+        if engine is not None:
+            apply(engine)
+
+    transaction.on_commit(run, using=using)
+
+
+def order_created(order_id: int, cooking_time: int, using: Optional[str] = None) -> None:
+    _apply_on_commit(lambda engine: engine.add_order(order_id, cooking_time), using=using)
+
+
+def execution_changed(order_id: int, executor_id: int, cooking_time: int, status: str, changed_at: datetime,
+                      using: Optional[str] = None) -> None:
+    _apply_on_commit(lambda engine: engine.set_execution(order_id, executor_id, cooking_time, status, changed_at),
+                     using=using)
+
+
+def orders_removed(order_ids: Iterable[int], using: Optional[str] = None) -> None:
+    order_ids = list(order_ids)
+    _apply_on_commit(lambda engine: engine.remove_orders(order_ids), using=using)
@@ -0,0 +1,132 @@
+import asyncio
+import json
+from typing import List
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from rest_framework.exceptions import AuthenticationFailed
+
+from orders.broadcast import get_broadcast
+from users.authentication import AuthenticationToken
+from users.models import UserRole
+from users.roles import resolve_user_role
+
+NEW_ORDERS_CHANNEL: str = 'orders'
+KEEP_ALIVE_INTERVAL: float = 15
+
+
+def order_channel(order_id: int) -> str:
+    return f'order:{order_id}'
+
+
+def user_channel(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+def _publish_on_commit(channels: List[str], message: dict, using: str = None) -> None:
+    def publish():
+        broadcast = get_broadcast()
+        for channel in channels:
+            broadcast.publish(channel, message)
+
+    transaction.on_commit(publish, using=using)
+
+
+def publish_new_order(order) -> None:
+    _publish_on_commit([NEW_ORDERS_CHANNEL], {
+        'type': 'order_created',
+        'order': order.pk,
+        'product': order.product_id,
+        'count': order.count,
+        'cooking_time': order.cooking_time,
+    }, using=order._state.db)
+
+
+def publish_order_taken(order_id: int) -> None:
+    _publish_on_commit([NEW_ORDERS_CHANNEL], {'type': 'order_taken', 'order': order_id})
+
+
+def publish_execution_status(order_id: int, user_id: int, order_execution_id: int, status: str) -> None:
+    _publish_on_commit([order_channel(order_id), user_channel(user_id)], {
+        'type': 'order_execution',
+        'order': order_id,
+        'order_execution': order_execution_id,
+        'status': status,
+    })
+
+
+def _authenticate(scope):
+    """
+    Authenticates the connection by the `Authorization: Bearer <token>` header or, because EventSource cannot send
+    headers, by the `token` query parameter
+
+    :return: the user and the channels the user may listen to
+    """
+    headers = dict(scope['headers'])
+    query = parse_qs(scope['query_string'].decode())
+    key = headers.get(b'authorization', b'').decode().partition(' ')[2] or query.get('token', [''])[0]
+    if not key:
+        raise AuthenticationFailed('Authentication credentials were not provided.')
+    user, auth = AuthenticationToken().authenticate_credentials(key)
+    if not user.is_email_confirmed:
+        raise AuthenticationFailed('Email is not confirmed.')
+
+    channels = [user_channel(user.pk)]
+    user_role = resolve_user_role(user) if not hasattr(auth, 'role') else auth.role
+    if user_role and user_role.is_confirmed and user_role.role in (UserRole.UserRoleChoice.executor.name,
+                                                                   UserRole.UserRoleChoice.administrator.name):
+        channels.append(NEW_ORDERS_CHANNEL)
+        channels += [order_channel(int(order_id)) for order_id in ','.join(query.get('orders_ids', [])).split(',')
+                     if order_id.isdigit()]
+    return user, channels
+
+
+async def _send_event(send, message: dict) -> None:
+    await send({
+        'type': 'http.response.body',
+        'body': f'event: {message["type"]}\ndata: {json.dumps(message)}\n\n'.encode(),
+        'more_body': True
+    })
+
+
+async def order_events(scope, receive, send) -> None:
+    """
+    ASGI application streaming the order events as server-sent events. Every user receives the status transitions
+    of the own orders. Executors also receive the new and taken orders and the status transitions of the orders
+    given by `orders_ids`
+    """
+    try:
+        user, channels = await sync_to_async(_authenticate)(scope)
+    except AuthenticationFailed as error:
+        await send({'type': 'http.response.start', 'status': 401,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': json.dumps({'detail': str(error.detail)}).encode()})
+        return
+
+    # Once the request body is read, the only message left to receive is the disconnect
+    while (await receive()).get('more_body'):
+        pass
+    disconnected = asyncio.ensure_future(receive())
+    subscription = get_broadcast().subscribe(channels)
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await _send_event(send, {'type': 'subscribed', 'channels': sorted(channels)})
+        while True:
+            next_message = asyncio.ensure_future(subscription.get(KEEP_ALIVE_INTERVAL))
+            done, _ = await asyncio.wait([next_message, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_message.cancel()
+                return
+            message = next_message.result()
+            if message is None:
+                await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+            else:
+                await _send_event(send, message)
+    finally:
+        subscription.close()
+        disconnected.cancel()
@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from orders.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily sales and executor rollups from the history'
+
+    def handle(self, *args, **options):
+        products, executors = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {products} product and {executors} executor rollups'))
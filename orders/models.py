@@ -1,5 +1,7 @@
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
 from products.models import Product
 from users.models import User
@@ -13,6 +15,17 @@ class Order(models.Model):
     cooking_time = models.IntegerField('cooking_time')
     timestamp = models.DateTimeField(auto_now_add=True)
     is_taken = models.BooleanField('is_taken', default=False)
+    delivery_address = models.CharField('delivery_address', max_length=100, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['user', 'timestamp', 'id']),
+            # Claiming reads only the untaken orders, which are a small part of the table
+            models.Index(fields=['timestamp', 'id'], condition=Q(is_taken=False), name='order_untaken_idx'),
+            models.Index(fields=['cooking_time', 'timestamp', 'id'], condition=Q(is_taken=False),
+                         name='order_untaken_cooking_time_idx'),
+        ]
 
     def __str__(self):
         return f'{self.product.name} for {self.user.first_name}'
@@ -28,9 +41,11 @@ class OrderExecution(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     executor = models.ForeignKey(User, on_delete=models.CASCADE)
     status = models.CharField('role', choices=Status.choices, max_length=15, blank=False)
+    status_changed_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         unique_together = ['order', 'executor']
+        indexes = [models.Index(fields=['status'])]
 
 
 class History(models.Model):
@@ -43,3 +58,38 @@ class History(models.Model):
     executor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cook')
     finish_time = models.DateTimeField()
     delivery_address = models.CharField('delivery_address', max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['user', 'timestamp', 'id']),
+            models.Index(fields=['executor', 'timestamp', 'id']),
+        ]
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField('date')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    orders_count = models.IntegerField('orders_count', default=0)
+    items_count = models.IntegerField('items_count', default=0)
+    revenue = models.FloatField('revenue', default=0)
+
+    class Meta:
+        unique_together = ['date', 'product']
+
+    def __str__(self):
+        return f'{self.date}: {self.product.name} -> {self.items_count} items, {self.revenue}'
+
+
+class DailyExecutorThroughput(models.Model):
+    date = models.DateField('date')
+    executor = models.ForeignKey(User, on_delete=models.CASCADE)
+    orders_count = models.IntegerField('orders_count', default=0)
+    items_count = models.IntegerField('items_count', default=0)
+    cooking_time = models.IntegerField('cooking_time', default=0)
+
+    class Meta:
+        unique_together = ['date', 'executor']
+
+    def __str__(self):
+        return f'{self.date}: {self.executor.email} -> {self.orders_count} orders'
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from typing import Iterable, Dict, Tuple
+
+from django.db import transaction
+from django.db.models import F, Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from orders.models import History, DailyProductSales, DailyExecutorThroughput
+
+
+def _apply(model, key_field: str, deltas: Dict[Tuple, Dict[str, float]]) -> None:
+    """
+    Adds the deltas to the rollup rows, creating the missing ones. The cost is three queries no matter how many rows
+    are changed, and the increments are done by the database, so concurrent writers do not lose updates
+    """
+    if not deltas:
+        return
+    model.objects.bulk_create([model(date=date, **{key_field: key}) for date, key in deltas],
+                              ignore_conflicts=True)
+    rows = model.objects.filter(date__in={date for date, _ in deltas},
+                                **{f'{key_field}__in': {key for _, key in deltas}})
+    fields = list(next(iter(deltas.values())))
+    changed = []
+    for row in rows:
+        delta = deltas.get((row.date, getattr(row, key_field)))
+        if delta:
+            for field in fields:
+                setattr(row, field, F(field) + delta[field])
+            changed.append(row)
+    model.objects.bulk_update(changed, fields=fields)
+
+
+def record_history(items: Iterable[History]) -> None:
+    """
+    Updates the daily rollups incrementally with the given delivered orders
+    """
+    products = defaultdict(lambda: {'orders_count': 0, 'items_count': 0, 'revenue': 0})
+    executors = defaultdict(lambda: {'orders_count': 0, 'items_count': 0, 'cooking_time': 0})
+    for item in items:
+        date = timezone.localdate(item.finish_time)
+        product = products[(date, item.product_id)]
+        product['orders_count'] += 1
+        product['items_count'] += item.count
+        product['revenue'] += item.price * item.count
+        executor = executors[(date, item.executor_id)]
+        executor['orders_count'] += 1
+        executor['items_count'] += item.count
+        executor['cooking_time'] += item.cooking_time
+
+    with transaction.atomic():
+        _apply(DailyProductSales, 'product_id', products)
+        _apply(DailyExecutorThroughput, 'executor_id', executors)
+
+
+def rebuild_rollups() -> Tuple[int, int]:
+    """
+    Recalculates all the rollups from the History table
+
+    :return: numbers of the product and of the executor rollup rows
+    """
+    history = History.objects.annotate(date=TruncDate('finish_time')).order_by()
+    products = [DailyProductSales(**row) for row in history.values('date', 'product_id').annotate(
+        orders_count=Count('id'),
+        items_count=Sum('count'),
+        revenue=Sum(F('price') * F('count'))
+    )]
+    executors = [DailyExecutorThroughput(**row) for row in history.values('date', 'executor_id').annotate(
+        orders_count=Count('id'),
+        items_count=Sum('count'),
+        cooking_time=Sum('cooking_time')
+    )]
+    with transaction.atomic():
+        DailyProductSales.objects.all().delete()
+        DailyExecutorThroughput.objects.all().delete()
+        DailyProductSales.objects.bulk_create(products, batch_size=1000)
+        DailyExecutorThroughput.objects.bulk_create(executors, batch_size=1000)
+    return len(products), len(executors)
@@ -1,9 +1,27 @@
 from rest_framework import serializers
 
+from orders.eta import get_engine
 from orders.models import Order, OrderExecution, History
 
 
+class EtaField(serializers.Field):
+    """
+    Estimated ready time of the order. It is read from the primary key, so it is available from the values too
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(source='pk', read_only=True, **kwargs)
+
+    def to_representation(self, value):
+        # The estimates are not available until the model is loaded
+        engine = get_engine()
+        eta = engine.get_eta(value) if engine is not None else None
+        return None if eta is None else serializers.DateTimeField().to_representation(eta)
+
+
 class OrderSerializer(serializers.ModelSerializer):
+    eta = EtaField()
+
     class Meta:
         model = Order
         fields = '__all__'
@@ -19,3 +37,17 @@ class HistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = History
         fields = '__all__'
+
+
+class CheckoutLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    lines = CheckoutLineSerializer(many=True, allow_empty=False)
+    delivery_address = serializers.CharField(max_length=100, allow_blank=True, default='')
+
+
+class DeliverSerializer(serializers.Serializer):
+    order_executions = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from orders import events, eta
+from orders.models import Order, OrderExecution
+
+
+@receiver(post_save, sender=Order)
+def publish_new_order(sender, instance: Order, created: bool, **kwargs):
+    if created:
+        events.publish_new_order(instance)
+        if not instance.is_taken:
+            eta.order_created(instance.pk, instance.cooking_time, using=kwargs['using'])
+
+
+@receiver(post_save, sender=OrderExecution)
+def publish_execution_status(sender, instance: OrderExecution, created: bool, **kwargs):
+    if created:
+        events.publish_order_taken(instance.order_id)
+    events.publish_execution_status(instance.order_id, instance.order.user_id, instance.pk, instance.status)
+    eta.execution_changed(instance.order_id, instance.executor_id, instance.order.cooking_time, instance.status,
+                          instance.status_changed_at, using=kwargs['using'])
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderExecution)
+def remove_order_from_eta(sender, instance, **kwargs):
+    eta.orders_removed([instance.order_id if sender is OrderExecution else instance.pk], using=kwargs['using'])
@@ -1,3 +1,691 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from orders import eta
+from orders.broadcast import get_broadcast
+from orders.delivery import deliver_order_executions
+from orders.events import order_events, NEW_ORDERS_CHANNEL, order_channel, user_channel
+from orders.models import Order, History, OrderExecution, DailyProductSales, DailyExecutorThroughput
+from products.models import Product, Availability
+from users.models import User, UserRole
+from utils.tests import ApiTestCase, ApiTransactionTestCase
+
+
+class OrderTestCase(ApiTestCase):
+    @ApiTestCase.Decorators.create_default_user_and_log_in()
+    def test_create_order(self):
+        p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        Availability.objects.create(product=p, available=3)
+
+        response = self.client.post('/orders/', {'product': p.pk, 'count': 2})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        availability = Availability.objects.get(product=p)
+        self.assertEqual(availability.available, 1)
+        self.assertTrue(availability.is_available)
+
+        response = self.client.post('/orders/', {'product': p.pk, 'count': 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        availability.refresh_from_db()
+        self.assertEqual(availability.available, 0)
+        self.assertFalse(availability.is_available)
+        self.assertEqual(Order.objects.all().count(), 2)
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in()
+    def test_create_order_more_than_available(self):
+        p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        Availability.objects.create(product=p, available=3)
+
+        response = self.client.post('/orders/', {'product': p.pk, 'count': 4})
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertEqual(Availability.objects.get(product=p).available, 3)
+        self.assertEqual(Order.objects.all().count(), 0)
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in()
+    def test_checkout(self):
+        p1 = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        p2 = Product.objects.create(name='Product Two', description='Description', price=2.5, cooking_time=1600)
+        Availability.objects.create(product=p1, available=3)
+        Availability.objects.create(product=p2, available=1)
+
+        response = self.client.post('/orders/checkout/', {'lines': [{'product': p1.pk, 'count': 2},
+                                                                    {'product': p2.pk, 'count': 1}]})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([(order['product'], order['count'], order['price']) for order in response.data],
+                         [(p1.pk, 2, 1.25), (p2.pk, 1, 2.5)])
+        self.assertEqual([order['id'] for order in response.data],
+                         list(Order.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(Availability.objects.get(product=p1).available, 1)
+        self.assertFalse(Availability.objects.get(product=p2).is_available)
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in()
+    def test_checkout_is_atomic(self):
+        p1 = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        p2 = Product.objects.create(name='Product Two', description='Description', price=2.5, cooking_time=1600)
+        Availability.objects.create(product=p1, available=3)
+        Availability.objects.create(product=p2, available=1)
+
+        response = self.client.post('/orders/checkout/', {'lines': [{'product': p1.pk, 'count': 2},
+                                                                    {'product': p2.pk, 'count': 2}]})
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertEqual(response.data['line'], 1)
+        self.assertEqual(Order.objects.all().count(), 0)
+        self.assertEqual(Availability.objects.get(product=p1).available, 3)
+        self.assertEqual(Availability.objects.get(product=p2).available, 1)
+
+        response = self.client.post('/orders/checkout/', {'lines': [{'product': p1.pk, 'count': 2},
+                                                                    {'product': p1.pk, 'count': 2}]})
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertEqual(response.data['line'], 1)
+        self.assertEqual(Order.objects.all().count(), 0)
+        self.assertEqual(Availability.objects.get(product=p1).available, 3)
+
+        response = self.client.post('/orders/checkout/', {'lines': [{'product': p1.pk, 'count': 1},
+                                                                    {'product': 0, 'count': 1}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['line'], 1)
+
+
+class OrderListTestCase(ApiTestCase):
+    @ApiTestCase.Decorators.create_default_user_and_log_in(get_user=True)
+    def test_get_orders_cursor_pagination(self, user: User):
+        p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        orders = [Order.objects.create(product=p, user=user, count=1, price=1.25, cooking_time=3600)
+                  for _ in range(15)]
+
+        # Orders with the same timestamp are paged by the id
+        Order.objects.filter(pk__in=[order.pk for order in orders[5:12]]).update(timestamp=orders[5].timestamp)
+
+        response = self.client.get('/orders/?mine=true&pagination=cursor&size=4')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pages = [[order['id'] for order in response.data['results']]]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append([order['id'] for order in response.data['results']])
+        self.assertEqual(sum(pages, []), [order.pk for order in reversed(orders)])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([order['id'] for order in response.data['results']], pages[-2])
+
+        response = self.client.get('/orders/?mine=true&pagination=cursor&size=10&ordering=timestamp')
+        response = self.client.get(response.data['next'])
+        self.assertEqual([order['id'] for order in response.data['results']], [order.pk for order in orders[10:]])
+
+        # The page number pagination lists the oldest first, as before the cursor pagination
+        response = self.client.get('/orders/?mine=true&size=15')
+        self.assertEqual([order['id'] for order in response.data['results']], [order.pk for order in orders])
+
+
+class HistoryTestCase(ApiTestCase):
+    def _create_history(self, size: int, user: User) -> list:
+        p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        items = [History.objects.create(product=p, user=user, count=1, price=1.25, cooking_time=3600, executor=user,
+                                        finish_time=timezone.now(), delivery_address='Address')
+                 for _ in range(size)]
+        # Items with the same timestamp have to be ordered by id
+        History.objects.filter(pk__in=[item.pk for item in items[:5]]).update(timestamp=timezone.now() - timedelta(1))
+        return items
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(get_user=True)
+    def test_get_history_cursor_pagination(self, user: User):
+        items = self._create_history(25, user)
+        expected_ids = [item.pk for item in items[5:][::-1] + items[:5][::-1]]
+
+        ids = []
+        response = self.client.get('/orders/history/?pagination=cursor&size=10')
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids += [item['id'] for item in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, expected_ids)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], expected_ids[10:20])
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(get_user=True)
+    def test_get_history_page_pagination(self, user: User):
+        self._create_history(15, user)
+
+        response = self.client.get('/orders/history/?mine=true&page=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 15)
+        self.assertEqual(len(response.data['results']), 5)
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(get_user=True)
+    def test_history_output_is_same_as_serializer(self, user: User):
+        self._create_history(15, user)
+
+        for path in ('/orders/history/?pagination=cursor&size=10', '/orders/history/?mine=true&page=2'):
+            fast_response = self.client.get(path)
+            with mock.patch('foody.readers.get_values_reader', return_value=None):
+                response = self.client.get(path)
+            self.assertEqual(fast_response.content, response.content)
+
+
+class SalesStatsTestCase(ApiTestCase):
+    def _deliver_order(self, product: Product, count: int):
+        order = Order.objects.create(product=product, user=self.user, count=count, price=product.price,
+                                     cooking_time=product.cooking_time)
+        response = self.client.post('/orders/execution/', {'order': order.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.patch(f'/orders/execution/{response.data["id"]}/', {'status': 'delivered'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.administrator)
+        self.p1 = Product.objects.create(name='Product One', description='Description', price=1.5, cooking_time=60)
+        self.p2 = Product.objects.create(name='Product Two', description='Description', price=2, cooking_time=30)
+
+    def test_delivered_orders_update_rollups(self):
+        self._deliver_order(self.p1, 2)
+        self._deliver_order(self.p1, 1)
+        self._deliver_order(self.p2, 1)
+
+        today = timezone.localdate()
+        p1_sales = DailyProductSales.objects.get(date=today, product=self.p1)
+        self.assertEqual((p1_sales.orders_count, p1_sales.items_count, p1_sales.revenue), (2, 3, 4.5))
+        throughput = DailyExecutorThroughput.objects.get(date=today, executor=self.user)
+        self.assertEqual((throughput.orders_count, throughput.items_count, throughput.cooking_time), (3, 4, 150))
+
+        response = self.client.get(f'/orders/stats/?date_from={today}&date_to={today}&product={self.p2.pk}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['products']), 1)
+        self.assertEqual(response.data['products'][0]['revenue'], 2)
+        self.assertEqual(response.data['executors'][0]['orders_count'], 3)
+
+        response = self.client.get(f'/orders/stats/?date_from={today + timedelta(1)}')
+        self.assertEqual(response.data['products'], [])
+
+    def test_rebuild_rollups(self):
+        self._deliver_order(self.p1, 2)
+        self._deliver_order(self.p2, 1)
+        DailyProductSales.objects.all().delete()
+        DailyExecutorThroughput.objects.update(orders_count=0)
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+
+        self.assertEqual(DailyProductSales.objects.get(product=self.p1).revenue, 3)
+        self.assertEqual(DailyExecutorThroughput.objects.get(executor=self.user).orders_count, 2)
+
+    def test_stats_are_for_administrators_only(self):
+        user = self._create_user_model(email='executor@email.com', is_email_confirmed=True)
+        UserRole.objects.create(user=user, role=UserRole.UserRoleChoice.executor.name, is_confirmed=True)
+        self._login(user)
+        self.assertEqual(self.client.get('/orders/stats/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stats_reject_invalid_parameters(self):
+        for query in ('date_from=2026-13-45', 'date_to=yesterday', 'product=one', 'executor=1.5'):
+            self.assertEqual(self.client.get(f'/orders/stats/?{query}').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderExecutionTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.executor)
+        self.p1 = Product.objects.create(name='Product One', description='Description', price=1.5, cooking_time=60)
+        self.p2 = Product.objects.create(name='Product Two', description='Description', price=2, cooking_time=30)
+
+    def _create_order(self, product: Product) -> Order:
+        return Order.objects.create(product=product, user=self.user, count=1, price=product.price,
+                                    cooking_time=product.cooking_time)
+
+    def test_claim_next_order(self):
+        first, second = self._create_order(self.p1), self._create_order(self.p2)
+
+        response = self.client.post('/orders/execution/claim-next/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['order'], first.pk)
+        self.assertEqual(response.data['executor'], self.user.pk)
+        self.assertEqual(response.data['status'], OrderExecution.Status.pending)
+        first.refresh_from_db()
+        self.assertTrue(first.is_taken)
+
+        self.assertEqual(self.client.post('/orders/execution/claim-next/').data['order'], second.pk)
+        response = self.client.post('/orders/execution/claim-next/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_claim_next_shortest_order(self):
+        self._create_order(self.p1)
+        shortest = self._create_order(self.p2)
+
+        response = self.client.post('/orders/execution/claim-next/?strategy=shortest')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['order'], shortest.pk)
+
+    def test_take_order_twice(self):
+        order = self._create_order(self.p1)
+
+        response = self.client.post('/orders/execution/', {'order': order.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/orders/execution/', {'order': order.pk})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(OrderExecution.objects.all().count(), 1)
+
+    def _create_order_executions(self, count: int) -> list:
+        orders = [Order.objects.create(product=self.p1 if i % 2 else self.p2, user=self.user, count=2,
+                                       price=1.5, cooking_time=60, is_taken=True, delivery_address=f'Street {i}')
+                  for i in range(count)]
+        return [OrderExecution.objects.create(order=order, executor=self.user, status=OrderExecution.Status.finished)
+                .pk for order in orders]
+
+    def _deliver(self, order_execution_ids: list):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/orders/execution/deliver/', {'order_executions': order_execution_ids},
+                                    format='json')
+
+    def test_deliver(self):
+        order_execution_ids = self._create_order_executions(3)
+        with mock.patch('orders.delivery.publish_execution_status') as publish_execution_status:
+            response = self._deliver(order_execution_ids)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['delivery_address'] for item in response.data], ['Street 0', 'Street 1', 'Street 2'])
+        self.assertTrue(all(item['id'] for item in response.data))
+        self.assertEqual(History.objects.count(), 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderExecution.objects.exists())
+        self.assertEqual(DailyExecutorThroughput.objects.get(executor=self.user).items_count, 6)
+        self.assertEqual(publish_execution_status.call_count, 3)
+        publish_execution_status.assert_called_with(mock.ANY, self.user.pk, order_execution_ids[-1],
+                                                    OrderExecution.Status.delivered)
+
+    def test_deliver_cost_is_constant(self):
+        small, large = self._create_order_executions(2), self._create_order_executions(20)
+        # The first request also looks up the role of the user, which is cached then
+        self._deliver(self._create_order_executions(1))
+        with CaptureQueriesContext(connection) as small_queries:
+            self.assertEqual(self._deliver(small).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as large_queries:
+            self.assertEqual(self._deliver(large).status_code, status.HTTP_200_OK)
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertEqual(History.objects.count(), 23)
+
+    def test_deliver_missing_execution(self):
+        order_execution_ids = self._create_order_executions(2)
+
+        response = self._deliver(order_execution_ids + [0])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['order_executions'], [0])
+        self.assertEqual(OrderExecution.objects.count(), 2)
+        self.assertFalse(History.objects.exists())
+
+    def test_deliver_by_update_after_concurrent_delivery(self):
+        order_execution_id, = self._create_order_executions(1)
+
+        def deliver_twice(ids):
+            # The concurrent request delivers the execution after this one has read it
+            deliver_order_executions(ids)
+            return deliver_order_executions(ids)
+
+        with mock.patch('orders.views.deliver_order_executions', side_effect=deliver_twice):
+            response = self.client.patch(f'/orders/execution/{order_execution_id}/', {'status': 'delivered'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(History.objects.count(), 1)
+
+    def test_checkout_delivery_address(self):
+        Availability.objects.create(product=self.p1, available=5)
+        response = self.client.post('/orders/checkout/', {'lines': [{'product': self.p1.pk, 'count': 1}],
+                                                          'delivery_address': 'Main Street 1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data[0]['delivery_address'], 'Main Street 1')
+
+
+class OrderEventsTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.executor)
+        self.product = Product.objects.create(name='Product One', description='Description', price=1, cooking_time=60)
+        Availability.objects.create(product=self.product, available=10)
+
+    @staticmethod
+    def _collect(channels: list, action) -> list:
+        async def collect():
+            subscription = get_broadcast().subscribe(channels)
+            try:
+                await sync_to_async(action)()
+                messages = []
+                while True:
+                    message = await subscription.get(0.1)
+                    if message is None:
+                        return messages
+                    messages.append(message)
+            finally:
+                subscription.close()
+
+        return async_to_sync(collect)()
+
+    def test_order_events_are_published(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            order_id = self.client.post('/orders/', {'product': self.product.pk, 'count': 1}).data['id']
+            order_execution_id = self.client.post('/orders/execution/', {'order': order_id}).data['id']
+            self.client.patch(f'/orders/execution/{order_execution_id}/', {'status': 'delivered'})
+
+        def run_callbacks():
+            for callback in callbacks:
+                callback()
+
+        messages = self._collect([NEW_ORDERS_CHANNEL, user_channel(self.user.pk)], run_callbacks)
+        self.assertEqual([(m['type'], m.get('status')) for m in messages], [
+            ('order_created', None),
+            ('order_taken', None),
+            ('order_execution', OrderExecution.Status.pending),
+            ('order_execution', OrderExecution.Status.delivered),
+        ])
+        self.assertTrue(all(m['order'] == order_id for m in messages))
+
+    def test_execution_signals_do_not_load_the_order(self):
+        order_lookup = 'FROM "orders_order" WHERE "orders_order"."id" ='
+        self.client.post('/orders/', {'product': self.product.pk, 'count': 1})
+        with CaptureQueriesContext(connection) as queries:
+            order_execution_id = self.client.post('/orders/execution/claim-next/').data['id']
+            self.client.patch(f'/orders/execution/{order_execution_id}/', {'status': 'cooking'})
+        self.assertFalse([query['sql'] for query in queries if order_lookup in query['sql']])
+
+    def test_checkout_publishes_new_orders(self):
+        with mock.patch('orders.views.connection.features.can_return_rows_from_bulk_insert', True), \
+                mock.patch('orders.views.events.publish_new_order') as publish_new_order, \
+                mock.patch('orders.models.Order.objects.bulk_create') as bulk_create:
+            self.client.post('/orders/checkout/', {'lines': [{'product': self.product.pk, 'count': 1},
+                                                             {'product': self.product.pk, 'count': 2}]},
+                             format='json')
+        self.assertEqual(bulk_create.call_count, 1)
+        self.assertEqual([call.args[0].count for call in publish_new_order.call_args_list], [1, 2])
+
+    def test_events_stream(self):
+        token = self._get_token(self.user)
+        order = Order.objects.create(product=self.product, user=self.user, count=1, price=1, cooking_time=60)
+        scope = {'type': 'http', 'path': '/events/orders/', 'headers': [(b'authorization', f'Bearer {token}'.encode())],
+                 'query_string': f'orders_ids={order.pk}'.encode()}
+        sent = []
+
+        async def stream():
+            disconnect = asyncio.Event()
+            requests = iter([{'type': 'http.request', 'body': b'', 'more_body': False}])
+
+            async def receive():
+                message = next(requests, None)
+                if message is None:
+                    await disconnect.wait()
+                    return {'type': 'http.disconnect'}
+                return message
+
+            async def send(message):
+                sent.append(message)
+                if b'subscribed' in message.get('body', b''):
+                    get_broadcast().publish(order_channel(order.pk), {'type': 'order_execution', 'order': order.pk})
+                elif b'order_execution' in message.get('body', b''):
+                    disconnect.set()
+
+            await asyncio.wait_for(order_events(scope, receive, send), 5)
+
+        async_to_sync(stream)()
+        self.assertEqual(sent[0]['status'], status.HTTP_200_OK)
+        events = [message['body'].decode().split('\n') for message in sent[1:]]
+        self.assertEqual(events[0][0], 'event: subscribed')
+        self.assertEqual(set(json.loads(events[0][1][len('data: '):])['channels']),
+                         {NEW_ORDERS_CHANNEL, user_channel(self.user.pk), order_channel(order.pk)})
+        self.assertEqual(events[1][0], 'event: order_execution')
+
+    def test_events_stream_unauthorized(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async_to_sync(order_events)({'type': 'http', 'path': '/events/orders/', 'headers': [],
+                                     'query_string': b'token=invalid'}, None, send)
+        self.assertEqual(sent[0]['status'], status.HTTP_401_UNAUTHORIZED)
+
+
+class OrderEtaTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.now = timezone.now()
+        self.user = self._create_default_user_and_log_in()
+        self.p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=60)
+
+    def _create_orders(self, *cooking_times: int) -> list:
+        return [Order.objects.create(product=self.p, user=self.user, count=1, price=1.25, cooking_time=cooking_time)
+                for cooking_time in cooking_times]
+
+    def _create_executor(self, email: str) -> User:
+        executor = self._create_user_model(email=email, is_email_confirmed=True)
+        UserRole.objects.create(user=executor, role=UserRole.UserRoleChoice.executor.name, is_confirmed=True)
+        return executor
+
+    def test_fenwick_tree(self):
+        tree = eta.FenwickTree([3, 1, 4])
+        for value in (1, 5, 9, 2, 6):
+            tree.append(value)
+        tree.add(2, -4)
+        self.assertEqual(len(tree), 8)
+        self.assertEqual([tree.prefix_sum(i) for i in range(9)], [0, 3, 4, 4, 5, 10, 19, 21, 27])
+
+    def test_untaken_orders_share_executors(self):
+        self._create_executor('executor1@foody.local')
+        self._create_executor('executor2@foody.local')
+        o1, o2, o3 = self._create_orders(60, 120, 30)
+
+        engine = eta.OrderEtaEngine.load()
+        self.assertEqual(engine.get_eta(o1.pk, self.now), self.now + timedelta(seconds=60))
+        self.assertEqual(engine.get_eta(o2.pk, self.now), self.now + timedelta(seconds=30 + 120))
+        self.assertEqual(engine.get_eta(o3.pk, self.now), self.now + timedelta(seconds=90 + 30))
+        self.assertIsNone(engine.get_eta(0, self.now))
+
+    def test_taken_orders_queue_behind_executor(self):
+        executor = self._create_executor('executor@foody.local')
+        o1, o2, o3 = self._create_orders(60, 120, 30)
+        engine = eta.OrderEtaEngine.load()
+
+        engine.set_execution(o2.pk, executor.pk, 120, OrderExecution.Status.pending, self.now)
+        engine.set_execution(o1.pk, executor.pk, 60, OrderExecution.Status.cooking, self.now)
+        later = self.now + timedelta(seconds=20)
+        self.assertEqual(engine.get_eta(o1.pk, later), self.now + timedelta(seconds=60))
+        self.assertEqual(engine.get_eta(o2.pk, later), self.now + timedelta(seconds=180))
+        # The untaken order waits until the taken ones are cooked
+        self.assertEqual(engine.get_eta(o3.pk, later), self.now + timedelta(seconds=210))
+
+        engine.set_execution(o1.pk, executor.pk, 60, OrderExecution.Status.finished, later)
+        self.assertEqual(engine.get_eta(o1.pk, later), later)
+        engine.remove_orders([o1.pk, o2.pk])
+        self.assertIsNone(engine.get_eta(o1.pk, later))
+        self.assertEqual(engine.get_eta(o3.pk, later), later + timedelta(seconds=30))
+
+    def test_untaken_orders_are_compacted(self):
+        self._create_executor('executor@foody.local')
+        engine = eta.OrderEtaEngine.load()
+        for order_id in range(1, 101):
+            engine.add_order(order_id, 10)
+        engine.remove_orders(range(1, 91))
+        self.assertLessEqual(len(engine._untaken_work), 2 * 10 + 16)
+        self.assertEqual(engine.get_eta(91, self.now), self.now + timedelta(seconds=10))
+        self.assertEqual(engine.get_eta(100, self.now), self.now + timedelta(seconds=100))
+
+    def test_engine_follows_order_events(self):
+        executor = self._create_executor('executor@foody.local')
+        engine = eta.get_engine()
+        with self.captureOnCommitCallbacks(execute=True):
+            order, = self._create_orders(60)
+        self.assertIsNotNone(engine.get_eta(order.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            execution = OrderExecution.objects.create(order=order, executor=executor,
+                                                      status=OrderExecution.Status.cooking)
+        self.assertIn(order.pk, engine._placement)
+        with self.captureOnCommitCallbacks(execute=True):
+            execution.delete()
+            order.delete()
+        self.assertIsNone(engine.get_eta(order.pk))
+        self.assertIs(eta.get_engine(), engine)
+
+    def test_load_keeps_status_times(self):
+        executor = self._create_executor('executor@foody.local')
+        o1, o2 = self._create_orders(60, 30)
+        OrderExecution.objects.create(order=o1, executor=executor, status=OrderExecution.Status.cooking,
+                                      status_changed_at=self.now - timedelta(seconds=20))
+        OrderExecution.objects.create(order=o2, executor=executor, status=OrderExecution.Status.finished,
+                                      status_changed_at=self.now - timedelta(seconds=5))
+
+        engine = eta.OrderEtaEngine.load()
+        self.assertEqual(engine.get_eta(o1.pk, self.now), self.now + timedelta(seconds=40))
+        self.assertEqual(engine.get_eta(o2.pk, self.now), self.now - timedelta(seconds=5))
+
+    def test_status_update_sets_status_changed_at(self):
+        executor = self._create_executor('executor@foody.local')
+        self._login(executor)
+        order, = self._create_orders(60)
+        changed_at = self.now - timedelta(minutes=5)
+        execution = OrderExecution.objects.create(order=order, executor=executor, status=OrderExecution.Status.pending,
+                                                  status_changed_at=changed_at)
+
+        response = self.client.patch(f'/orders/execution/{execution.pk}/', {'status': 'pending'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        execution.refresh_from_db()
+        self.assertEqual(execution.status_changed_at, changed_at)
+        response = self.client.patch(f'/orders/execution/{execution.pk}/', {'status': 'cooking'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        execution.refresh_from_db()
+        self.assertGreater(execution.status_changed_at, changed_at)
+
+    def test_get_eta(self):
+        self._create_executor('executor@foody.local')
+        o1, o2 = self._create_orders(60, 30)
+        eta.reset_engine(eta.OrderEtaEngine.load())
+
+        with mock.patch('orders.eta.timezone.now', return_value=self.now):
+            response = self.client.get(f'/orders/eta/?ids={o2.pk}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([item['order'] for item in response.data], [o2.pk])
+            self.assertEqual(parse_datetime(response.data[0]['eta']), self.now + timedelta(seconds=90))
+
+            fast_response = self.client.get('/orders/?mine=true')
+            with mock.patch('foody.readers.get_values_reader', return_value=None):
+                response = self.client.get('/orders/?mine=true')
+        self.assertEqual(fast_response.content, response.content)
+        self.assertEqual(len([order['eta'] for order in fast_response.data['results'] if order['eta']]), 2)
+
+
+class IndexUsageTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.executor)
+        self.product = Product.objects.create(name='Product', description='Description', price=1, cooking_time=60)
+        Availability.objects.create(product=self.product, available=100)
+
+    def test_order_queries_use_indexes(self):
+        with self.assertQueriesUseIndexes():
+            self.client.post('/orders/', {'product': self.product.pk, 'count': 1})
+            self.client.get('/orders/?mine=true&pagination=cursor')
+            self.client.get('/orders/?mine=true')
+            self.client.post('/orders/execution/claim-next/')
+            self.client.post('/orders/execution/claim-next/?strategy=shortest')
+            self.client.get('/orders/current_order_execution')
+            self.client.get('/orders/history/?mine=true&pagination=cursor')
+
+    def test_history_queries_use_indexes(self):
+        self.assertNoFullTableScan(History.objects.filter(user=self.user).order_by('-timestamp', '-id'))
+        self.assertNoFullTableScan(History.objects.filter(executor=self.user).order_by('-timestamp', '-id'))
+        self.assertNoFullTableScan(Order.objects.filter(is_taken=False).order_by('cooking_time', 'timestamp', 'id'))
+
+
+class OrderEtaLoadingTestCase(ApiTransactionTestCase):
+    # The loader ends after the first load instead of rebuilding the model later
+    @override_settings(ORDER_ETA_RELOAD_INTERVAL=0)
+    def test_engine_is_loaded_in_background(self):
+        user = self._create_default_user_and_log_in()
+        p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=60)
+        order = Order.objects.create(product=p, user=user, count=1, price=1.25, cooking_time=60)
+        eta.reset_engine()
+        loading = threading.Event()
+        load = eta.OrderEtaEngine.load
+
+        def wait_and_load():
+            loading.wait(timeout=10)
+            return load()
+
+        with mock.patch('orders.eta.OrderEtaEngine.load', side_effect=wait_and_load):
+            # The request does not wait for the model
+            self.assertIsNone(self.client.get('/orders/eta/').data[0]['eta'])
+            loader = eta._loader
+            loading.set()
+            loader.join(timeout=10)
+        self.assertIsNotNone(eta.get_engine().get_eta(order.pk))
+        self.assertIsNotNone(self.client.get('/orders/eta/').data[0]['eta'])
+
+
+class ConcurrentOrderTestCase(ApiTransactionTestCase):
+    def test_concurrent_orders_do_not_oversell(self):
+        user = self._create_default_user_and_log_in()
+        token = self._get_token(user)
+        p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        Availability.objects.create(product=p, available=25)
+
+        def create_order(count: int) -> int:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            try:
+                return client.post('/orders/', {'product': p.pk, 'count': count}).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            status_codes = list(executor.map(create_order, [1, 2] * 20))
+
+        availability = Availability.objects.get(product=p)
+        ordered = sum(order.count for order in Order.objects.filter(product=p))
+        self.assertGreaterEqual(availability.available, 0)
+        self.assertEqual(availability.available + ordered, 25)
+        self.assertEqual(status_codes.count(status.HTTP_201_CREATED), Order.objects.all().count())
+        self.assertEqual(availability.is_available, availability.available > 0)
+
+
+class ConcurrentClaimTestCase(ApiTransactionTestCase):
+    def test_concurrent_claims_never_take_the_same_order(self):
+        client = self._create_default_user_and_log_in()
+        p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        orders = [Order.objects.create(product=p, user=client, count=1, price=1.25, cooking_time=3600)
+                  for _ in range(30)]
+        tokens = []
+        for i in range(6):
+            executor = self._create_user_model(email=f'executor{i}@email.com', is_email_confirmed=True)
+            UserRole.objects.create(user=executor, role=UserRole.UserRoleChoice.executor.name, is_confirmed=True)
+            tokens.append(self._get_token(executor))
+
+        def claim_until_empty(token: str) -> list:
+            api_client = APIClient()
+            api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            claimed = []
+            try:
+                while True:
+                    response = api_client.post('/orders/execution/claim-next/')
+                    if response.status_code == status.HTTP_404_NOT_FOUND:
+                        return claimed
+                    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                    claimed.append(response.data['order'])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(tokens)) as executor:
+            claimed = [order for orders_of_executor in executor.map(claim_until_empty, tokens)
+                       for order in orders_of_executor]
+
+        self.assertEqual(sorted(claimed), [order.pk for order in orders])
+        self.assertEqual(OrderExecution.objects.all().count(), len(orders))
+        self.assertFalse(Order.objects.filter(is_taken=False).exists())
@@ -1,13 +1,17 @@
 from django.urls import path
 from rest_framework import routers
 
-from orders.views import OrderView, OrderExecutionView, get_current_order_execution, HistoryView
+from orders.views import OrderView, OrderExecutionView, get_current_order_execution, HistoryView, SalesStatsView, \
+    OrderEtaView
 
 router = routers.SimpleRouter()
 router.register('history', HistoryView)
 router.register('execution', OrderExecutionView)
 router.register('', OrderView)
 
-urlpatterns = router.urls + [
+urlpatterns = [
+    path('stats/', SalesStatsView.as_view()),
+    path('eta/', OrderEtaView.as_view()),
+] + router.urls + [
     path('current_order_execution', get_current_order_execution),
 ]
@@ -1,18 +1,25 @@
-from datetime import datetime
-
+from django.db import transaction, connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.utils import swagger_auto_schema, no_body
 from rest_framework import mixins, status, viewsets
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.exceptions import NotAcceptable
+from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.exceptions import NotAcceptable, NotFound
 from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
-from orders.models import Order, OrderExecution, History
-from orders.serializers import OrderSerializer, OrderExecutionSerializer, HistorySerializer
-from foody.permissions import IsAuthenticatedAndConfirmed, IsExecutor
+from orders import eta, events
+from orders.delivery import deliver_order_executions, OrderExecutionsNotFound
+from orders.models import Order, OrderExecution, History, DailyProductSales, DailyExecutorThroughput
+from orders.serializers import OrderSerializer, OrderExecutionSerializer, HistorySerializer, CheckoutSerializer, \
+    DeliverSerializer, EtaField
+from foody.pagination import CursorPaginationMixin
+from foody.permissions import IsAuthenticatedAndConfirmed, IsExecutor, IsStrictAdministrator
+from foody.readers import ValuesListMixin
 from products.models import Product, Availability
 
 
@@ -26,20 +33,25 @@ def get_current_order_execution(request):
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class OrderView(mixins.CreateModelMixin,
+class OrderView(CursorPaginationMixin,
+                ValuesListMixin,
+                mixins.CreateModelMixin,
                 mixins.RetrieveModelMixin,
                 mixins.ListModelMixin,
                 GenericViewSet):
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
     permission_classes = [IsAuthenticatedAndConfirmed]
-    filter_backends = (OrderingFilter,DjangoFilterBackend)
+    filter_backends = (OrderingFilter, DjangoFilterBackend)
     ordering_fields = ('timestamp',)
+    # The page number pagination keeps the oldest first order, the cursor pagination has its own newest first one
+    ordering = ('timestamp', 'id')
     filterset_fields = ['is_taken']
 
     @swagger_auto_schema(request_body=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
         'product': openapi.Schema(type=openapi.TYPE_INTEGER),
-        'count': openapi.Schema(type=openapi.TYPE_INTEGER)
+        'count': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'delivery_address': openapi.Schema(type=openapi.TYPE_STRING)
     }))
     def create(self, request, *args, **kwargs):
         try:
@@ -53,81 +65,173 @@ class OrderView(mixins.CreateModelMixin,
         return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        availability = Availability.objects.get(product=serializer.validated_data['product'])
-        if serializer.validated_data['count'] > availability.available:
-            raise NotAcceptable(detail='You requested more than it exists')
-        availability.available -= serializer.validated_data['count']
-        availability.is_available = bool(availability.available)
-        availability.save()
-        super().perform_create(serializer)
+        with transaction.atomic():
+            if not Availability.objects.reserve(serializer.validated_data['product'].pk,
+                                                serializer.validated_data['count']):
+                raise NotAcceptable(detail='You requested more than it exists')
+            super().perform_create(serializer)
+
+    @swagger_auto_schema(request_body=CheckoutSerializer, responses={
+        status.HTTP_201_CREATED: OrderSerializer(many=True),
+        status.HTTP_406_NOT_ACCEPTABLE: 'One of the lines requested more than it exists'
+    })
+    @action(methods=['POST'], detail=False)
+    def checkout(self, request):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.validated_data['lines']
+
+        products = Product.objects.in_bulk({line['product'] for line in lines})
+        available = dict(Availability.objects.filter(product_id__in=products.keys())
+                         .values_list('product_id', 'available'))
+        for index, line in enumerate(lines):
+            if line['product'] not in products:
+                return Response({'line': index, 'detail': f'Product with pk: {line["product"]} not found'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if line['count'] > available.get(line['product'], 0):
+                return Response({'line': index, 'detail': 'You requested more than it exists'},
+                                status=status.HTTP_406_NOT_ACCEPTABLE)
+
+        with transaction.atomic():
+            for index, line in enumerate(lines):
+                if not Availability.objects.reserve(line['product'], line['count']):
+                    transaction.set_rollback(True)
+                    return Response({'line': index, 'detail': 'You requested more than it exists'},
+                                    status=status.HTTP_406_NOT_ACCEPTABLE)
+            orders = [Order(product=products[line['product']],
+                            user=request.user,
+                            count=line['count'],
+                            price=products[line['product']].price,
+                            cooking_time=products[line['product']].cooking_time,
+                            delivery_address=serializer.validated_data['delivery_address'])
+                      for line in lines]
+            if connection.features.can_return_rows_from_bulk_insert:
+                Order.objects.bulk_create(orders)
+                # Bulk create does not send the signals
+                for order in orders:
+                    events.publish_new_order(order)
+                    eta.order_created(order.pk, order.cooking_time)
+            else:
+                # The primary keys of bulk created rows are not known on this backend, and reading the rows back
+                # could return the orders of a concurrent checkout, so the orders are saved one by one
+                for order in orders:
+                    order.save()
+        return Response(OrderSerializer(orders, many=True).data, status=status.HTTP_201_CREATED)
+
+    def get_queryset(self):
+        if self.request.query_params.get('mine') == 'true':
+            return super().get_queryset().filter(user=self.request.user)
+        else:
+            return super().get_queryset()
 
     @swagger_auto_schema(manual_parameters=[
-        openapi.Parameter('mine', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN)
+        openapi.Parameter('mine', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter('pagination', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['page', 'cursor'])
     ])
     def list(self, request, *args, **kwargs):
-        if request.query_params['mine'] == 'true':
-            queryset = self.filter_queryset(self.get_queryset().filter(user=request.user))
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
-
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
-        else:
-            return super().list(request, *args, **kwargs)
+        return super().list(request, *args, **kwargs)
 
 
-class OrderExecutionView(viewsets.ModelViewSet):
+class OrderExecutionView(ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = OrderExecutionSerializer
     queryset = OrderExecution.objects.all()
     permission_classes = [IsAuthenticatedAndConfirmed, IsExecutor]
 
+    # Orderings of the untaken orders for claim-next: the oldest order first or the quickest to cook first
+    CLAIM_STRATEGIES = {
+        'oldest': ('timestamp', 'id'),
+        'shortest': ('cooking_time', 'timestamp', 'id'),
+    }
+    CLAIM_ATTEMPTS: int = 5
+    CLAIM_CANDIDATES: int = 10
+
     @swagger_auto_schema(request_body=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
         'order': openapi.Schema(type=openapi.TYPE_INTEGER),
     }))
     def create(self, request, *args, **kwargs):
-        try:
-            order = Order.objects.get(pk=request.data.get('order'))
-            order.is_taken = True
-            order.save()
-        except Order.DoesNotExist:
-            return Response(f'Order with pk: {request.data.get("order")} not found', status=status.HTTP_400_BAD_REQUEST)
-        request.data['executor'] = request.user.pk
-        request.data['status'] = OrderExecution.Status.pending.name
-        return super().create(request, *args, **kwargs)
+        with transaction.atomic():
+            # The conditional update makes sure that only one executor takes the order
+            if not Order.objects.filter(pk=request.data.get('order'), is_taken=False).update(is_taken=True):
+                if Order.objects.filter(pk=request.data.get('order')).exists():
+                    return Response(f'Order with pk: {request.data.get("order")} is already taken',
+                                    status=status.HTTP_409_CONFLICT)
+                return Response(f'Order with pk: {request.data.get("order")} not found',
+                                status=status.HTTP_400_BAD_REQUEST)
+            request.data['executor'] = request.user.pk
+            request.data['status'] = OrderExecution.Status.pending.name
+            return super().create(request, *args, **kwargs)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('strategy', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['oldest', 'shortest'])
+    ], request_body=no_body, responses={
+        status.HTTP_201_CREATED: OrderExecutionSerializer,
+        status.HTTP_404_NOT_FOUND: 'There is no order to take'
+    })
+    @action(methods=['POST'], detail=False, url_path='claim-next')
+    def claim_next(self, request):
+        ordering = self.CLAIM_STRATEGIES.get(request.query_params.get('strategy', 'oldest'))
+        if not ordering:
+            return Response(f'Strategy must be one of: {", ".join(self.CLAIM_STRATEGIES)}',
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        for _ in range(self.CLAIM_ATTEMPTS):
+            # The fields read by the order execution signals are loaded with the candidates
+            candidates = list(Order.objects.filter(is_taken=False).order_by(*ordering)
+                              .only('id', 'user_id', 'cooking_time')[:self.CLAIM_CANDIDATES])
+            if not candidates:
+                return Response('There is no order to take', status=status.HTTP_404_NOT_FOUND)
+            for order in candidates:
+                # The conditional update is the first statement of the transaction, so no read lock is held
+                # while it waits for the write lock. If another executor has taken the order, the next one is tried
+                with transaction.atomic():
+                    if Order.objects.filter(pk=order.pk, is_taken=False).update(is_taken=True):
+                        order_execution = OrderExecution.objects.create(order=order, executor=request.user,
+                                                                        status=OrderExecution.Status.pending)
+                        return Response(self.get_serializer(order_execution).data, status=status.HTTP_201_CREATED)
+        return Response('Could not take an order, try again', status=status.HTTP_409_CONFLICT)
 
     def perform_update(self, serializer):
         status = OrderExecution.Status(serializer.validated_data['status'])
         if status == OrderExecution.Status.delivered:
-            self.create_history_item(order_execution_id=serializer.data['id'])
+            try:
+                deliver_order_executions([serializer.instance.pk])
+            except OrderExecutionsNotFound as error:
+                # Another request has delivered the execution since it was read
+                raise NotFound(str(error))
+        elif status != serializer.instance.status:
+            serializer.save(status_changed_at=timezone.now())
         else:
             super().perform_update(serializer)
 
-    @staticmethod
-    def create_history_item(order_execution_id: int):
-        order_execution = OrderExecution.objects.get(pk=order_execution_id)
-        History.objects.create(
-            product=order_execution.order.product,
-            user=order_execution.order.user,
-            count=order_execution.order.count,
-            price=order_execution.order.price,
-            cooking_time=order_execution.order.cooking_time,
-            timestamp=order_execution.order.timestamp,
-            executor=order_execution.executor,
-            finish_time=datetime.now(),
-            delivery_address="Test"
-        )
-        order_execution.order.delete()
-        order_execution.delete()
+    @swagger_auto_schema(request_body=DeliverSerializer, responses={
+        status.HTTP_200_OK: HistorySerializer(many=True),
+        status.HTTP_400_BAD_REQUEST: 'Some of the order executions are not found'
+    })
+    @action(methods=['POST'], detail=False)
+    def deliver(self, request):
+        """
+        Marks many order executions as delivered at once and returns the created history items
+        """
+        serializer = DeliverSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            history = deliver_order_executions(serializer.validated_data['order_executions'])
+        except OrderExecutionsNotFound as error:
+            return Response({'detail': str(error), 'order_executions': error.ids},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(HistorySerializer(history, many=True).data, status=status.HTTP_200_OK)
 
     def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            # The order is read by the signals when the execution is saved
+            queryset = queryset.select_related('order')
         order_query = self.request.query_params.get('orders_ids', None)
         if order_query:
             orders = order_query.split(',')
-            return super().get_queryset().filter(order_id__in=orders)
+            return queryset.filter(order_id__in=orders)
         else:
-            return super().get_queryset()
+            return queryset
 
     @swagger_auto_schema(manual_parameters=[
         openapi.Parameter(name='orders_ids', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING)
@@ -136,25 +240,89 @@ class OrderExecutionView(viewsets.ModelViewSet):
         return super().list(request, *args, **kwargs)
 
 
-class HistoryView(mixins.RetrieveModelMixin,
+class HistoryView(CursorPaginationMixin,
+                  ValuesListMixin,
+                  mixins.RetrieveModelMixin,
                   mixins.ListModelMixin,
                   GenericViewSet):
     serializer_class = HistorySerializer
+    use_read_replica = True
     queryset = History.objects.all()
     permission_classes = [IsAuthenticatedAndConfirmed]
 
+    def get_queryset(self):
+        if self.request.query_params.get('mine') == 'true':
+            return super().get_queryset().filter(user=self.request.user)
+        else:
+            return super().get_queryset()
+
     @swagger_auto_schema(manual_parameters=[
-        openapi.Parameter('mine', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN)
+        openapi.Parameter('mine', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter('pagination', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['page', 'cursor'])
     ])
     def list(self, request, *args, **kwargs):
-        if request.query_params['mine'] == 'true':
-            queryset = self.filter_queryset(self.get_queryset().filter(user=request.user))
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
-
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
-        else:
-            return super().list(request, *args, **kwargs)
+        return super().list(request, *args, **kwargs)
+
+
+class OrderEtaView(APIView):
+    permission_classes = [IsAuthenticatedAndConfirmed]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter(name='ids', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+    ], responses={status.HTTP_200_OK: openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+        type=openapi.TYPE_OBJECT, properties={
+            'order': openapi.Schema(type=openapi.TYPE_INTEGER),
+            'eta': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME)
+        }))})
+    def get(self, request):
+        """
+        Estimated ready time of the orders of the user, or of the given ones. See orders.eta
+        """
+        orders = Order.objects.filter(user=request.user).order_by('id')
+        ids = request.query_params.get('ids', None)
+        if ids:
+            orders = orders.filter(id__in=ids.split(','))
+        field = EtaField()
+        return Response([{'order': order_id, 'eta': field.to_representation(order_id)}
+                         for order_id in orders.values_list('id', flat=True)])
+
+
+class SalesStatsView(APIView):
+    permission_classes = [IsAuthenticatedAndConfirmed, IsStrictAdministrator]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('date_from', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        openapi.Parameter('date_to', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        openapi.Parameter('product', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter('executor', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ])
+    def get(self, request):
+        products = DailyProductSales.objects.order_by('date', 'product_id')
+        executors = DailyExecutorThroughput.objects.order_by('date', 'executor_id')
+
+        for param, lookup in (('date_from', 'date__gte'), ('date_to', 'date__lte')):
+            if param in request.query_params:
+                try:
+                    date = parse_date(request.query_params[param])
+                except ValueError:
+                    date = None
+                if not date:
+                    return Response(f'{param} must be a date in format YYYY-MM-DD', status=status.HTTP_400_BAD_REQUEST)
+                products = products.filter(**{lookup: date})
+                executors = executors.filter(**{lookup: date})
+        ids = {}
+        for param in ('product', 'executor'):
+            if param in request.query_params:
+                try:
+                    ids[param] = int(request.query_params[param])
+                except ValueError:
+                    return Response(f'{param} must be an integer', status=status.HTTP_400_BAD_REQUEST)
+        if 'product' in ids:
+            products = products.filter(product_id=ids['product'])
+        if 'executor' in ids:
+            executors = executors.filter(executor_id=ids['executor'])
+
+        return Response({
+            'products': list(products.values('date', 'product', 'orders_count', 'items_count', 'revenue')),
+            'executors': list(executors.values('date', 'executor', 'orders_count', 'items_count', 'cooking_time'))
+        })
@@ -11,6 +11,8 @@ class ProductImageAdmin(admin.ModelAdmin):
 admin.site.register(Product)
 admin.site.register(ProductImage, ProductImageAdmin)
 admin.site.register(Feedback)
+admin.site.register(ProductRating)
 admin.site.register(Availability)
 admin.site.register(Category)
 admin.site.register(ProductCategory)
+admin.site.register(UploadedImage)
@@ -0,0 +1,76 @@
+import hashlib
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from foody.routers import use_primary
+from products.models import CatalogVersion
+from users.roles import resolve_user_role
+
+HITS_KEY: str = 'response-cache:hits'
+MISSES_KEY: str = 'response-cache:misses'
+
+# Query parameters holding comma-separated ids, their order does not change the response
+ID_LIST_PARAMS = ('ids', 'product_ids')
+
+
+def _increment(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats() -> Dict[str, int]:
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': stats.get(HITS_KEY, 0), 'misses': stats.get(MISSES_KEY, 0)}
+
+
+class CachedResponseMixin(object):
+    """
+    Caches the data of `list` and `retrieve` responses in the Django cache. The key consists of the path, the
+    normalized query parameters, the role of the caller and the versions of `versioned_models`, which are moved
+    forward in the database once a change of the models is committed, see `products.manages.CatalogVersionManager.bump`.
+    So a change made by any process evicts the responses cached by all of them, whichever cache backend is used
+    """
+    versioned_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, super().retrieve, *args, **kwargs)
+
+    def _cached_response(self, request, handler, *args, **kwargs):
+        key = self._get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _increment(HITS_KEY)
+            return Response(data)
+
+        _increment(MISSES_KEY)
+        # A lagging replica could put the data older than the versions to the cache for good
+        with use_primary():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def _get_cache_key(self, request) -> str:
+        query = []
+        for param, values in sorted(request.query_params.lists()):
+            if param in ID_LIST_PARAMS:
+                values = [','.join(sorted(set(','.join(values).split(','))))]
+            query.append((param, sorted(values)))
+        user_role = resolve_user_role(request.user, request)
+        role = f'{user_role.role}:{user_role.is_confirmed}' if user_role else ''
+        names = [model._meta.label_lower for model in self.versioned_models]
+        # The versions have been read for this request already if the view answers the conditional requests too
+        versions = getattr(self, 'catalog_versions', None)
+        if versions is None:
+            versions = CatalogVersion.objects.get_versions(names)
+        key = repr((request.path, query, role, [versions.get(name, (0,))[0] for name in names]))
+        return f'response-cache:{hashlib.sha1(key.encode()).hexdigest()}'
@@ -0,0 +1,441 @@
+"""
+Bulk import and export of the product catalog.
+
+A catalog row is a product together with its availability, category and images. The rows are matched to the
+existing ones by the natural keys: the product name and the category name. Rows are read either from JSON lines,
+one object per line, or from CSV, where the `images` column holds space-separated urls and the first url is
+the default image. For example:
+
+    {"name": "Margherita", "description": "Tomatoes and mozzarella", "price": 7.5, "cooking_time": 900,
+     "available": 20, "is_active": true, "category": {"name": "Pizza", "icon_url": "https://..."},
+     "images": [{"url": "https://...", "is_default": true, "is_external": true}]}
+"""
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union, Dict
+
+from django.db import transaction
+
+from products import search
+from products.models import Product, ProductImage, Availability, Category, ProductCategory, CatalogVersion
+
+FORMATS: Tuple[str, ...] = ('jsonl', 'csv')
+CONTENT_TYPES: Dict[str, str] = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+CSV_COLUMNS: List[str] = ['name', 'description', 'price', 'cooking_time', 'available', 'is_active', 'category',
+                          'category_icon_url', 'images']
+BATCH_SIZE: int = 500
+CHUNK_SIZE: int = 1000
+
+
+class CatalogImage(NamedTuple):
+    url: str
+    is_default: bool
+    # None when the file does not tell, e.g. CSV, then the flag of an existing image is kept
+    is_external: Optional[bool]
+
+
+class CatalogRow(NamedTuple):
+    name: str
+    description: str
+    price: float
+    cooking_time: int
+    available: Optional[int]
+    is_active: bool
+    category: Optional[str]
+    category_icon_url: Optional[str]
+    images: List[CatalogImage]
+
+
+class ImportResult(object):
+    def __init__(self) -> None:
+        self.created: int = 0
+        self.updated: int = 0
+        self.errors: List[dict] = []
+
+    def add_error(self, line: int, errors: dict) -> None:
+        self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self) -> dict:
+        return {'created': self.created, 'updated': self.updated, 'errors': self.errors}
+
+
+def _decode(lines: Iterable[Union[bytes, str]]) -> Iterator[str]:
+    for line in lines:
+        yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+
+def read_jsonl(lines: Iterable[Union[bytes, str]]) -> Iterator[Tuple[int, object]]:
+    """
+    Reads the raw rows from JSON lines, empty lines are skipped. A line which is not valid JSON is returned as
+    it is, so it is reported by the validation
+
+    :param lines: lines of the file
+    :return: pairs of the line number and the decoded row
+    """
+    for number, line in enumerate(_decode(lines), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, line
+
+
+def read_csv(lines: Iterable[Union[bytes, str]]) -> Iterator[Tuple[int, object]]:
+    """
+    Reads the raw rows from CSV with the `CSV_COLUMNS` header
+
+    :param lines: lines of the file
+    :return: pairs of the line number and the row in the same shape as a JSON line
+    """
+    reader = csv.DictReader(_decode(lines))
+    for row in reader:
+        yield reader.line_num, {
+            **row,
+            'available': row.get('available') or None,
+            'category': {'name': row['category'], 'icon_url': row.get('category_icon_url') or None}
+            if row.get('category') else None,
+            'images': (row.get('images') or '').split(),
+        }
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+def _max_length(model, field: str) -> int:
+    return model._meta.get_field(field).max_length
+
+
+def _string(data: dict, name: str, max_length: int, errors: dict, required: bool = True) -> Optional[str]:
+    value = data.get(name)
+    if value is None or value == '':
+        if required:
+            errors[name] = ['This field is required.']
+        return None
+    if not isinstance(value, str):
+        errors[name] = ['Not a valid string.']
+        return None
+    if len(value) > max_length:
+        errors[name] = [f'Ensure this field has no more than {max_length} characters.']
+        return None
+    return value
+
+
+def _number(data: dict, name: str, number_type: type, errors: dict, required: bool = True):
+    value = data.get(name)
+    if value is None or value == '':
+        if required:
+            errors[name] = ['This field is required.']
+        return None
+    try:
+        if isinstance(value, bool) or (number_type is int and isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        number = number_type(value)
+    except (TypeError, ValueError):
+        errors[name] = ['A valid integer is required.' if number_type is int else 'A valid number is required.']
+        return None
+    if number < 0:
+        errors[name] = ['Ensure this value is greater than or equal to 0.']
+        return None
+    return number
+
+
+def _boolean(value, default: Optional[bool]) -> Optional[bool]:
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def validate_row(data: object) -> Tuple[Optional[CatalogRow], dict]:
+    """
+    Validates a raw row with the same rules as the serializers of the catalog models, but without building them
+
+    :param data: decoded row
+    :return: the row and an empty dict, or None and the errors by field
+    """
+    if not isinstance(data, dict):
+        return None, {'non_field_errors': ['Row must be a JSON object.']}
+
+    errors = {}
+    name = _string(data, 'name', _max_length(Product, 'name'), errors)
+    description = _string(data, 'description', _max_length(Product, 'description'), errors)
+    price = _number(data, 'price', float, errors)
+    cooking_time = _number(data, 'cooking_time', int, errors)
+    available = _number(data, 'available', int, errors, required=False)
+
+    category, category_icon_url = data.get('category'), None
+    if isinstance(category, dict):
+        category_errors = {}
+        category_icon_url = _string(category, 'icon_url', _max_length(Category, 'icon_url'), category_errors,
+                                    required=False)
+        category = _string(category, 'name', _max_length(Category, 'name'), category_errors)
+        if category_errors:
+            errors['category'] = category_errors
+    elif category is not None:
+        category = _string(data, 'category', _max_length(Category, 'name'), errors)
+
+    images, image_errors = [], {}
+    if not isinstance(data.get('images', []), list):
+        errors['images'] = ['Expected a list of items.']
+    else:
+        # Without the flag, the first image is the default one
+        for index, image in enumerate(data.get('images', [])):
+            image = image if isinstance(image, dict) else {'url': image}
+            url = _string(image, 'url', _max_length(ProductImage, 'image_url'), image_errors)
+            images.append(CatalogImage(url, _boolean(image.get('is_default'), index == 0),
+                                       _boolean(image.get('is_external'), None)))
+        if image_errors:
+            errors['images'] = image_errors
+
+    if errors:
+        return None, errors
+    return CatalogRow(name, description, price, cooking_time, available, _boolean(data.get('is_active'), True),
+                      category, category_icon_url, images), {}
+
+
+def _by_name(queryset) -> dict:
+    # Names are not unique in the database, the oldest row is the one which is matched
+    result = {}
+    for item in queryset.order_by('-id'):
+        result[item.name] = item
+    return result
+
+
+class CatalogImporter(object):
+    def __init__(self, batch_size: int = BATCH_SIZE) -> None:
+        self._batch_size = batch_size
+
+    def run(self, rows: Iterable[Tuple[int, object]]) -> ImportResult:
+        """
+        Validates the rows and upserts them batch by batch, each batch in its own transaction
+
+        :param rows: pairs of the line number and the decoded row, see `read_jsonl` and `read_csv`
+        :return: number of the created and updated products and the errors of the rejected rows
+        """
+        result = ImportResult()
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self._batch_size))
+            if not batch:
+                return result
+            valid = {}
+            for line, data in batch:
+                row, errors = validate_row(data)
+                if errors:
+                    result.add_error(line, errors)
+                else:
+                    # The last row with the same name wins, like it would with separate requests
+                    valid[row.name] = (line, row)
+            if valid:
+                with transaction.atomic():
+                    self._import_batch(list(valid.values()), result)
+
+    def _import_batch(self, rows: List[Tuple[int, CatalogRow]], result: ImportResult) -> None:
+        categories = self._upsert_categories(rows, result)
+        rows = [(line, row) for line, row in rows if row.category is None or row.category in categories]
+        if not rows:
+            return
+        products = self._upsert_products([row for _, row in rows], result)
+        self._upsert_availabilities(products, [row for _, row in rows if row.available is not None])
+        self._upsert_product_categories(products, categories, [row for _, row in rows if row.category])
+        self._upsert_images(products, [row for _, row in rows if row.images])
+
+        if search.is_search_index_supported():
+            search.index_products(products.values())
+        # Bulk operations do not send the signals, so the catalog version is bumped here
+        CatalogVersion.objects.bump(*(model._meta.label_lower for model in
+                                      (Product, Availability, Category, ProductCategory, ProductImage)))
+
+    @staticmethod
+    def _upsert_categories(rows: List[Tuple[int, CatalogRow]], result: ImportResult) -> Dict[str, Category]:
+        icon_urls = {}
+        for _, row in rows:
+            if row.category and (row.category_icon_url or row.category not in icon_urls):
+                icon_urls[row.category] = row.category_icon_url
+        categories = _by_name(Category.objects.filter(name__in=icon_urls.keys()))
+
+        changed = [category for name, category in categories.items()
+                   if icon_urls[name] and category.icon_url != icon_urls[name]]
+        for category in changed:
+            category.icon_url = icon_urls[category.name]
+        Category.objects.bulk_update(changed, ['icon_url'])
+
+        missing = [name for name in icon_urls if name not in categories]
+        for line, row in rows:
+            if row.category in missing and not row.category_icon_url:
+                result.add_error(line, {'category': {'icon_url': ['This field is required for a new category.']}})
+        created = [Category(name=name, icon_url=icon_urls[name]) for name in missing if icon_urls[name]]
+        if created:
+            Category.objects.bulk_create(created)
+            # Not every database returns the primary keys of the inserted rows, so they are read back
+            categories.update(_by_name(Category.objects.filter(name__in=[category.name for category in created])))
+        return categories
+
+    @staticmethod
+    def _upsert_products(rows: List[CatalogRow], result: ImportResult) -> Dict[str, Product]:
+        products = _by_name(Product.objects.filter(name__in=[row.name for row in rows]))
+        fields = ['description', 'price', 'cooking_time']
+
+        updated = []
+        for row in rows:
+            product = products.get(row.name)
+            if product is not None:
+                for field in fields:
+                    setattr(product, field, getattr(row, field))
+                updated.append(product)
+        Product.objects.bulk_update(updated, fields)
+        result.updated += len(updated)
+
+        created = [Product(name=row.name, **{field: getattr(row, field) for field in fields})
+                   for row in rows if row.name not in products]
+        if created:
+            Product.objects.bulk_create(created)
+            products.update(_by_name(Product.objects.filter(name__in=[product.name for product in created])))
+        result.created += len(created)
+        return products
+
+    @staticmethod
+    def _upsert_availabilities(products: Dict[str, Product], rows: List[CatalogRow]) -> None:
+        existing = Availability.objects.in_bulk([products[row.name].pk for row in rows], field_name='product_id')
+        updated, created = [], []
+        for row in rows:
+            product = products[row.name]
+            availability = existing.get(product.pk) or Availability(product=product)
+            availability.available = row.available
+            availability.is_available = row.available > 0
+            availability.is_active = row.is_active
+            (updated if availability.pk else created).append(availability)
+        Availability.objects.bulk_update(updated, ['available', 'is_available', 'is_active'])
+        Availability.objects.bulk_create(created)
+
+    @staticmethod
+    def _upsert_product_categories(products: Dict[str, Product], categories: Dict[str, Category],
+                                   rows: List[CatalogRow]) -> None:
+        existing = ProductCategory.objects.in_bulk([products[row.name].pk for row in rows], field_name='product_id')
+        updated, created = [], []
+        for row in rows:
+            product = products[row.name]
+            product_category = existing.get(product.pk) or ProductCategory(product=product)
+            product_category.category = categories[row.category]
+            (updated if product_category.pk else created).append(product_category)
+        ProductCategory.objects.bulk_update(updated, ['category'])
+        ProductCategory.objects.bulk_create(created)
+
+    @staticmethod
+    def _upsert_images(products: Dict[str, Product], rows: List[CatalogRow]) -> None:
+        existing = defaultdict(dict)
+        for image in ProductImage.objects.filter(product_id__in=[products[row.name].pk for row in rows]):
+            existing[image.product_id][image.image_url] = image
+        updated, created = {}, []
+        for row in rows:
+            product = products[row.name]
+            # A product has only one default image, the first one of the row which is marked so
+            default_url = next((image.url for image in row.images if image.is_default), None)
+            for image in row.images:
+                is_default = image.url == default_url
+                product_image = existing[product.pk].get(image.url)
+                if product_image is None:
+                    created.append(ProductImage(product=product, image_url=image.url, is_default=is_default,
+                                                is_external=bool(image.is_external)))
+                    continue
+                is_external = product_image.is_external if image.is_external is None else image.is_external
+                if (product_image.is_default, product_image.is_external) != (is_default, is_external):
+                    product_image.is_default, product_image.is_external = is_default, is_external
+                    updated[product_image.pk] = product_image
+            if default_url is not None:
+                for product_image in existing[product.pk].values():
+                    if product_image.is_default and product_image.image_url != default_url:
+                        product_image.is_default = False
+                        updated[product_image.pk] = product_image
+        ProductImage.objects.bulk_update(list(updated.values()), ['is_default', 'is_external'])
+        ProductImage.objects.bulk_create(created)
+
+
+def import_catalog(lines: Iterable[Union[bytes, str]], file_format: str = 'jsonl',
+                   batch_size: int = BATCH_SIZE) -> ImportResult:
+    """
+    Imports the catalog file
+
+    :param lines: lines of the file
+    :param file_format: one of `FORMATS`
+    :param batch_size: number of the rows written in one transaction
+    :return: result of the import
+    """
+    return CatalogImporter(batch_size).run(READERS[file_format](lines))
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iterate_catalog(chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Reads the whole catalog in chunks, so only one chunk of the products is held in memory at a time
+
+    :param chunk_size: number of the products read at once
+    :return: rows in the shape of a JSON line
+    """
+    products = Product.objects.order_by('id').values(
+        'id', 'name', 'description', 'price', 'cooking_time', 'availability__available', 'availability__is_active',
+        'productcategory__category__name', 'productcategory__category__icon_url'
+    ).iterator(chunk_size=chunk_size)
+    for chunk in _chunks(products, chunk_size):
+        images = defaultdict(list)
+        for image in ProductImage.objects.filter(product_id__in=[product['id'] for product in chunk]) \
+                .order_by('-is_default', 'id').values('product_id', 'image_url', 'is_default', 'is_external'):
+            images[image['product_id']].append({'url': image['image_url'], 'is_default': image['is_default'],
+                                                'is_external': image['is_external']})
+        for product in chunk:
+            category = product['productcategory__category__name']
+            yield {
+                'name': product['name'],
+                'description': product['description'],
+                'price': product['price'],
+                'cooking_time': product['cooking_time'],
+                'available': product['availability__available'],
+                'is_active': product['availability__is_active'] is not False,
+                'category': {'name': category, 'icon_url': product['productcategory__category__icon_url']}
+                if category else None,
+                'images': images[product['id']],
+            }
+
+
+class _Line(object):
+    """
+    File-like object for `csv.writer` which returns the written line instead of keeping it
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def export_catalog(file_format: str = 'jsonl', chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Streams the whole catalog in the format which is accepted by `import_catalog`
+
+    :param file_format: one of `FORMATS`
+    :param chunk_size: number of the products read at once
+    :return: lines of the file
+    """
+    if file_format == 'jsonl':
+        for row in iterate_catalog(chunk_size):
+            yield json.dumps(row) + '\n'
+        return
+
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in iterate_catalog(chunk_size):
+        category = row['category'] or {}
+        yield writer.writerow([row['name'], row['description'], row['price'], row['cooking_time'],
+                               '' if row['available'] is None else row['available'], row['is_active'],
+                               category.get('name', ''), category.get('icon_url', ''),
+                               ' '.join(image['url'] for image in row['images'])])
@@ -0,0 +1,92 @@
+import hashlib
+import io
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Tuple
+
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+from rest_framework.exceptions import ValidationError
+
+from products.models import UploadedImage
+from products.storage import get_image_storage
+
+CHUNK_SIZE: int = 64 * 1024
+
+# Bounding boxes of the size variants, the aspect ratio is kept
+VARIANTS = {
+    'thumbnail': (160, 160),
+    'list': (480, 480),
+    'detail': (1280, 1280),
+}
+
+
+def stream_to_temp_file(stream) -> Tuple[IO[bytes], str]:
+    """
+    Copies the stream to a temporary file by chunks, hashing the content on the way
+
+    :param stream: readable stream of the uploaded image
+    :return: temporary file rewound to the start and SHA-256 of its content
+    """
+    temp_file = tempfile.TemporaryFile()
+    content_hash = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            temp_file.close()
+            raise ValidationError(f'Image is larger than {settings.IMAGE_UPLOAD_MAX_SIZE} bytes')
+        content_hash.update(chunk)
+        temp_file.write(chunk)
+    temp_file.seek(0)
+    return temp_file, content_hash.hexdigest()
+
+
+def _render_variant(image: Image.Image, size: Tuple[int, int]) -> Tuple[bytes, str]:
+    variant = image.copy()
+    variant.thumbnail(size)
+    output = io.BytesIO()
+    if variant.mode in ('RGBA', 'LA', 'P'):
+        variant.save(output, format='PNG', optimize=True)
+        return output.getvalue(), 'png'
+    variant.convert('RGB').save(output, format='JPEG', quality=85, optimize=True)
+    return output.getvalue(), 'jpg'
+
+
+def upload_image(stream) -> Tuple[UploadedImage, bool]:
+    """
+    Stores the size variants of the uploaded image. If the same content has been uploaded before, the existing
+    image is returned without processing
+
+    :param stream: readable stream of the uploaded image
+    :return: the image and whether it has been created
+    """
+    temp_file, content_hash = stream_to_temp_file(stream)
+    with temp_file:
+        uploaded_image = UploadedImage.objects.filter(content_hash=content_hash).first()
+        if uploaded_image is not None:
+            return uploaded_image, False
+
+        try:
+            image = Image.open(temp_file)
+            image.load()
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+            raise ValidationError('Uploaded file is not a valid image')
+
+        variants = {name: _render_variant(image, size) for name, size in VARIANTS.items()}
+
+    storage = get_image_storage()
+    with ThreadPoolExecutor(max_workers=len(variants)) as executor:
+        urls = dict(zip(variants, executor.map(
+            lambda name: storage.save(f'{content_hash}/{name}.{variants[name][1]}', variants[name][0]), variants)))
+
+    return UploadedImage.objects.get_or_create(content_hash=content_hash, defaults={
+        'width': image.width,
+        'height': image.height,
+        'thumbnail_url': urls['thumbnail'],
+        'list_url': urls['list'],
+        'detail_url': urls['detail'],
+    })
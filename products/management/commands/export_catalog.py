@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from products import catalog
+
+
+class Command(BaseCommand):
+    help = 'Exports the whole product catalog as JSON lines or CSV, which can be imported by import_catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Output file, by default the catalog is written to stdout')
+        parser.add_argument('--format', choices=catalog.FORMATS, default='jsonl')
+        parser.add_argument('--chunk-size', type=int, default=catalog.CHUNK_SIZE,
+                            help='Number of the products read at once')
+
+    def handle(self, *args, **options):
+        lines = catalog.export_catalog(options['format'], options['chunk_size'])
+        if options['path'] is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['path'], 'w', encoding='utf-8', newline='') as file:
+            file.writelines(lines)
@@ -0,0 +1,28 @@
+import os
+
+from django.core.management import BaseCommand, CommandError
+
+from products import catalog
+
+
+class Command(BaseCommand):
+    help = 'Imports the product catalog from a JSON lines or CSV file, see products.catalog for the format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=catalog.FORMATS,
+                            help='Format of the file, by default it is taken from the extension')
+        parser.add_argument('--batch-size', type=int, default=catalog.BATCH_SIZE,
+                            help='Number of the rows written in one transaction')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in catalog.FORMATS:
+            raise CommandError(f'Format must be one of: {", ".join(catalog.FORMATS)}')
+        with open(options['path'], encoding='utf-8', newline='') as file:
+            result = catalog.import_catalog(file, file_format, options['batch_size'])
+
+        for error in result.errors:
+            self.stderr.write(f'Line {error["line"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(f'Created {result.created} products, updated {result.updated}, '
+                                             f'rejected {len(result.errors)} rows'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management import BaseCommand
+
+from products.purge import CatalogPurger
+
+
+class Command(BaseCommand):
+    help = 'Removes the soft-deleted products and categories together with their orders, history, images etc.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of the rows removed at once')
+        parser.add_argument('--poll-interval', type=float, default=60,
+                            help='Seconds to wait when there is nothing to purge')
+        parser.add_argument('--once', action='store_true', help='Purge once and exit')
+
+    def handle(self, *args, **options):
+        purger = CatalogPurger(batch_size=options['batch_size'], on_progress=self._report_progress)
+        while True:
+            pending = purger.pending()
+            if pending:
+                self.stdout.write(f'Purging {pending} soft-deleted rows')
+                purger.purge()
+                self.stdout.write(self.style.SUCCESS(
+                    'Purged ' + ', '.join(f'{count} {label}' for label, count in purger.progress.items())))
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
+
+    def _report_progress(self, label: str, count: int, total: int) -> None:
+        self.stdout.write(f'{label}: removed {count}, {total} in total')
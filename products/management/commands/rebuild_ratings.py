@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from products.models import ProductRating
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product rating aggregates from the feedback table'
+
+    def handle(self, *args, **options):
+        count = ProductRating.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings of {count} products'))
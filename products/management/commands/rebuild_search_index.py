@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand, CommandError
+
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the products'
+
+    def handle(self, *args, **options):
+        if not search.is_search_index_supported():
+            raise CommandError('The full-text search index is supported only on SQLite')
+        search.create_search_index()
+        count = search.rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products'))
@@ -0,0 +1,78 @@
+from typing import Dict, Iterable, Tuple
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import F, Case, When, Value
+from django.utils import timezone
+
+
+class CatalogVersionManager(models.Manager):
+    def bump(self, *names: str) -> None:
+        """
+        Increments the versions of the given catalog tables once the current transaction is committed. Bumping after
+        the commit makes sure that a client which has seen the new version also sees the new data.
+
+        :param names: labels of the changed tables, e.g. `products.product`
+        """
+        transaction.on_commit(lambda: self._bump(names))
+
+    def _bump(self, names: Iterable[str]) -> None:
+        for name in names:
+            if not self.filter(name=name).update(version=F('version') + 1, updated_at=timezone.now()):
+                self.bulk_create([self.model(name=name, version=1)], ignore_conflicts=True)
+
+    def get_versions(self, names: Iterable[str]) -> Dict[str, Tuple[int, object]]:
+        """
+        :param names: labels of the catalog tables
+        :return: mapping of the label to the version and time of the last change. Unchanged tables are not included
+        """
+        return {name: (version, updated_at)
+                for name, version, updated_at in self.filter(name__in=names).values_list('name', 'version',
+                                                                                          'updated_at')}
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self) -> int:
+        """
+        Marks the rows as deleted by a single UPDATE. The rows and everything which cascades from them are removed
+        later by the `purge_catalog` worker, so the request does not have to collect the cascades
+
+        :return: number of the deleted rows
+        """
+        deleted = self.update(is_deleted=True)
+        if deleted:
+            # The rows of the related tables are hidden together with the deleted rows, so they change too
+            apps.get_model('products', 'CatalogVersion').objects.bump(
+                self.model._meta.label_lower,
+                *(relation.related_model._meta.label_lower for relation in self.model._meta.related_objects)
+            )
+        return deleted
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    Hides the soft-deleted rows. The models keep a plain `all_objects` manager to reach them
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
+class AvailabilityManager(models.Manager):
+    def reserve(self, product_id: int, count: int) -> bool:
+        """
+        Atomically takes the given count of a product from the stock. The check and the decrement are done by
+        a single conditional UPDATE, so concurrent reservations can never oversell the product.
+
+        :param product_id: product to reserve
+        :param count: how many items to reserve
+        :return: True if the items have been reserved, False if there are not enough of them
+        """
+        reserved = bool(self.filter(product_id=product_id, available__gte=count).update(
+            available=F('available') - count,
+            is_available=Case(When(available=count, then=Value(False)), default=Value(True))
+        ))
+        if reserved:
+            # The update does not send signals, so the catalog version is bumped here
+            apps.get_model('products', 'CatalogVersion').objects.bump(self.model._meta.label_lower)
+        return reserved
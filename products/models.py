@@ -1,6 +1,11 @@
+from typing import Optional, Iterable
+
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum, Count, Q
+from django.utils import timezone
 
+from products.manages import AvailabilityManager, CatalogVersionManager, SoftDeleteManager
 from users.models import User
 
 
@@ -9,16 +14,46 @@ class Product(models.Model):
     description = models.CharField('description', max_length=3000, blank=False)
     price = models.FloatField('price')
     cooking_time = models.IntegerField('cooking_time')
+    is_deleted = models.BooleanField('is_deleted', default=False)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=Q(is_deleted=True), name='product_deleted_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class UploadedImage(models.Model):
+    """
+    Image uploaded through the upload pipeline, stored in several size variants. It is deduplicated by the content
+    """
+    content_hash = models.CharField('content_hash', max_length=64, unique=True)
+    width = models.IntegerField('width')
+    height = models.IntegerField('height')
+    thumbnail_url = models.CharField('thumbnail_url', max_length=1000)
+    list_url = models.CharField('list_url', max_length=1000)
+    detail_url = models.CharField('detail_url', max_length=1000)
+    created_at = models.DateTimeField('created_at', auto_now_add=True)
+
+    @property
+    def variants(self) -> dict:
+        return {'thumbnail': self.thumbnail_url, 'list': self.list_url, 'detail': self.detail_url}
+
+    def __str__(self):
+        return f'Uploaded image {self.content_hash[:12]} ({self.width}x{self.height})'
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     image_url = models.CharField('image_url', max_length=1000, blank=False)
     is_default = models.BooleanField('is_default', default=True)
     is_external = models.BooleanField('is_external', default=False)
+    uploaded_image = models.ForeignKey(UploadedImage, on_delete=models.SET_NULL, null=True, blank=True)
 
     def __str__(self):
         return f'{"Default " if self.is_default else ""}Image for [{self.product.name}]'
@@ -39,12 +74,74 @@ class Feedback(models.Model):
         return f'{self.user.email} -> [{self.rating}] for {self.product.name}'
 
 
+class ProductRating(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True)
+    rating_sum = models.IntegerField('rating_sum', default=0)
+    rating_count = models.IntegerField('rating_count', default=0)
+
+    @property
+    def rating(self) -> float:
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+
+    @classmethod
+    def add_rating(cls, product_id: int, rating: int) -> None:
+        """
+        Adds a rating to the running aggregate of the given product
+
+        :param product_id: product whose aggregate is changed
+        :param rating: rating to add
+        """
+        cls.objects.get_or_create(product_id=product_id)
+        cls.objects.filter(product_id=product_id).update(rating_sum=F('rating_sum') + rating,
+                                                         rating_count=F('rating_count') + 1)
+        CatalogVersion.objects.bump(cls._meta.label_lower)
+
+    @classmethod
+    def remove_rating(cls, product_id: int, rating: int) -> None:
+        """
+        Removes a rating from the running aggregate of the given product
+
+        :param product_id: product whose aggregate is changed
+        :param rating: rating to remove
+        """
+        cls.objects.filter(product_id=product_id).update(rating_sum=F('rating_sum') - rating,
+                                                         rating_count=F('rating_count') - 1)
+        CatalogVersion.objects.bump(cls._meta.label_lower)
+
+    @classmethod
+    def rebuild(cls, product_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Recalculates the aggregates from the Feedback table
+
+        :param product_ids: products to recalculate, all of them if not given
+        :return: number of the recalculated aggregates
+        """
+        feedbacks = Feedback.objects.all()
+        ratings = cls.objects.all()
+        if product_ids is not None:
+            feedbacks = feedbacks.filter(product_id__in=product_ids)
+            ratings = ratings.filter(product_id__in=product_ids)
+        aggregates = [cls(product_id=row['product_id'], rating_sum=row['rating_sum'], rating_count=row['rating_count'])
+                      for row in feedbacks.values('product_id').annotate(rating_sum=Sum('rating'),
+                                                                         rating_count=Count('id'))]
+        with transaction.atomic():
+            ratings.delete()
+            cls.objects.bulk_create(aggregates)
+        CatalogVersion.objects.bump(cls._meta.label_lower)
+        return len(aggregates)
+
+    def __str__(self):
+        return f'[{self.product.name}] -> rating: {self.rating}'
+
+
 class Availability(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE)
     available = models.IntegerField('available', validators=[MinValueValidator(0)])
     is_available = models.BooleanField('is_available', default=True)
     is_active = models.BooleanField('is_active', default=True)
 
+    objects = AvailabilityManager()
+
     def __str__(self):
         return f'[{self.product.name}] -> available: {self.available}'
 
@@ -53,6 +150,15 @@ class Category(models.Model):
     name = models.CharField('name', max_length=20, blank=False)
     icon_url = models.CharField('icon_url', max_length=200, blank=False)
     is_icon_external = models.BooleanField('is_icon_external', default=False)
+    is_deleted = models.BooleanField('is_deleted', default=False)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=Q(is_deleted=True), name='category_deleted_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -64,3 +170,17 @@ class ProductCategory(models.Model):
 
     def __str__(self):
         return f'{self.product.name} -> {self.category.name}'
+
+
+class CatalogVersion(models.Model):
+    """
+    Change counter of a catalog table. It is used as a validator for the conditional GET requests
+    """
+    name = models.CharField('name', max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField('version', default=0)
+    updated_at = models.DateTimeField('updated_at', default=timezone.now)
+
+    objects = CatalogVersionManager()
+
+    def __str__(self):
+        return f'{self.name} -> version: {self.version}'
@@ -0,0 +1,94 @@
+import logging
+from collections import Counter
+from typing import Callable, List, Optional
+
+from django.db import models, router
+
+from orders import eta
+from orders.models import Order
+from products import search
+from products.models import Product, Category, CatalogVersion
+
+logger = logging.getLogger(__name__)
+
+
+def _relations(model) -> List[models.ForeignObjectRel]:
+    return [relation for relation in model._meta.related_objects
+            if not relation.many_to_many and relation.on_delete in (models.CASCADE, models.SET_NULL)]
+
+
+class CatalogPurger(object):
+    """
+    Removes the soft-deleted products and categories together with the rows which cascade from them. Unlike
+    `QuerySet.delete()`, it never loads the rows into memory: the primary keys are taken in bounded batches and
+    every batch is removed by a single raw DELETE, the children before the parents. A batch is committed on its
+    own, so an interrupted purge continues where it stopped the next time.
+    """
+    MODELS = (Product, Category)
+
+    def __init__(self, batch_size: int = 1000,
+                 on_progress: Optional[Callable[[str, int, int], None]] = None) -> None:
+        """
+        :param batch_size: number of the rows removed by one statement
+        :param on_progress: called after every batch with the label of the table, the number of the rows removed
+        by the batch and the total number of the rows removed from the table so far
+        """
+        self._batch_size = batch_size
+        self._on_progress = on_progress
+        self.progress: Counter = Counter()
+
+    def pending(self) -> int:
+        """
+        :return: number of the soft-deleted rows which wait for the purge
+        """
+        return sum(model.all_objects.filter(is_deleted=True).count() for model in self.MODELS)
+
+    def purge(self) -> int:
+        """
+        Removes all the soft-deleted rows
+
+        :return: number of the removed soft-deleted rows, the cascades are not counted
+        """
+        self.progress.clear()
+        purged = 0
+        for model in self.MODELS:
+            purged += self._delete(model, model.all_objects.filter(is_deleted=True))
+        if self.progress:
+            CatalogVersion.objects.bump(*self.progress)
+        return purged
+
+    def _delete(self, model, queryset) -> int:
+        deleted = 0
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[:self._batch_size])
+            if not pks:
+                return deleted
+            for relation in _relations(model):
+                related = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': pks})
+                if relation.on_delete == models.CASCADE:
+                    self._delete(relation.related_model, related)
+                else:
+                    self._set_null(relation, related)
+            model._base_manager.filter(pk__in=pks)._raw_delete(router.db_for_write(model))
+            if model is Product and search.is_search_index_supported():
+                search.remove_products(pks)
+            if model is Order:
+                eta.orders_removed(pks)
+            deleted += len(pks)
+            self._report(model, len(pks))
+
+    def _set_null(self, relation: models.ForeignObjectRel, queryset) -> None:
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[:self._batch_size])
+            if not pks:
+                return
+            relation.related_model._base_manager.filter(pk__in=pks).update(**{relation.field.name: None})
+            self._report(relation.related_model, len(pks))
+
+    def _report(self, model, count: int) -> None:
+        label = model._meta.label_lower
+        self.progress[label] += count
+        logger.debug('Purged %s rows of %s, %s in total', count, label, self.progress[label])
+        if self._on_progress:
+            self._on_progress(label, count, self.progress[label])
+
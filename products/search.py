@@ -0,0 +1,98 @@
+import re
+from typing import Iterable
+
+from django.db import connections, router
+from rest_framework import filters
+
+from products.models import Product
+
+SEARCH_INDEX_TABLE: str = 'products_product_fts'
+
+# Matches in the product name weigh more than matches in the description
+_RANK = f'bm25({SEARCH_INDEX_TABLE}, 10.0, 1.0)'
+
+
+def _connection():
+    return connections[router.db_for_write(Product)]
+
+
+def is_search_index_supported() -> bool:
+    return _connection().vendor == 'sqlite'
+
+
+def create_search_index() -> bool:
+    """
+    Creates the FTS5 table over the product name and description if it does not exist yet
+
+    :return: True if the table has been created
+    """
+    connection = _connection()
+    if SEARCH_INDEX_TABLE in connection.introspection.table_names():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE VIRTUAL TABLE {SEARCH_INDEX_TABLE} USING fts5(name, description, "
+                       f"tokenize = 'unicode61 remove_diacritics 2')")
+    return True
+
+
+def rebuild_search_index() -> int:
+    """
+    Fills the search index from scratch
+
+    :return: number of the indexed products
+    """
+    with _connection().cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_INDEX_TABLE}')
+        cursor.execute(f'INSERT INTO {SEARCH_INDEX_TABLE} (rowid, name, description) '
+                       f'SELECT id, name, description FROM {Product._meta.db_table}')
+        return cursor.rowcount
+
+
+def index_product(product: Product) -> None:
+    index_products([product])
+
+
+def index_products(products: Iterable[Product]) -> None:
+    products = list(products)
+    with _connection().cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid = %s', [[product.pk] for product in products])
+        cursor.executemany(f'INSERT INTO {SEARCH_INDEX_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+                           [[product.pk, product.name, product.description] for product in products])
+
+
+def remove_product(product_id: int) -> None:
+    remove_products([product_id])
+
+
+def remove_products(product_ids: Iterable[int]) -> None:
+    with _connection().cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid = %s', [[pk] for pk in product_ids])
+
+
+def build_match_query(search: str) -> str:
+    """
+    Turns the user input into an FTS5 query where every word is a prefix query, e.g. `marg piz` is turned
+    into `"marg"* "piz"*`. Quoting the words makes the FTS5 operators in the input harmless
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', search))
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Searches the products by the name and the description through the FTS5 index and orders them by bm25 rank.
+    On databases other than SQLite it falls back to the default `search_fields` lookup
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        match_query = build_match_query(' '.join(self.get_search_terms(request)))
+        if not match_query or not is_search_index_supported():
+            return super().filter_queryset(request, queryset, view)
+
+        product_table = Product._meta.db_table
+        return queryset.extra(
+            tables=[SEARCH_INDEX_TABLE],
+            where=[f'{SEARCH_INDEX_TABLE}.rowid = {product_table}.id', f'{SEARCH_INDEX_TABLE} MATCH %s'],
+            params=[match_query],
+            select={'search_rank': _RANK},
+            order_by=['search_rank', 'id']
+        )
@@ -1,15 +1,32 @@
 from rest_framework import serializers
 
-from products.models import Product, ProductImage, Feedback, Availability, Category, ProductCategory
+from products.models import Product, ProductImage, Feedback, Availability, Category, ProductCategory, ProductRating, \
+    UploadedImage
 
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        # Deleting goes through the soft delete of the views, which also moves the catalog versions
+        exclude = ('is_deleted',)
+
+
+class UploadedImageSerializer(serializers.ModelSerializer):
+    url = serializers.CharField(source='detail_url', read_only=True)
+    variants = serializers.ReadOnlyField()
+
+    class Meta:
+        model = UploadedImage
+        fields = ('id', 'url', 'variants', 'width', 'height')
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
+    @staticmethod
+    def get_variants(product_image: ProductImage):
+        return product_image.uploaded_image.variants if product_image.uploaded_image else None
+
     class Meta:
         model = ProductImage
         fields = '__all__'
@@ -30,10 +47,55 @@ class AvailabilitySerializer(serializers.ModelSerializer):
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ('is_deleted',)
 
 
 class ProductCategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductCategory
         fields = '__all__'
+
+
+class MenuAvailabilitySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Availability
+        fields = ('available', 'is_available', 'is_active')
+
+
+class MenuProductSerializer(serializers.ModelSerializer):
+    default_image = serializers.SerializerMethodField()
+    availability = serializers.SerializerMethodField()
+    category = serializers.SerializerMethodField()
+    rating = serializers.SerializerMethodField()
+
+    @staticmethod
+    def get_default_image(product: Product):
+        return ProductImageSerializer(product.default_images[0]).data if product.default_images else None
+
+    @staticmethod
+    def get_availability(product: Product):
+        try:
+            return MenuAvailabilitySerializer(product.availability).data
+        except Availability.DoesNotExist:
+            return None
+
+    @staticmethod
+    def get_category(product: Product):
+        try:
+            category = product.productcategory.category
+        except ProductCategory.DoesNotExist:
+            return None
+        # The category is soft deleted, its links are removed later by the purge_catalog worker
+        return CategorySerializer(category).data if not category.is_deleted else None
+
+    @staticmethod
+    def get_rating(product: Product):
+        try:
+            return product.productrating.rating if product.productrating.rating_count else None
+        except ProductRating.DoesNotExist:
+            return None
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'description', 'price', 'cooking_time', 'default_image', 'availability', 'category',
+                  'rating')
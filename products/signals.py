@@ -0,0 +1,52 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from products import search
+from products.models import Feedback, ProductRating, Product, ProductImage, Availability, Category, \
+    ProductCategory, CatalogVersion
+
+
+@receiver(pre_save, sender=Feedback)
+def remember_feedback_product(sender, instance: Feedback, **kwargs):
+    # An update can move the feedback to another product, then the rating of the previous one is rebuilt too
+    instance._previous_product_id = sender.objects.using(kwargs['using']).filter(pk=instance.pk) \
+        .values_list('product_id', flat=True).first() if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Feedback)
+def update_product_rating_on_save(sender, instance: Feedback, created: bool, **kwargs):
+    if created:
+        ProductRating.add_rating(instance.product_id, instance.rating)
+    else:
+        ProductRating.rebuild(product_ids={instance.product_id, instance._previous_product_id} - {None})
+
+
+@receiver(post_delete, sender=Feedback)
+def update_product_rating_on_delete(sender, instance: Feedback, **kwargs):
+    ProductRating.remove_rating(instance.product_id, instance.rating)
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance: Product, **kwargs):
+    if search.is_search_index_supported():
+        search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index_on_delete(sender, instance: Product, **kwargs):
+    if search.is_search_index_supported():
+        search.remove_product(instance.pk)
+
+
+def bump_catalog_version(sender, **kwargs):
+    CatalogVersion.objects.bump(sender._meta.label_lower)
+
+
+for catalog_model in (Product, ProductImage, Availability, Category, ProductCategory):
+    post_save.connect(bump_catalog_version, sender=catalog_model)
+    post_delete.connect(bump_catalog_version, sender=catalog_model)
+
+
+def create_search_index(sender, **kwargs):
+    if search.is_search_index_supported() and search.create_search_index():
+        search.rebuild_search_index()
@@ -0,0 +1,45 @@
+from cloudinary import uploader
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+
+class BaseImageStorage(object):
+    def save(self, name: str, content: bytes) -> str:
+        """
+        Stores the image
+
+        :param name: unique name of the image, the same name always refers to the same content
+        :param content: encoded image
+        :return: public url of the stored image
+        """
+        raise NotImplementedError
+
+
+class LocalImageStorage(BaseImageStorage):
+    """
+    Keeps the images on the local filesystem, in `IMAGE_STORAGE_ROOT`, served from `IMAGE_STORAGE_URL`
+    """
+
+    def __init__(self, location: str = None, base_url: str = None) -> None:
+        self._storage = FileSystemStorage(location=location or settings.IMAGE_STORAGE_ROOT,
+                                          base_url=base_url or settings.IMAGE_STORAGE_URL)
+
+    def save(self, name: str, content: bytes) -> str:
+        if not self._storage.exists(name):
+            self._storage.save(name, ContentFile(content))
+        return self._storage.url(name)
+
+
+class CloudinaryImageStorage(BaseImageStorage):
+    FOLDER: str = 'foody'
+
+    def save(self, name: str, content: bytes) -> str:
+        # Cloudinary adds the extension by itself
+        public_id = f'{self.FOLDER}/{name.rsplit(".", 1)[0]}'
+        return uploader.upload(content, public_id=public_id, overwrite=False)['secure_url']
+
+
+def get_image_storage() -> BaseImageStorage:
+    return import_string(settings.IMAGE_STORAGE)()
@@ -1,6 +1,23 @@
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache as django_cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
 from rest_framework import status
 
-from products.models import Product, ProductImage, Availability, Feedback
+from orders.models import Order, OrderExecution, History
+from products import cache, catalog
+from products.models import Product, ProductImage, Availability, Feedback, ProductRating, Category, ProductCategory, \
+    CatalogVersion, UploadedImage
+from products.purge import CatalogPurger
 from users.models import UserRole, User
 from utils.tests import ApiTestCase
 
@@ -65,6 +82,38 @@ class ProductsTestCase(ApiTestCase):
         self.assertEqual(Product.objects.all().count(), 1)
         self.assertEqual(Product.objects.get(pk=p.pk).name, 'Product Name Two')
 
+    @ApiTestCase.Decorators.create_default_user_and_log_in()
+    def test_search_products(self):
+        margherita = Product.objects.create(name='Margherita', description='Pizza with tomatoes and mozzarella',
+                                            price=1.25, cooking_time=600)
+        pepperoni = Product.objects.create(name='Pepperoni', description='Spicy pizza', price=2.25, cooking_time=600)
+        Product.objects.create(name='Caesar', description='Salad with chicken', price=2.25, cooking_time=300)
+
+        response = self.client.get('/products/?search=pizz')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+
+        response = self.client.get('/products/?search=mozzarella pizza')
+        self.assertEqual([product['id'] for product in response.data['results']], [margherita.pk])
+
+        response = self.client.get('/products/?search=pepperoni pizza')
+        self.assertEqual([product['id'] for product in response.data['results']], [pepperoni.pk])
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in()
+    def test_search_products_is_ranked_and_in_sync(self):
+        in_description = Product.objects.create(name='Soup', description='Not a burger', price=1, cooking_time=600)
+        in_name = Product.objects.create(name='Burger', description='Beef', price=1, cooking_time=600)
+
+        response = self.client.get('/products/?search=burger')
+        self.assertEqual([product['id'] for product in response.data['results']], [in_name.pk, in_description.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            in_name.name = 'Sandwich'
+            in_name.save()
+            in_description.delete()
+        response = self.client.get('/products/?search=burger')
+        self.assertEqual(response.data['count'], 0)
+
     def _create_product(self):
         return self.client.post('/products/', {
             'name': 'Product One',
@@ -203,3 +252,496 @@ class FeedbackTestCase(ApiTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 1)
         self.assertEqual(response.data['results'][0]['product'], p1.pk)
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(role=UserRole.UserRoleChoice.client, get_user=True)
+    def test_get_products_rating(self, user: User):
+        another_user = self._create_user_model(email='another@email.com')
+        p1 = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        p2 = Product.objects.create(name='Product Two', description='Description', price=1.25, cooking_time=3600)
+        p3 = Product.objects.create(name='Product Three', description='Description', price=1.25, cooking_time=3600)
+        Feedback.objects.create(product=p1, user=user, rating=4)
+        Feedback.objects.create(product=p1, user=another_user, rating=1)
+        Feedback.objects.create(product=p2, user=user, rating=3)
+        Feedback.objects.create(product=p3, user=user, rating=5).delete()
+
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/products/feedback/product-rating/?product_ids={p1.pk},{p2.pk},{p3.pk}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'product': str(p1.pk), 'rating': 2.5}, {'product': str(p2.pk), 'rating': 3}])
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(role=UserRole.UserRoleChoice.client, get_user=True)
+    def test_move_feedback_to_another_product(self, user: User):
+        p1 = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        p2 = Product.objects.create(name='Product Two', description='Description', price=1.25, cooking_time=3600)
+        feedback = Feedback.objects.create(product=p1, user=user, rating=4)
+
+        feedback.product = p2
+        feedback.save()
+        self.assertFalse(ProductRating.objects.filter(product=p1, rating_count__gt=0).exists())
+        product_rating = ProductRating.objects.get(product=p2)
+        self.assertEqual((product_rating.rating_sum, product_rating.rating_count), (4, 1))
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(role=UserRole.UserRoleChoice.client, get_user=True)
+    def test_rebuild_products_rating(self, user: User):
+        p = Product.objects.create(name='Product One', description='Description', price=1.25, cooking_time=3600)
+        Feedback.objects.create(product=p, user=user, rating=4)
+        ProductRating.objects.filter(product=p).update(rating_sum=0, rating_count=10)
+
+        call_command('rebuild_ratings', stdout=StringIO())
+
+        product_rating = ProductRating.objects.get(product=p)
+        self.assertEqual(product_rating.rating_sum, 4)
+        self.assertEqual(product_rating.rating_count, 1)
+
+
+class MenuTestCase(ApiTestCase):
+    def _create_menu(self, size: int, user: User):
+        category = Category.objects.create(name='Category', icon_url='http://icon')
+        for i in range(size):
+            p = Product.objects.create(name=f'Product {i}', description='Description', price=1.25, cooking_time=3600)
+            ProductImage.objects.create(product=p, image_url='http://default-image')
+            ProductImage.objects.create(product=p, image_url='http://image', is_default=False)
+            Availability.objects.create(product=p, available=10)
+            ProductCategory.objects.create(product=p, category=category)
+            Feedback.objects.create(product=p, user=user, rating=4)
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(get_user=True)
+    def test_get_menu(self, user: User):
+        self._create_menu(1, user)
+        Product.objects.create(name='Bare Product', description='Description', price=2.25, cooking_time=1600)
+
+        response = self.client.get('/products/menu/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        product, bare_product = response.data['results']
+        self.assertEqual(product['default_image']['image_url'], 'http://default-image')
+        self.assertEqual(product['availability'], {'available': 10, 'is_available': True, 'is_active': True})
+        self.assertEqual(product['category']['name'], 'Category')
+        self.assertEqual(product['rating'], 4)
+        self.assertIsNone(bare_product['default_image'])
+        self.assertIsNone(bare_product['availability'])
+        self.assertIsNone(bare_product['category'])
+        self.assertIsNone(bare_product['rating'])
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(get_user=True)
+    def test_get_menu_number_of_queries(self, user: User):
+        self._create_menu(30, user)
+
+        # Authentication, catalog versions, pagination count, products and their default images
+        with self.assertNumQueries(5):
+            response = self.client.get('/products/menu/?size=5')
+        self.assertEqual(len(response.data['results']), 5)
+
+        with self.assertNumQueries(5):
+            response = self.client.get('/products/menu/?size=30')
+        self.assertEqual(len(response.data['results']), 30)
+
+
+class ConditionalGetTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = self._create_default_user_and_log_in()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(name='Product', description='Description', price=1.25,
+                                                  cooking_time=3600)
+            Availability.objects.create(product=self.product, available=10)
+
+    def test_not_modified(self):
+        response = self.client.get('/products/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # Authentication and the catalog versions only
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(f'/products/{self.product.pk}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_modified(self):
+        etag = self.client.get('/products/menu/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Feedback.objects.create(product=self.product, user=self.user, rating=5)
+        response = self.client.get('/products/menu/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['rating'], 5)
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(Availability.objects.reserve(self.product.pk, 1))
+        response = self.client.get('/products/menu/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['availability']['available'], 9)
+        self.assertEqual(CatalogVersion.objects.get(name='products.availability').version, 2)
+
+    def test_product_list_modified_by_stock(self):
+        etag = self.client.get('/products/?availability__is_available=true')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(Availability.objects.reserve(self.product.pk, 10))
+        response = self.client.get('/products/?availability__is_available=true', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ResponseCacheTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.administrator)
+        self.category = Category.objects.create(name='Category', icon_url='http://icon')
+
+    def test_response_is_cached(self):
+        response = self.client.get('/products/categories/')
+        self.assertEqual(response.data['count'], 1)
+
+        # Authentication and the catalog versions only
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/categories/')
+        self.assertEqual(response.data['results'][0]['name'], 'Category')
+        self.assertEqual(response.data['count'], 1)
+
+        self.assertEqual(self.client.get('/products/categories/?page=1').status_code, status.HTTP_200_OK)
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'misses': 2})
+
+    def test_ids_are_normalized(self):
+        self.client.get(f'/products/categories/{self.category.pk}/')
+        self.client.get('/products/?ids=2,1')
+        with self.assertNumQueries(2):
+            self.client.get('/products/?ids=1,2')
+
+    def test_response_is_evicted(self):
+        self.client.get('/products/categories/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Renamed'
+            self.category.save()
+        response = self.client.get('/products/categories/')
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Second', icon_url='http://icon')
+        self.assertEqual(self.client.get('/products/categories/').data['count'], 2)
+        self.assertEqual(cache.get_stats(), {'hits': 0, 'misses': 3})
+
+    def test_response_is_evicted_by_other_process(self):
+        self.client.get('/products/categories/')
+
+        # Another process changes the data and the version in the database, but not the cache of this one
+        Category.objects.filter(pk=self.category.pk).update(name='Renamed')
+        CatalogVersion.objects._bump(['products.category'])
+        response = self.client.get('/products/categories/')
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+    def test_get_stats(self):
+        self.client.get('/products/categories/')
+        self.client.get('/products/categories/')
+
+        response = self.client.get('/products/cache-stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'hits': 1, 'misses': 1})
+
+
+class ImageUploadTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.administrator)
+        storage_root = tempfile.TemporaryDirectory()
+        self.addCleanup(storage_root.cleanup)
+        self.storage_root = storage_root.name
+        settings_override = override_settings(IMAGE_STORAGE='products.storage.LocalImageStorage',
+                                              IMAGE_STORAGE_ROOT=self.storage_root, IMAGE_STORAGE_URL='/media/images/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def _create_image(width: int, height: int, image_format: str = 'PNG', color: str = 'red') -> bytes:
+        output = BytesIO()
+        Image.new('RGB', (width, height), color).save(output, format=image_format)
+        return output.getvalue()
+
+    def _upload(self, content: bytes):
+        return self.client.post('/products/images/upload/', content, content_type='application/octet-stream')
+
+    def test_upload_image(self):
+        response = self._upload(self._create_image(2000, 1000))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['width'], response.data['height']), (2000, 1000))
+        self.assertEqual(response.data['url'], response.data['variants']['detail'])
+
+        for variant, size in (('thumbnail', (160, 80)), ('list', (480, 240)), ('detail', (1280, 640))):
+            url = response.data['variants'][variant]
+            self.assertTrue(url.startswith('/media/images/'))
+            with Image.open(os.path.join(self.storage_root, url[len('/media/images/'):])) as image:
+                self.assertEqual(image.size, size)
+
+    def test_upload_duplicate_image(self):
+        content = self._create_image(300, 300, image_format='JPEG')
+        first = self._upload(content)
+        second = self._upload(content)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(UploadedImage.objects.count(), 1)
+
+        self.assertEqual(self._upload(self._create_image(300, 300, color='blue')).status_code,
+                         status.HTTP_201_CREATED)
+
+    def test_upload_invalid_image(self):
+        response = self._upload(b'not an image')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UploadedImage.objects.count(), 0)
+
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=100):
+            response = self._upload(self._create_image(300, 300))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_product_image_references_variants(self):
+        uploaded_image = UploadedImage.objects.get(pk=self._upload(self._create_image(100, 100)).data['id'])
+        product = Product.objects.create(name='Product', description='Description', price=1, cooking_time=60)
+
+        response = self.client.post('/products/images/', {'product': product.pk, 'image_url': uploaded_image.detail_url,
+                                                          'uploaded_image': uploaded_image.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['variants'], uploaded_image.variants)
+
+
+class ValuesReaderTestCase(ApiTestCase):
+    def _assert_same_as_serializer(self, path: str):
+        fast_response = self.client.get(path)
+        self.assertEqual(fast_response.status_code, status.HTTP_200_OK)
+        django_cache.clear()
+        with mock.patch('foody.readers.get_values_reader', return_value=None):
+            response = self.client.get(path)
+        self.assertEqual(fast_response.content, response.content)
+
+    @ApiTestCase.Decorators.create_default_user_and_log_in(get_user=True)
+    def test_output_is_same_as_serializer(self, user: User):
+        category = Category.objects.create(name='Category', icon_url='http://icon')
+        for i in range(3):
+            p = Product.objects.create(name=f'Burger {i}', description='Description', price=1.25 * i, cooking_time=60)
+            Availability.objects.create(product=p, available=i, is_available=bool(i))
+            ProductCategory.objects.create(product=p, category=category)
+            Feedback.objects.create(product=p, user=user, rating=i + 1)
+
+        for path in ('/products/', '/products/?search=burger&size=2', '/products/?availability__is_available=true',
+                     '/products/availabilities/', '/products/categories/', '/products/productCategory/',
+                     '/products/feedback/?mine=true', '/users/roles/', '/users/'):
+            self._assert_same_as_serializer(path)
+
+
+class CatalogTestCase(ApiTestCase):
+    ROWS = [
+        {'name': 'Margherita', 'description': 'Tomatoes and mozzarella', 'price': 7.5, 'cooking_time': 900,
+         'available': 20, 'is_active': True, 'category': {'name': 'Pizza', 'icon_url': 'http://pizza'},
+         'images': [{'url': 'http://margherita/1', 'is_default': True, 'is_external': True},
+                    {'url': 'http://margherita/2', 'is_default': False, 'is_external': True}]},
+        {'name': 'Pepperoni', 'description': 'Salami', 'price': 8.0, 'cooking_time': 900, 'available': 0,
+         'is_active': True, 'category': {'name': 'Pizza', 'icon_url': 'http://pizza'}, 'images': []},
+        {'name': 'Water', 'description': 'Still', 'price': 1.0, 'cooking_time': 0, 'available': None,
+         'is_active': True, 'category': None, 'images': []},
+    ]
+
+    def setUp(self) -> None:
+        super().setUp()
+        self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.administrator)
+
+    def _import(self, rows: list):
+        body = '\n'.join(json.dumps(row) if isinstance(row, dict) else row for row in rows)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/products/catalog/', body, content_type='application/x-ndjson')
+
+    def _export(self, file_format: str = 'jsonl') -> str:
+        response = self.client.get(f'/products/catalog/?file_format={file_format}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_import(self):
+        response = self._import(self.ROWS)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'created': 3, 'updated': 0, 'errors': []})
+
+        margherita = Product.objects.get(name='Margherita')
+        self.assertEqual(margherita.availability.available, 20)
+        self.assertFalse(Product.objects.get(name='Pepperoni').availability.is_available)
+        self.assertEqual(margherita.productcategory.category.name, 'Pizza')
+        self.assertEqual(Category.objects.count(), 1)
+        self.assertEqual(list(ProductImage.objects.filter(product=margherita).values_list('image_url', 'is_default')),
+                         [('http://margherita/1', True), ('http://margherita/2', False)])
+        self.assertFalse(Availability.objects.filter(product__name='Water').exists())
+        self.assertEqual(self.client.get('/products/?search=mozzarella').data['count'], 1)
+
+    def test_import_upserts_by_name(self):
+        self._import(self.ROWS)
+        version = CatalogVersion.objects.get(name='products.product').version
+
+        changed = {**self.ROWS[0], 'price': 9.0, 'available': 5, 'category': 'Pizza',
+                   'images': [{'url': 'http://margherita/2', 'is_default': True, 'is_external': True}]}
+        response = self._import([changed, {**self.ROWS[2], 'name': 'Juice'}])
+        self.assertEqual(response.data, {'created': 1, 'updated': 1, 'errors': []})
+
+        margherita = Product.objects.get(name='Margherita')
+        self.assertEqual((margherita.price, margherita.availability.available), (9.0, 5))
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertEqual(list(ProductImage.objects.filter(product=margherita, is_default=True)
+                              .values_list('image_url', flat=True)), ['http://margherita/2'])
+        self.assertGreater(CatalogVersion.objects.get(name='products.product').version, version)
+
+    def test_import_reports_invalid_rows(self):
+        response = self._import([
+            self.ROWS[0],
+            '{not json',
+            {**self.ROWS[1], 'price': 'free', 'name': ''},
+            {**self.ROWS[2], 'category': {'name': 'Drinks'}},
+        ])
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'], [
+            {'line': 2, 'errors': {'non_field_errors': ['Row must be a JSON object.']}},
+            {'line': 3, 'errors': {'name': ['This field is required.'], 'price': ['A valid number is required.']}},
+            {'line': 4, 'errors': {'category': {'icon_url': ['This field is required for a new category.']}}},
+        ])
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Margherita'])
+
+    def test_import_in_batches(self):
+        rows = [{**self.ROWS[1], 'name': f'Pizza {i}'} for i in range(25)]
+        # The number of the queries depends on the batches, not on the rows. The first batch creates the category
+        with self.assertNumQueries(12 * 3 + 2):
+            result = catalog.import_catalog((json.dumps(row) for row in rows), batch_size=10)
+        self.assertEqual((result.created, result.errors), (25, []))
+
+    def test_export(self):
+        self._import(self.ROWS)
+        self.assertEqual([json.loads(line) for line in self._export().splitlines()], self.ROWS)
+
+    def test_csv_round_trip(self):
+        self._import(self.ROWS)
+        exported = self._export('csv')
+        self.assertEqual(exported.splitlines()[0], ','.join(catalog.CSV_COLUMNS))
+
+        # CSV has no flag of the external images, the flags of the existing images are kept
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/products/catalog/', exported, content_type='text/csv')
+        self.assertEqual(response.data, {'created': 0, 'updated': 3, 'errors': []})
+        self.assertEqual([json.loads(line) for line in self._export().splitlines()], self.ROWS)
+
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/products/catalog/', exported, content_type='text/csv')
+        self.assertEqual(response.data, {'created': 3, 'updated': 0, 'errors': []})
+        exported_again = [json.loads(line) for line in self._export().splitlines()]
+        # CSV keeps only the urls of the images
+        self.assertEqual(exported_again[0]['images'], [
+            {'url': 'http://margherita/1', 'is_default': True, 'is_external': False},
+            {'url': 'http://margherita/2', 'is_default': False, 'is_external': False},
+        ])
+        self.assertEqual([{**row, 'images': []} for row in exported_again],
+                         [{**row, 'images': []} for row in self.ROWS])
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.jsonl')
+            with open(path, 'w') as file:
+                file.writelines(json.dumps(row) + '\n' for row in self.ROWS)
+            out = StringIO()
+            call_command('import_catalog', path, stdout=out)
+            self.assertIn('Created 3 products', out.getvalue())
+
+            out = StringIO()
+            call_command('export_catalog', stdout=out)
+            self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], self.ROWS)
+
+    def test_catalog_requires_administrator(self):
+        client = self._create_user_model(email='client@foody.local', is_email_confirmed=True)
+        UserRole.objects.create(user=client, role=UserRole.UserRoleChoice.client.name, is_confirmed=True)
+        self._login(client)
+        self.assertEqual(self.client.get('/products/catalog/').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self._import(self.ROWS).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class SoftDeleteTestCase(ApiTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.administrator)
+        self.category = Category.objects.create(name='Pizza', icon_url='http://icon')
+        self.products = [self._create_product(f'Pizza {i}') for i in range(3)]
+
+    def _create_product(self, name: str) -> Product:
+        product = Product.objects.create(name=name, description='Description', price=1, cooking_time=60)
+        Availability.objects.create(product=product, available=10)
+        ProductCategory.objects.create(product=product, category=self.category)
+        ProductImage.objects.create(product=product, image_url='http://image')
+        Feedback.objects.create(product=product, user=self.user, rating=5)
+        for _ in range(3):
+            order = Order.objects.create(product=product, user=self.user, count=1, price=1, cooking_time=60)
+            OrderExecution.objects.create(order=order, executor=self.user, status=OrderExecution.Status.cooking)
+        History.objects.create(product=product, user=self.user, count=1, price=1, cooking_time=60,
+                               executor=self.user, finish_time=timezone.now(), delivery_address='Address')
+        return product
+
+    def test_delete_many_is_single_update(self):
+        ids = ','.join(str(product.pk) for product in self.products[:2])
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/products/delete_many/?ids={ids}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        writes = [query['sql'] for query in queries if not query['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len([sql for sql in writes if 'products_product' in sql]), 1)
+        self.assertTrue(writes[0].startswith('UPDATE "products_product" SET "is_deleted"'))
+
+        self.assertEqual(list(Product.objects.all()), [self.products[2]])
+        self.assertEqual(Product.all_objects.count(), 3)
+        self.assertEqual(Order.objects.count(), 9)
+        self.assertEqual(self.client.get(f'/products/{self.products[0].pk}/').status_code, status.HTTP_404_NOT_FOUND)
+        for path in ('/products/', '/products/availabilities/', '/products/images/', '/products/productCategory/',
+                     '/products/feedback/'):
+            self.assertEqual(self.client.get(path).data['count'], 1, path)
+
+    def test_destroy_is_soft(self):
+        response = self.client.delete(f'/products/categories/{self.category.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(Category.all_objects.get(pk=self.category.pk).is_deleted)
+        self.assertEqual(self.client.get('/products/productCategory/').data['count'], 0)
+        self.assertEqual(self.client.get('/products/').data['count'], 3)
+
+    def test_deleted_category_is_not_in_menu(self):
+        response = self.client.delete(f'/products/categories/delete_many/?ids={self.category.pk}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get('/products/menu/')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([product['category'] for product in response.data['results']], [None] * 3)
+
+    def test_deleted_flag_is_not_exposed(self):
+        response = self.client.patch(f'/products/{self.products[0].pk}/', {'is_deleted': True, 'price': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('is_deleted', response.data)
+        self.assertFalse(Product.all_objects.get(pk=self.products[0].pk).is_deleted)
+        self.assertNotIn('is_deleted', self.client.get('/products/categories/').data['results'][0])
+
+    def test_purge(self):
+        Product.objects.filter(pk__in=[product.pk for product in self.products[:2]]).soft_delete()
+        progress = []
+        purger = CatalogPurger(batch_size=2, on_progress=lambda *args: progress.append(args))
+        self.assertEqual(purger.pending(), 2)
+        self.assertEqual(purger.purge(), 2)
+
+        self.assertEqual(purger.progress, {
+            'products.product': 2, 'products.productimage': 2, 'products.feedback': 2, 'products.productrating': 2,
+            'products.availability': 2, 'products.productcategory': 2, 'orders.order': 6,
+            'orders.orderexecution': 6, 'orders.history': 2,
+        })
+        # Batches are bounded by the batch size
+        self.assertIn(('orders.orderexecution', 2, 2), progress)
+        self.assertTrue(all(count <= 2 for _, count, _ in progress))
+        self.assertEqual(Product.all_objects.count(), 1)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(OrderExecution.objects.count(), 3)
+        self.assertEqual(History.objects.count(), 1)
+        self.assertEqual(purger.pending(), 0)
+        self.assertEqual(purger.purge(), 0)
+
+    def test_purge_category(self):
+        Category.objects.all().soft_delete()
+        out = StringIO()
+        call_command('purge_catalog', '--once', stdout=out)
+        self.assertIn('Purged 3 products.productcategory, 1 products.category', out.getvalue())
+        self.assertEqual(Category.all_objects.count(), 0)
+        self.assertEqual(Product.objects.count(), 3)
@@ -2,7 +2,7 @@ from django.urls import path
 from rest_framework import routers
 
 from products.views import ProductView, ProductImageView, ImageUploadView, AvailabilityView, CategoryView, \
-    ProductCategoryView, FeedbackView
+    ProductCategoryView, FeedbackView, MenuView, ResponseCacheStatsView, CatalogView
 
 router = routers.SimpleRouter()
 router.register('images', ProductImageView)
@@ -10,7 +10,10 @@ router.register('availabilities', AvailabilityView)
 router.register('categories', CategoryView)
 router.register('feedback', FeedbackView)
 router.register('productCategory', ProductCategoryView)
+router.register('menu', MenuView, basename='menu')
 router.register('', ProductView)
 urlpatterns = [
-                  path('images/upload/', ImageUploadView.as_view())
+                  path('images/upload/', ImageUploadView.as_view()),
+                  path('cache-stats/', ResponseCacheStatsView.as_view()),
+                  path('catalog/', CatalogView.as_view()),
               ] + router.urls
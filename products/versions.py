@@ -0,0 +1,46 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db.models import Model
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from products.models import CatalogVersion
+
+
+class ConditionalGetMixin(object):
+    """
+    Answers the `If-None-Match` and `If-Modified-Since` requests of `list` and `retrieve` with 304 Not Modified while
+    none of the `versioned_models` has changed. The versions are checked before any queryset is evaluated.
+    The models must bump their `CatalogVersion` on every change, see `products.signals`
+    """
+    versioned_models: Iterable[Model] = ()
+    # Versions of `versioned_models` read by the current request
+    catalog_versions: Optional[Dict[str, Tuple[int, object]]] = None
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_response(request, super().retrieve, *args, **kwargs)
+
+    def _conditional_response(self, request, handler, *args, **kwargs):
+        names = [model._meta.label_lower for model in self.versioned_models]
+        versions = self.catalog_versions = CatalogVersion.objects.get_versions(names)
+        # The renderer is part of the tag, the same resource is represented differently by JSON and browsable API
+        etag = quote_etag('-'.join([request.accepted_renderer.format] + [str(versions.get(name, (0,))[0])
+                                                                         for name in names]))
+        last_modified = self._get_last_modified(versions.values())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    @staticmethod
+    def _get_last_modified(versions) -> Optional[int]:
+        updated_at = [updated_at for _, updated_at in versions]
+        return int(max(updated_at).timestamp()) if updated_at else None
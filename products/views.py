@@ -1,30 +1,92 @@
-from cloudinary import uploader
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import viewsets, views, status, mixins, filters
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from rest_framework import viewsets, views, status, mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from foody.permissions import IsAdministrator, IsAuthenticatedAndConfirmed
-from products.models import Product, ProductImage, Availability, Category, ProductCategory, Feedback
+from foody.permissions import IsAdministrator, IsAuthenticatedAndConfirmed, IsStrictAdministrator
+from foody.readers import ValuesListMixin
+from products import cache, catalog
+from products.cache import CachedResponseMixin
+from products.images import upload_image
+from products.models import Product, ProductImage, Availability, Category, ProductCategory, Feedback, \
+    ProductRating
+from products.search import ProductSearchFilter
 from products.serializers import ProductSerializer, ProductImageSerializer, AvailabilitySerializer, CategorySerializer, \
-    ProductCategorySerializer, FeedbackSerializer
+    ProductCategorySerializer, FeedbackSerializer, MenuProductSerializer, UploadedImageSerializer
+from products.versions import ConditionalGetMixin
 
 
 class ImageUploadView(views.APIView):
-    @staticmethod
-    def post(request):
-        response = uploader.upload(request.body)
-        return Response(data={'url': response['secure_url']}, status=201)
+    @swagger_auto_schema(request_body=openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_BINARY),
+                         responses={status.HTTP_201_CREATED: UploadedImageSerializer,
+                                    status.HTTP_200_OK: UploadedImageSerializer})
+    def post(self, request):
+        if request.stream is None:
+            raise ValidationError('Image is not given')
+        uploaded_image, created = upload_image(request.stream)
+        return Response(data=UploadedImageSerializer(uploaded_image).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
-class ProductView(viewsets.ModelViewSet):
+class ResponseCacheStatsView(views.APIView):
+    permission_classes = [IsAuthenticatedAndConfirmed, IsStrictAdministrator]
+
+    @swagger_auto_schema(responses={
+        status.HTTP_200_OK: openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+            'hits': openapi.Schema(type=openapi.TYPE_INTEGER),
+            'misses': openapi.Schema(type=openapi.TYPE_INTEGER)
+        })
+    })
+    def get(self, request):
+        return Response(cache.get_stats())
+
+
+class CatalogView(views.APIView):
+    permission_classes = [IsAuthenticatedAndConfirmed, IsStrictAdministrator]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('file_format', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(catalog.FORMATS))
+    ], responses={status.HTTP_200_OK: 'JSON lines or CSV file of the whole catalog'})
+    def get(self, request):
+        file_format = request.query_params.get('file_format', 'jsonl')
+        if file_format not in catalog.FORMATS:
+            raise ValidationError(f'File format must be one of: {", ".join(catalog.FORMATS)}')
+        response = StreamingHttpResponse(catalog.export_catalog(file_format),
+                                         content_type=catalog.CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="catalog.{file_format}"'
+        return response
+
+    @swagger_auto_schema(request_body=openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_BINARY),
+                         responses={status.HTTP_200_OK: openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                             'created': openapi.Schema(type=openapi.TYPE_INTEGER),
+                             'updated': openapi.Schema(type=openapi.TYPE_INTEGER),
+                             'errors': openapi.Schema(type=openapi.TYPE_ARRAY,
+                                                      items=openapi.Schema(type=openapi.TYPE_OBJECT))
+                         })})
+    def post(self, request):
+        """
+        Imports the catalog file given in the body. It is read as CSV if the content type is `text/csv`,
+        otherwise as JSON lines. See products.catalog for the format of the rows
+        """
+        if request.stream is None:
+            raise ValidationError('Catalog is not given')
+        file_format = 'csv' if request.content_type.startswith(catalog.CONTENT_TYPES['csv']) else 'jsonl'
+        return Response(catalog.import_catalog(request.stream, file_format).as_dict())
+
+
+class ProductView(ConditionalGetMixin, CachedResponseMixin, ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
+    use_read_replica = True
+    versioned_models = [Product, Availability]
     queryset = Product.objects.all()
     permission_classes = [IsAdministrator, IsAuthenticatedAndConfirmed]
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
+    filter_backends = [ProductSearchFilter, DjangoFilterBackend]
     search_fields = ['name']
     filterset_fields = ['availability__is_available', 'availability__is_active']
 
@@ -35,9 +97,13 @@ class ProductView(viewsets.ModelViewSet):
     def delete_many(self, request):
         ids = request.query_params.get('ids', None)
         if ids:
-            self.queryset.filter(id__in=ids.split(',')).delete()
+            self.queryset.filter(id__in=ids.split(',')).soft_delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def perform_destroy(self, instance):
+        # The rows which cascade from the deleted one are removed later by the purge_catalog worker
+        self.queryset.filter(pk=instance.pk).soft_delete()
+
     def get_queryset(self):
         product_query = self.request.query_params.get('ids', None)
         if product_query:
@@ -53,9 +119,43 @@ class ProductView(viewsets.ModelViewSet):
         return super().list(request, *args, **kwargs)
 
 
-class ProductImageView(viewsets.ModelViewSet):
+class MenuView(ConditionalGetMixin,
+               mixins.ListModelMixin,
+               mixins.RetrieveModelMixin,
+               GenericViewSet):
+    serializer_class = MenuProductSerializer
+    use_read_replica = True
+    versioned_models = [Product, ProductImage, Availability, Category, ProductCategory, ProductRating]
+    queryset = Product.objects.select_related('availability', 'productcategory__category', 'productrating') \
+        .prefetch_related(Prefetch('productimage_set', queryset=ProductImage.objects.filter(is_default=True)
+                                   .select_related('uploaded_image'),
+                                   to_attr='default_images')) \
+        .order_by('id')
+    permission_classes = [IsAuthenticatedAndConfirmed]
+    filter_backends = [ProductSearchFilter, DjangoFilterBackend]
+    search_fields = ['name']
+    filterset_fields = ['availability__is_available', 'availability__is_active', 'productcategory__category']
+
+    def get_queryset(self):
+        product_query = self.request.query_params.get('ids', None)
+        if product_query:
+            products = product_query.split(',')
+            return super().get_queryset().filter(id__in=products)
+        else:
+            return super().get_queryset()
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter(name='ids', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING)
+    ])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class ProductImageView(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     serializer_class = ProductImageSerializer
-    queryset = ProductImage.objects.all()
+    use_read_replica = True
+    versioned_models = [ProductImage]
+    queryset = ProductImage.objects.filter(product__is_deleted=False).select_related('uploaded_image')
     permission_classes = [IsAdministrator, IsAuthenticatedAndConfirmed]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['is_default']
@@ -75,13 +175,17 @@ class ProductImageView(viewsets.ModelViewSet):
             return super().get_queryset()
 
 
-class AvailabilityView(mixins.CreateModelMixin,
+class AvailabilityView(ConditionalGetMixin,
+                       ValuesListMixin,
+                       mixins.CreateModelMixin,
                        mixins.RetrieveModelMixin,
                        mixins.UpdateModelMixin,
                        mixins.ListModelMixin,
                        GenericViewSet):
     serializer_class = AvailabilitySerializer
-    queryset = Availability.objects.all()
+    use_read_replica = True
+    versioned_models = [Availability]
+    queryset = Availability.objects.filter(product__is_deleted=False)
     permission_classes = [IsAdministrator, IsAuthenticatedAndConfirmed]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['product']
@@ -102,8 +206,10 @@ class AvailabilityView(mixins.CreateModelMixin,
         return super().list(request, *args, **kwargs)
 
 
-class CategoryView(viewsets.ModelViewSet):
+class CategoryView(ConditionalGetMixin, CachedResponseMixin, ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
+    use_read_replica = True
+    versioned_models = [Category]
     queryset = Category.objects.all()
     permission_classes = [IsAdministrator, IsAuthenticatedAndConfirmed]
 
@@ -114,25 +220,33 @@ class CategoryView(viewsets.ModelViewSet):
     def delete_many(self, request):
         ids = request.query_params.get('ids', None)
         if ids:
-            self.queryset.filter(id__in=ids.split(',')).delete()
+            self.queryset.filter(id__in=ids.split(',')).soft_delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def perform_destroy(self, instance):
+        # The rows which cascade from the deleted one are removed later by the purge_catalog worker
+        self.queryset.filter(pk=instance.pk).soft_delete()
+
 
-class ProductCategoryView(viewsets.ModelViewSet):
+class ProductCategoryView(ConditionalGetMixin, ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = ProductCategorySerializer
-    queryset = ProductCategory.objects.all()
+    use_read_replica = True
+    versioned_models = [ProductCategory]
+    queryset = ProductCategory.objects.filter(product__is_deleted=False, category__is_deleted=False)
     permission_classes = [IsAdministrator, IsAuthenticatedAndConfirmed]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['product']
     lookup_field = 'product'
 
 
-class FeedbackView(mixins.CreateModelMixin,
+class FeedbackView(ValuesListMixin,
+                   mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.ListModelMixin,
                    GenericViewSet):
     serializer_class = FeedbackSerializer
-    queryset = Feedback.objects.all()
+    use_read_replica = True
+    queryset = Feedback.objects.filter(product__is_deleted=False)
     permission_classes = [IsAuthenticatedAndConfirmed]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['product']
@@ -177,10 +291,11 @@ class FeedbackView(mixins.CreateModelMixin,
     @action(methods=['GET'], detail=False, url_path='product-rating')
     def products_rating(self, request):
         product_ids = request.query_params['product_ids'].split(',')
+        ratings = {product_rating.product_id: product_rating.rating
+                   for product_rating in ProductRating.objects.filter(product_id__in=product_ids,
+                                                                      rating_count__gt=0)}
         response = []
         for product_id in product_ids:
-            feedbacks = Feedback.objects.filter(product_id=product_id)
-            if feedbacks:
-                rating = sum(map(lambda f: f.rating, feedbacks)) / feedbacks.count()
-                response.append({'product': product_id, 'rating': rating})
+            if int(product_id) in ratings:
+                response.append({'product': product_id, 'rating': ratings[int(product_id)]})
         return Response(response)
@@ -1,5 +1,34 @@
+from django.core import signing
+from django.db import router
+from rest_framework import exceptions
 from rest_framework.authentication import TokenAuthentication
 
+from users.models import User
+from users.tokens import is_access_token, read_access_token
+
 
 class AuthenticationToken(TokenAuthentication):
+    """
+    Accepts both the DRF tokens stored in the database and the signed access tokens. The latter are verified
+    without any query. The user of a signed token has only the fields of the token payload loaded, the other fields
+    are deferred and loaded from the database when they are read, and a save writes only the loaded fields.
+
+    A signed token stays valid until it expires, even if its user is deactivated or deleted in the meantime.
+    The tokens are short-lived, see `ACCESS_TOKEN_LIFETIME`, and they are not refreshed for such users
+    """
     keyword: str = 'Bearer'
+
+    def authenticate_credentials(self, key):
+        if not is_access_token(key):
+            return super().authenticate_credentials(key)
+
+        try:
+            access_token = read_access_token(key)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        user = User.from_db(router.db_for_read(User), ['id', 'is_email_confirmed'],
+                            [access_token.user_id, access_token.is_email_confirmed])
+        return user, access_token
@@ -1,28 +1,79 @@
-from typing import List
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List, Optional
 
 import requests
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
 from foody.settings import env
-from users.models import User, UserRole
+from users.models import User, UserRole, OutgoingEmail
 
+logger = logging.getLogger(__name__)
 
-class EmailManager(object):
+
+class MailgunTransport(object):
     END_POINT: str = 'https://api.mailgun.net/v3/{domain_name}/messages'
 
-    def __init__(self, api_key: str, domain_name: str) -> None:
-        self._full_url = self.END_POINT.format(domain_name=domain_name)
-        self._api_key: str = api_key
-        self._from: str = f'Test Foody <mailgun@{domain_name}>'
+    def __init__(self, api_key: str = None, domain_name: str = None) -> None:
+        self._full_url = self.END_POINT.format(domain_name=domain_name or env('MAILGUN_DOMAIN_NAME'))
+        self._api_key: str = api_key or env('MAILGUN_API_KEY')
+        self._local = threading.local()
 
-    def send_email(self, to: List[str], subject: str, message: str) -> None:
-        response = requests.post(self._full_url, auth=('api', self._api_key), data={
-            'from': self._from,
+    @property
+    def _session(self) -> requests.Session:
+        # Sessions keep the connection to Mailgun alive, one per worker thread
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            self._local.session.auth = ('api', self._api_key)
+        return self._local.session
+
+    def send(self, sender: str, to: List[str], subject: str, message: str) -> None:
+        response = self._session.post(self._full_url, data={
+            'from': sender,
             'to': to,
             'subject': subject,
             'html': message,
         })
         response.raise_for_status()
 
+
+class FakeTransport(object):
+    """
+    Transport which keeps the sent emails in memory instead of sending them. It is used by tests
+    """
+    def __init__(self, fail: bool = False) -> None:
+        self.sent: List[dict] = []
+        self.fail: bool = fail
+
+    def send(self, sender: str, to: List[str], subject: str, message: str) -> None:
+        if self.fail:
+            raise requests.HTTPError('Fake transport failure')
+        self.sent.append({'from': sender, 'to': to, 'subject': subject, 'html': message})
+
+
+def create_transport():
+    return import_string(settings.EMAIL_TRANSPORT)()
+
+
+class EmailManager(object):
+    def __init__(self, domain_name: str) -> None:
+        self._from: str = f'Test Foody <mailgun@{domain_name}>'
+
+    def send_email(self, to: List[str], subject: str, message: str) -> OutgoingEmail:
+        """
+        Puts the email to the outbox. It is sent later by the `send_emails` worker
+
+        :param to: recipients of the email
+        :param subject: subject of the email
+        :param message: html body of the email
+        :return: created outbox item
+        """
+        return OutgoingEmail.objects.create(sender=self._from, to=','.join(to), subject=subject, message=message)
+
     def send_email_confirmation_to_client(self, confirmation_endpoint: str, client: User) -> None:
         self.send_email([client.email], "Confirm Email", message=f"""
             <html>
@@ -33,20 +84,79 @@ class EmailManager(object):
             </html>
         """)
 
-    def send_executor_request_to_administrators(self, user_role: UserRole):
-        administrators = UserRole.objects.filter(role=UserRole.UserRoleChoice.administrator.name)
+    def send_executor_request_to_administrators(self, user: User):
+        administrators = UserRole.objects.filter(role=UserRole.UserRoleChoice.administrator.name).select_related('user')
         for admin in administrators:
-            self.send_email(admin.user.email, "Executor request", message=f"""
+            self.send_email([admin.user.email], "Executor request", message=f"""
             <html>
                 <h3>Dear {admin.user.full_name}</h3></br>
-                <p>{user_role.user.full_name} requested to become an Executor!</p></br>
+                <p>{user.full_name} requested to become an Executor!</p></br>
                 <p>Go to the application and accept him :)</p></br>
                 </br>
             </html>
             """)
 
 
+class EmailOutboxWorker(object):
+    MAX_ATTEMPTS: int = 5
+    RETRY_DELAY: int = 30
+    LEASE_TIME: int = 300
+
+    def __init__(self, transport, max_workers: int = 4, batch_size: int = 100) -> None:
+        self._transport = transport
+        self._max_workers = max_workers
+        self._batch_size = batch_size
+
+    def drain(self) -> int:
+        """
+        Sends the emails from the outbox which are due, until there is none of them left
+
+        :return: number of processed emails
+        """
+        processed = 0
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            while True:
+                emails = self._claim_batch()
+                if not emails:
+                    return processed
+                for email, error in zip(emails, executor.map(self._deliver, emails)):
+                    self._record(email, error)
+                processed += len(emails)
+
+    def _claim_batch(self) -> List[OutgoingEmail]:
+        now = timezone.now()
+        lease_until = now + timedelta(seconds=self.LEASE_TIME)
+        claimed = []
+        for email in OutgoingEmail.objects.filter(status=OutgoingEmail.Status.pending,
+                                                  next_attempt_at__lte=now)[:self._batch_size]:
+            # The conditional update makes sure that another worker has not taken the email in the meantime
+            if OutgoingEmail.objects.filter(pk=email.pk, next_attempt_at=email.next_attempt_at) \
+                    .update(next_attempt_at=lease_until):
+                claimed.append(email)
+        return claimed
+
+    def _deliver(self, email: OutgoingEmail) -> Optional[Exception]:
+        try:
+            self._transport.send(email.sender, email.recipients, email.subject, email.message)
+        except Exception as error:
+            # Any failure of the transport is recorded as an attempt, otherwise the email would be retried forever
+            return error
+        return None
+
+    def _record(self, email: OutgoingEmail, error: Optional[Exception]) -> None:
+        email.attempts += 1
+        if error is None:
+            email.status = OutgoingEmail.Status.sent
+        else:
+            email.last_error = str(error)
+            if email.attempts >= self.MAX_ATTEMPTS:
+                email.status = OutgoingEmail.Status.failed
+                logger.error('Email %s has not been sent after %s attempts: %s', email.pk, email.attempts, error)
+            else:
+                email.next_attempt_at = timezone.now() + timedelta(seconds=self.RETRY_DELAY * 2 ** (email.attempts - 1))
+        email.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error'])
+
+
 email_manager_instance = EmailManager(
-    api_key=env('MAILGUN_API_KEY'),
     domain_name=env('MAILGUN_DOMAIN_NAME')
 )
@@ -0,0 +1,52 @@
+import json
+
+from django.db import transaction
+from django.core.management import BaseCommand
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from users.models import User, UserRole
+from users.tokens import issue_access_token
+from utils.benchmark import run_benchmark
+
+
+class _AuthenticatedView(APIView):
+    def get(self, request):
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class Command(BaseCommand):
+    help = 'Compares requests per second of the requests authenticated by DRF tokens and by signed access tokens. ' \
+           'The benchmark user is created in a transaction which is rolled back at the end'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        view = _AuthenticatedView.as_view()
+        factory = APIRequestFactory()
+
+        with transaction.atomic():
+            user = User.objects.create_user(email='benchmark@foody.local', password=None, first_name='Benchmark',
+                                            last_name='Benchmark', phone_number='0', is_email_confirmed=True)
+            UserRole.objects.create(user=user, role=UserRole.UserRoleChoice.client.name, is_confirmed=True)
+            keys = {
+                'token': Token.objects.create(user=user).key,
+                'signed': issue_access_token(user)
+            }
+
+            results = []
+            for name, key in keys.items():
+                request = factory.get('/', HTTP_AUTHORIZATION=f'Bearer {key}')
+                results.append(run_benchmark(f'auth:{name}', lambda: view(request), options['iterations']))
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps([result.as_dict() for result in results], indent=2))
+        else:
+            for result in results:
+                self.stdout.write(str(result))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management import BaseCommand
+
+from users.mail import EmailOutboxWorker, create_transport
+
+
+class Command(BaseCommand):
+    help = 'Sends the emails from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of the sending threads')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of the emails claimed at once')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        worker = EmailOutboxWorker(create_transport(), max_workers=options['workers'],
+                                   batch_size=options['batch_size'])
+        while True:
+            processed = worker.drain()
+            if processed:
+                self.stdout.write(f'Processed {processed} emails')
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
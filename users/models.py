@@ -1,8 +1,12 @@
 import random
+import secrets
 import string
+from datetime import timedelta
+from typing import List
 
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
+from django.utils import timezone
 
 from users.manages import UserManager
 from django.db import models
@@ -49,11 +53,12 @@ class UserRole(models.Model):
 
     class Meta:
         unique_together = ['user', 'role']
+        indexes = [models.Index(fields=['role', 'is_confirmed'])]
 
 
 class RegistrationToken(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    token = models.CharField('token', max_length=50, blank=False)
+    token = models.CharField('token', max_length=50, blank=False, db_index=True)
 
     @classmethod
     def create_token(cls, user: User) -> str:
@@ -70,3 +75,53 @@ class RegistrationToken(models.Model):
         token = _token_generator()
         cls.objects.update_or_create(user=user, token=token)
         return token
+
+
+class RefreshToken(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField('key', max_length=100, unique=True)
+    created_at = models.DateTimeField('created_at', auto_now_add=True)
+    expires_at = models.DateTimeField('expires_at')
+    is_revoked = models.BooleanField('is_revoked', default=False)
+
+    @classmethod
+    def create_token(cls, user: User, lifetime: int) -> 'RefreshToken':
+        """
+        Creates a refresh token for a given User
+
+        :param user: user for who need to generate token
+        :param lifetime: number of seconds the token is valid for
+        :return: created token
+        """
+        return cls.objects.create(user=user, key=secrets.token_urlsafe(48),
+                                  expires_at=timezone.now() + timedelta(seconds=lifetime))
+
+    def __str__(self):
+        return f'{self.user.email}: {"revoked" if self.is_revoked else self.expires_at}'
+
+
+class OutgoingEmail(models.Model):
+    class Status(models.TextChoices):
+        pending: tuple = ('pending', 'pending')
+        sent: tuple = ('sent', 'sent')
+        failed: tuple = ('failed', 'failed')
+
+    sender = models.CharField('sender', max_length=200, blank=False)
+    to = models.CharField('to', max_length=2000, blank=False)
+    subject = models.CharField('subject', max_length=200, blank=False)
+    message = models.TextField('message')
+    status = models.CharField('status', choices=Status.choices, max_length=15, default=Status.pending)
+    attempts = models.IntegerField('attempts', default=0)
+    next_attempt_at = models.DateTimeField('next_attempt_at', default=timezone.now)
+    last_error = models.TextField('last_error', blank=True)
+    created_at = models.DateTimeField('created_at', auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    @property
+    def recipients(self) -> List[str]:
+        return self.to.split(',')
+
+    def __str__(self):
+        return f'[{self.status}] {self.subject} -> {self.to}'
@@ -0,0 +1,53 @@
+from typing import Optional, NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from users.models import User, UserRole
+
+
+class ResolvedRole(NamedTuple):
+    role: str
+    is_confirmed: bool
+
+
+_NO_ROLE = ResolvedRole(role='', is_confirmed=False)
+
+
+def _cache_key(user_id: int) -> str:
+    return f'user-role:{user_id}'
+
+
+def resolve_user_role(user: User, request=None) -> Optional[ResolvedRole]:
+    """
+    Returns the role of the given user. The result is memoized on the request and cached
+    in the Django cache, which is invalidated by the UserRole signals
+
+    :param user: user whose role is resolved
+    :param request: current request, if given the role is memoized on it
+    :return: role of the user or None if the user does not have any
+    """
+    if not user or not user.is_authenticated:
+        return None
+
+    access_token_role = getattr(getattr(request, 'auth', None), 'role', _NO_ROLE)
+    if access_token_role != _NO_ROLE:
+        # Signed access tokens carry the role, None means that the user does not have any
+        return access_token_role
+
+    if request is not None and getattr(request, '_resolved_user_role', None) is not None:
+        resolved_role = request._resolved_user_role
+    else:
+        resolved_role = cache.get(_cache_key(user.pk))
+        if resolved_role is None:
+            user_role = UserRole.objects.filter(user=user).values_list('role', 'is_confirmed').first()
+            resolved_role = ResolvedRole(*user_role) if user_role else _NO_ROLE
+            cache.set(_cache_key(user.pk), resolved_role, settings.ROLE_CACHE_TIMEOUT)
+        if request is not None:
+            request._resolved_user_role = resolved_role
+
+    return None if resolved_role == _NO_ROLE else resolved_role
+
+
+def invalidate_user_role(user_id: int) -> None:
+    cache.delete(_cache_key(user_id))
@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import UserRole
+from users.roles import invalidate_user_role
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_cached_user_role(sender, instance: UserRole, **kwargs):
+    # Invalidated once committed, otherwise a concurrent request could cache the old role again
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_user_role(user_id), using=kwargs['using'])
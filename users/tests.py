@@ -1,7 +1,12 @@
-from unittest.mock import patch
+from unittest.mock import Mock, patch
+
+from django.test import override_settings
+from django.utils import timezone
 from rest_framework import status
 
-from users.models import User, UserRole, RegistrationToken
+from users.authentication import AuthenticationToken
+from users.mail import EmailOutboxWorker, FakeTransport
+from users.models import User, UserRole, RegistrationToken, OutgoingEmail, RefreshToken
 from utils.tests import ApiTestCase
 
 
@@ -48,7 +53,8 @@ class RegistrationTestCase(ApiTestCase):
         user = self._create_user_model()
         UserRole.objects.create(user=user, role=UserRole.UserRoleChoice.executor.name)
         token = RegistrationToken.objects.create(user=user, token='123456')
-        response = self.client.get(f'/users/confirm/{self.DEFAULT_EMAIL}/{token.token}')
+        with self.assertQueriesUseIndexes():
+            response = self.client.get(f'/users/confirm/{self.DEFAULT_EMAIL}/{token.token}')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         email_manager_instance.send_executor_request_to_administrators.assert_called_once()
 
@@ -181,3 +187,177 @@ class UserRolesTestCase(ApiTestCase):
         some_user = self._create_user_model(email='some.user@email.com')
         response = self.client.patch(f'/users/{some_user.pk}', {'first_name': 'Yurii'})
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class EmailOutboxTestCase(ApiTestCase):
+    def test_registration_puts_email_to_outbox(self):
+        response = self._register_user()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipients, [self.DEFAULT_EMAIL])
+        self.assertEqual(email.status, OutgoingEmail.Status.pending)
+
+    def test_worker_sends_emails(self):
+        self._register_user()
+        transport = FakeTransport()
+
+        self.assertEqual(EmailOutboxWorker(transport).drain(), 1)
+
+        self.assertEqual(len(transport.sent), 1)
+        self.assertEqual(transport.sent[0]['to'], [self.DEFAULT_EMAIL])
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.Status.sent)
+        self.assertEqual(EmailOutboxWorker(transport).drain(), 0)
+
+    def test_worker_retries_with_backoff(self):
+        self._register_user()
+        worker = EmailOutboxWorker(FakeTransport(fail=True))
+
+        self.assertEqual(worker.drain(), 1)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.status, OutgoingEmail.Status.pending)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(worker.drain(), 0)
+
+        OutgoingEmail.objects.update(attempts=EmailOutboxWorker.MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        with self.assertLogs('users.mail', level='ERROR'):
+            self.assertEqual(worker.drain(), 1)
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.Status.failed)
+
+    def test_worker_records_unexpected_transport_errors(self):
+        self._register_user()
+        transport = FakeTransport()
+        transport.send = Mock(side_effect=ValueError('Invalid recipient'))
+
+        self.assertEqual(EmailOutboxWorker(transport).drain(), 1)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, 'Invalid recipient')
+
+
+class UserRoleCacheTestCase(ApiTestCase):
+    def test_executor_permission_does_not_query_roles_when_cached(self):
+        self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.executor)
+        self.client.get('/orders/current_order_execution')
+
+        # Authentication and the order execution lookup
+        with self.assertNumQueries(2):
+            response = self.client.get('/orders/current_order_execution')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_role_is_invalidated_on_become_cook(self):
+        user = self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.client)
+        self.assertEqual(self.client.get('/orders/current_order_execution').status_code, status.HTTP_403_FORBIDDEN)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/users/become-cook/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.get('/orders/current_order_execution').status_code, status.HTTP_403_FORBIDDEN)
+
+        user_role = UserRole.objects.get(user=user)
+        user_role.is_confirmed = True
+        with self.captureOnCommitCallbacks() as callbacks:
+            user_role.save()
+            # The cached role is kept until the change is committed
+            self.assertEqual(self.client.get('/orders/current_order_execution').status_code,
+                             status.HTTP_403_FORBIDDEN)
+        callbacks[0]()
+        self.assertEqual(self.client.get('/orders/current_order_execution').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_role_is_invalidated_on_role_update(self):
+        user = self._create_user_model(email='user@test.email', is_email_confirmed=True)
+        UserRole.objects.create(user=user, role=UserRole.UserRoleChoice.client, is_confirmed=True)
+        self._login(user)
+        self.assertEqual(self.client.get('/orders/current_order_execution').status_code, status.HTTP_403_FORBIDDEN)
+
+        self._create_default_user_and_log_in(role=UserRole.UserRoleChoice.administrator)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/users/role/{user.pk}', {'role': UserRole.UserRoleChoice.executor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self._login(user)
+        self.assertEqual(self.client.get('/orders/current_order_execution').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SignedTokenTestCase(ApiTestCase):
+    def _signed_login(self, user: User) -> dict:
+        response = self.client.post('/api-token-auth/', {'username': user.email, 'password': self.DEFAULT_PASSWORD,
+                                                         'mode': 'signed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["token"]}')
+        return response.data
+
+    def test_signed_token_is_verified_without_queries(self):
+        user = self._create_user_model(is_email_confirmed=True)
+        UserRole.objects.create(user=user, role=UserRole.UserRoleChoice.executor.name, is_confirmed=True)
+        self._signed_login(user)
+
+        # Only the order execution lookup
+        with self.assertNumQueries(1):
+            response = self.client.get('/orders/current_order_execution')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_signed_token_carries_role_and_email_confirmation(self):
+        user = self._create_user_model(is_email_confirmed=False)
+        UserRole.objects.create(user=user, role=UserRole.UserRoleChoice.client.name, is_confirmed=True)
+        self._signed_login(user)
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_403_FORBIDDEN)
+
+        user = self._create_user_model(email='executor@email.com', is_email_confirmed=True)
+        UserRole.objects.create(user=user, role=UserRole.UserRoleChoice.client.name, is_confirmed=True)
+        self._signed_login(user)
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/orders/current_order_execution').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_signed_token_user_loads_deferred_fields(self):
+        user = self._create_user_model(is_email_confirmed=True)
+        tokens = self._signed_login(user)
+
+        token_user, _ = AuthenticationToken().authenticate_credentials(tokens['token'])
+        self.assertEqual(token_user.get_deferred_fields(), {field.attname for field in User._meta.concrete_fields
+                                                           if field.attname not in ('id', 'is_email_confirmed')})
+        with self.assertNumQueries(1):
+            self.assertEqual(token_user.email, user.email)
+        token_user.first_name = 'Renamed'
+        token_user.save()
+        user.refresh_from_db()
+        self.assertEqual((user.first_name, user.email), ('Renamed', self.DEFAULT_EMAIL))
+
+        user.delete()
+        response = self.client.post('/api-token-refresh/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_and_forged_signed_tokens_are_rejected(self):
+        user = self._create_user_model(is_email_confirmed=True)
+        tokens = self._signed_login(user)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["token"]}x')
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["token"]}')
+        with override_settings(ACCESS_TOKEN_LIFETIME=-1):
+            self.assertEqual(self.client.get('/users/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token_rotation(self):
+        user = self._create_user_model(is_email_confirmed=True)
+        tokens = self._signed_login(user)
+
+        response = self.client.post('/api-token-refresh/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.data['refresh_token'], tokens['refresh_token'])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["token"]}')
+        self.assertEqual(self.client.get('/users/').status_code, status.HTTP_200_OK)
+
+        # Reusing a rotated token revokes all refresh tokens of the user
+        response = self.client.post('/api-token-refresh/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(RefreshToken.objects.filter(user=user, is_revoked=False).exists())
+
+    def test_revoke_refresh_token(self):
+        user = self._create_user_model(is_email_confirmed=True)
+        tokens = self._signed_login(user)
+
+        response = self.client.post('/api-token-revoke/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.post('/api-token-refresh/', {'refresh_token': tokens['refresh_token']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,89 @@
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from users.models import User, RefreshToken
+from users.roles import resolve_user_role, ResolvedRole
+
+ACCESS_TOKEN_SALT: str = 'users.tokens.access'
+
+
+class AccessToken(NamedTuple):
+    """
+    Payload of a signed access token. It has everything the authentication and the role based permissions need,
+    so a request with such a token is authenticated without touching the database
+    """
+    user_id: int
+    is_email_confirmed: bool
+    role: Optional[ResolvedRole]
+
+
+def is_access_token(key: str) -> bool:
+    # DRF tokens are hex strings, signed tokens always contain the signature separator
+    return signing.Signer().sep in key
+
+
+def issue_access_token(user: User) -> str:
+    user_role = resolve_user_role(user)
+    return signing.dumps({
+        'uid': user.pk,
+        'ec': user.is_email_confirmed,
+        'role': tuple(user_role) if user_role else None
+    }, salt=ACCESS_TOKEN_SALT)
+
+
+def read_access_token(key: str) -> AccessToken:
+    """
+    Verifies the signature and the age of a signed access token
+
+    :param key: signed access token
+    :raises signing.BadSignature: if the token is forged or expired
+    :return: payload of the token
+    """
+    payload = signing.loads(key, salt=ACCESS_TOKEN_SALT, max_age=settings.ACCESS_TOKEN_LIFETIME)
+    return AccessToken(user_id=payload['uid'],
+                       is_email_confirmed=payload['ec'],
+                       role=ResolvedRole(*payload['role']) if payload['role'] else None)
+
+
+def issue_token_pair(user: User) -> dict:
+    refresh_token = RefreshToken.create_token(user, settings.REFRESH_TOKEN_LIFETIME)
+    return {
+        'token': issue_access_token(user),
+        'refresh_token': refresh_token.key,
+        'expires_in': settings.ACCESS_TOKEN_LIFETIME,
+        'user_id': user.pk,
+        'email': user.email
+    }
+
+
+def rotate_refresh_token(key: str) -> Optional[dict]:
+    """
+    Revokes the given refresh token and issues a new token pair for its user. If a revoked token is presented again,
+    it is most likely stolen, so all refresh tokens of the user are revoked
+
+    :param key: refresh token
+    :return: new token pair or None if the refresh token is not valid
+    """
+    refresh_token = RefreshToken.objects.select_related('user').filter(key=key).first()
+    if not refresh_token or not refresh_token.user.is_active:
+        return None
+    if refresh_token.is_revoked:
+        revoke_user_refresh_tokens(refresh_token.user)
+        return None
+    if refresh_token.expires_at <= timezone.now():
+        return None
+    # The conditional update guarantees that a refresh token is exchanged only once
+    if not RefreshToken.objects.filter(pk=refresh_token.pk, is_revoked=False).update(is_revoked=True):
+        return None
+    return issue_token_pair(refresh_token.user)
+
+
+def revoke_refresh_token(key: str) -> bool:
+    return bool(RefreshToken.objects.filter(key=key, is_revoked=False).update(is_revoked=True))
+
+
+def revoke_user_refresh_tokens(user: User) -> None:
+    RefreshToken.objects.filter(user=user, is_revoked=False).update(is_revoked=True)
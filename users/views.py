@@ -7,9 +7,11 @@ from rest_framework.decorators import api_view, authentication_classes, permissi
 from rest_framework.generics import CreateAPIView, RetrieveUpdateAPIView
 
 from foody.permissions import IsAuthenticatedAndConfirmed, IsAdministrator, IsOwner
+from foody.readers import ValuesListMixin
 from users.mail import email_manager_instance
 from users.models import User, UserRole, RegistrationToken
 from users.serializers import UserSerializer, UserRoleSerializer, UserRoleRegistrationFormSerializer
+from users.tokens import issue_token_pair, rotate_refresh_token, revoke_refresh_token
 
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
@@ -18,11 +20,18 @@ from rest_framework.response import Response
 
 class AuthToken(ObtainAuthToken):
 
+    @swagger_auto_schema(request_body=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+        'username': openapi.Schema(type=openapi.TYPE_STRING),
+        'password': openapi.Schema(type=openapi.TYPE_STRING),
+        'mode': openapi.Schema(type=openapi.TYPE_STRING, enum=['token', 'signed'])
+    }))
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data,
                                            context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
+        if request.data.get('mode') == 'signed':
+            return Response(issue_token_pair(user))
         token, created = Token.objects.get_or_create(user=user)
         return Response({
             'token': token.key,
@@ -31,6 +40,31 @@ class AuthToken(ObtainAuthToken):
         })
 
 
+@swagger_auto_schema(method='POST', request_body=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+    'refresh_token': openapi.Schema(type=openapi.TYPE_STRING)
+}))
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([])
+def refresh_token(request):
+    token_pair = rotate_refresh_token(request.data.get('refresh_token', ''))
+    if not token_pair:
+        return Response('Refresh token is not valid', status=status.HTTP_401_UNAUTHORIZED)
+    return Response(token_pair)
+
+
+@swagger_auto_schema(method='POST', request_body=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+    'refresh_token': openapi.Schema(type=openapi.TYPE_STRING)
+}))
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([])
+def revoke_token(request):
+    if not revoke_refresh_token(request.data.get('refresh_token', '')):
+        return Response('Refresh token is not valid', status=status.HTTP_400_BAD_REQUEST)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
@@ -73,7 +107,7 @@ class RegisterUserView(CreateAPIView):
     permission_classes = (permissions.AllowAny,)
 
 
-class UserRolesView(mixins.CreateModelMixin, mixins.ListModelMixin, generics.GenericAPIView):
+class UserRolesView(ValuesListMixin, mixins.CreateModelMixin, mixins.ListModelMixin, generics.GenericAPIView):
     queryset = UserRole.objects.all()
     serializer_class = UserRoleSerializer
     permission_classes = [IsAdministrator, IsAuthenticatedAndConfirmed]
@@ -94,7 +128,7 @@ class UserRoleView(RetrieveUpdateAPIView):
     permission_classes = [IsAdministrator]
 
 
-class UserListView(mixins.ListModelMixin, generics.GenericAPIView):
+class UserListView(ValuesListMixin, mixins.ListModelMixin, generics.GenericAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
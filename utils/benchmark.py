@@ -0,0 +1,53 @@
+import time
+from typing import Callable, List, NamedTuple
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    iterations: int
+    total_time: float
+    latencies: List[float]
+
+    @property
+    def per_second(self) -> float:
+        return self.iterations / self.total_time if self.total_time else 0
+
+    def percentile(self, percent: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] if ordered else 0
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'iterations': self.iterations,
+            'total_time': self.total_time,
+            'per_second': self.per_second,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+    def __str__(self):
+        return f'{self.name:<40} {self.per_second:>12.1f}/s  p50 {self.percentile(50) * 1000:.3f} ms  ' \
+               f'p99 {self.percentile(99) * 1000:.3f} ms'
+
+
+def run_benchmark(name: str, function: Callable[[], object], iterations: int, warmup: int = 10) -> BenchmarkResult:
+    """
+    Calls the function the given number of times and measures how long each call takes
+
+    :param name: name of the benchmark shown in the results
+    :param function: measured function
+    :param iterations: number of the measured calls
+    :param warmup: number of the calls made before the measurement
+    :return: result of the benchmark
+    """
+    for _ in range(warmup):
+        function()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - call_started)
+    return BenchmarkResult(name, iterations, time.perf_counter() - started, latencies)
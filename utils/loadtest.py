@@ -0,0 +1,239 @@
+import random
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from orders.models import OrderExecution
+from products.models import Product, Availability, Category, ProductCategory, ProductImage, Feedback
+from users.models import User, UserRole
+from utils.benchmark import BenchmarkResult
+
+
+class ApiResponse(NamedTuple):
+    status_code: int
+    data: object
+    queries: Optional[int]
+
+
+class InProcessClient(object):
+    """
+    Sends the requests through the whole Django stack in the current process and counts their SQL queries
+    """
+
+    def __init__(self) -> None:
+        self._client = APIClient()
+
+    def request(self, method: str, path: str, token: str, data: dict = None) -> ApiResponse:
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self._client, method)(path, data, format='json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return ApiResponse(response.status_code, response.json() if response.content else None, len(queries))
+
+
+class HttpClient(object):
+    """
+    Sends the requests to a running server. The SQL queries of the server cannot be counted
+    """
+
+    def __init__(self, base_url: str) -> None:
+        self._base_url = base_url.rstrip('/')
+        self._session = requests.Session()
+
+    def request(self, method: str, path: str, token: str, data: dict = None) -> ApiResponse:
+        response = self._session.request(method, self._base_url + path, json=data,
+                                         headers={'Authorization': f'Bearer {token}'})
+        return ApiResponse(response.status_code, response.json() if response.content else None, None)
+
+
+class EndpointResult(NamedTuple):
+    benchmark: BenchmarkResult
+    errors: int
+    queries: List[int]
+
+    def as_dict(self) -> dict:
+        result = self.benchmark.as_dict()
+        result['errors'] = self.errors
+        result['queries_per_request'] = sum(self.queries) / len(self.queries) if self.queries else None
+        return result
+
+    def __str__(self):
+        benchmark = self.benchmark
+        queries = f'{sum(self.queries) / len(self.queries):6.1f}' if self.queries else '     -'
+        return f'{benchmark.name:<40} {benchmark.iterations:>6} requests {benchmark.per_second:>10.1f}/s  ' \
+               f'p50 {benchmark.percentile(50) * 1000:7.3f} ms  p95 {benchmark.percentile(95) * 1000:7.3f} ms  ' \
+               f'p99 {benchmark.percentile(99) * 1000:7.3f} ms  {queries} queries  {self.errors} errors'
+
+
+class LoadTest(object):
+    """
+    Drives a weighted mix of the requests made by the clients and the executors against the hot endpoints
+    """
+    CATEGORIES: int = 10
+    USERS: int = 10
+
+    def __init__(self, client, seed: int = 0, run_id: Optional[str] = None) -> None:
+        """
+        :param client: client sending the requests
+        :param seed: seed of the traffic mix
+        :param run_id: prefix of the names of the fixtures, a new one is generated by default. The fixtures of
+        different runs never clash, so the load test can run repeatedly against the same database
+        """
+        self._client = client
+        self._random = random.Random(seed)
+        self.run_id: str = run_id or uuid.uuid4().hex[:8]
+        self._user_ids: List[int] = []
+        self._category_ids: List[int] = []
+        self._product_ids: List[int] = []
+        self._claimed: Dict[int, str] = {}
+        self._client_token: str = ''
+        self._executor_token: str = ''
+        # Weights of the scenarios in the traffic mix
+        self.scenarios: List[Tuple[Callable[[], Tuple[str, ApiResponse]], int]] = [
+            (self._browse_menu, 20),
+            (self._browse_products, 10),
+            (self._browse_categories, 5),
+            (self._fetch_products_by_ids, 10),
+            (self._fetch_products_rating, 10),
+            (self._create_order, 8),
+            (self._claim_order, 6),
+            (self._update_order_execution, 12),
+            (self._list_history, 5),
+        ]
+
+    def create_fixtures(self, products: int) -> None:
+        """
+        Creates the catalog and the users making the requests. The stock is big enough for any number of orders.
+        The users and the categories of the same run are reused, see `delete_fixtures` for the clean up
+        """
+        users = []
+        for i in range(self.USERS):
+            user, created = User.objects.get_or_create(email=f'load-test-{self.run_id}-{i}@foody.local', defaults={
+                'first_name': 'Load', 'last_name': 'Test', 'phone_number': '0', 'is_email_confirmed': True
+            })
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=['password'])
+            users.append(user)
+        self._user_ids = [user.pk for user in users]
+        UserRole.objects.get_or_create(user=users[0], defaults={'role': UserRole.UserRoleChoice.client.name,
+                                                                'is_confirmed': True})
+        UserRole.objects.get_or_create(user=users[1], defaults={'role': UserRole.UserRoleChoice.executor.name,
+                                                                'is_confirmed': True})
+        self._client_token = Token.objects.get_or_create(user=users[0])[0].key
+        self._executor_token = Token.objects.get_or_create(user=users[1])[0].key
+
+        # The name of a category is at most 20 characters
+        categories = [Category.objects.get_or_create(name=f'LT {self.run_id} {i}',
+                                                     defaults={'icon_url': 'http://icon'})[0]
+                      for i in range(self.CATEGORIES)]
+        self._category_ids = [category.pk for category in categories]
+        for i in range(products):
+            product = Product.objects.create(name=f'Load test {self.run_id} product {i}',
+                                             description=f'Description of the product {i}',
+                                             price=1 + i % 20, cooking_time=60 + i % 600)
+            Availability.objects.create(product=product, available=10 ** 9)
+            ProductCategory.objects.create(product=product, category=categories[i % self.CATEGORIES])
+            ProductImage.objects.create(product=product, image_url=f'http://image/{i}')
+            for user in users[:1 + i % self.USERS]:
+                Feedback.objects.create(product=product, user=user, rating=1 + (i + user.pk) % 5)
+            self._product_ids.append(product.pk)
+
+    def delete_fixtures(self) -> None:
+        """
+        Removes the users and the catalog of the run together with the orders, the executions and the history
+        made by the requests
+        """
+        User.objects.filter(pk__in=self._user_ids).delete()
+        Product.all_objects.filter(pk__in=self._product_ids).delete()
+        Category.all_objects.filter(pk__in=self._category_ids).delete()
+        self._user_ids, self._category_ids, self._product_ids = [], [], []
+        self._claimed.clear()
+
+    def run(self, requests_count: int, warmup: int = 0) -> Tuple[Dict[str, EndpointResult], float]:
+        """
+        Sends the requests of randomly chosen scenarios
+
+        :param requests_count: number of the measured requests
+        :param warmup: number of the requests sent before the measurement
+        :return: results per endpoint and the total time of the measured requests
+        """
+        scenarios, weights = zip(*self.scenarios)
+        for scenario in self._random.choices(scenarios, weights, k=warmup):
+            scenario()
+
+        latencies, errors, queries = defaultdict(list), defaultdict(int), defaultdict(list)
+        started = time.perf_counter()
+        for scenario in self._random.choices(scenarios, weights, k=requests_count):
+            request_started = time.perf_counter()
+            name, response = scenario()
+            latencies[name].append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                errors[name] += 1
+            if response.queries is not None:
+                queries[name].append(response.queries)
+        total_time = time.perf_counter() - started
+
+        return {name: EndpointResult(BenchmarkResult(name, len(latencies[name]), sum(latencies[name]),
+                                                     latencies[name]), errors[name], queries[name])
+                for name in sorted(latencies)}, total_time
+
+    def _sample_product_ids(self, count: int) -> str:
+        return ','.join(map(str, self._random.sample(self._product_ids, min(count, len(self._product_ids)))))
+
+    def _browse_menu(self):
+        page = self._random.randint(1, max(1, len(self._product_ids) // 20))
+        return 'GET products/menu', self._client.request('get', f'/products/menu/?size=20&page={page}',
+                                                         self._client_token)
+
+    def _browse_products(self):
+        return 'GET products', self._client.request('get', '/products/?size=20&availability__is_available=true',
+                                                    self._client_token)
+
+    def _browse_categories(self):
+        return 'GET products/categories', self._client.request('get', '/products/categories/', self._client_token)
+
+    def _fetch_products_by_ids(self):
+        return 'GET products?ids', self._client.request('get', f'/products/?ids={self._sample_product_ids(10)}',
+                                                        self._client_token)
+
+    def _fetch_products_rating(self):
+        path = f'/products/feedback/product-rating/?product_ids={self._sample_product_ids(10)}'
+        return 'GET products/feedback/product-rating', self._client.request('get', path, self._client_token)
+
+    def _create_order(self):
+        return 'POST orders', self._client.request('post', '/orders/', self._client_token, {
+            'product': self._random.choice(self._product_ids),
+            'count': self._random.randint(1, 3),
+        })
+
+    def _claim_order(self):
+        response = self._client.request('post', '/orders/execution/claim-next/', self._executor_token)
+        if response.status_code == 404:
+            # There is no order to claim, a client has to create one first
+            return self._create_order()
+        if response.status_code == 201:
+            self._claimed[response.data['id']] = response.data['status']
+        return 'POST orders/execution/claim-next', response
+
+    def _update_order_execution(self):
+        if not self._claimed:
+            return self._claim_order()
+        order_execution_id = self._random.choice(list(self._claimed))
+        statuses = list(OrderExecution.Status.values)
+        next_status = statuses[statuses.index(self._claimed[order_execution_id]) + 1]
+        if next_status == OrderExecution.Status.delivered:
+            del self._claimed[order_execution_id]
+        else:
+            self._claimed[order_execution_id] = next_status
+        return 'PATCH orders/execution', self._client.request('patch', f'/orders/execution/{order_execution_id}/',
+                                                              self._executor_token, {'status': next_status})
+
+    def _list_history(self):
+        return 'GET orders/history', self._client.request('get', '/orders/history/?pagination=cursor&size=20',
+                                                          self._executor_token)
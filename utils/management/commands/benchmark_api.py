@@ -0,0 +1,76 @@
+import json
+import logging
+import platform
+import subprocess
+from datetime import datetime
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from utils.loadtest import LoadTest, InProcessClient, HttpClient
+
+
+def _get_git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = 'Drives a mix of catalog browsing, order and execution requests against the API and reports throughput, ' \
+           'latency percentiles and SQL queries per endpoint. By default the requests go through the Django stack ' \
+           'in-process against a throwaway test database. With --url they are sent to a running server, ' \
+           'the fixtures are created in the configured database then and removed after the run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Number of the measured requests')
+        parser.add_argument('--warmup', type=int, default=100)
+        parser.add_argument('--products', type=int, default=200, help='Number of the products in the catalog')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the traffic mix')
+        parser.add_argument('--url', help='Base url of a running server, e.g. http://localhost:8000')
+        parser.add_argument('--output', help='Path of the JSON file the results are written to')
+        parser.add_argument('--keep-fixtures', action='store_true',
+                            help='Keep the users and the catalog created in the database of the running server')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            load_test = LoadTest(HttpClient(options['url']), seed=options['seed'])
+            try:
+                load_test.create_fixtures(options['products'])
+                results, total_time = load_test.run(options['requests'], options['warmup'])
+            finally:
+                if not options['keep_fixtures']:
+                    load_test.delete_fixtures()
+        else:
+            # The expected 404 of claiming when there is no order would be logged on every request otherwise
+            logging.getLogger('django.request').setLevel(logging.ERROR)
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                load_test = LoadTest(InProcessClient(), seed=options['seed'])
+                load_test.create_fixtures(options['products'])
+                results, total_time = load_test.run(options['requests'], options['warmup'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self.stdout.write(f'{options["requests"]} requests in {total_time:.2f} s, '
+                          f'{options["requests"] / total_time:.1f} requests/s')
+        for result in results.values():
+            self.stdout.write(str(result))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({
+                    'commit': _get_git_commit(),
+                    'created_at': datetime.now().isoformat(),
+                    'python': platform.python_version(),
+                    'database': connection.vendor,
+                    'mode': 'http' if options['url'] else 'in-process',
+                    'options': {name: options[name] for name in ('requests', 'warmup', 'products', 'seed')},
+                    'total_time': total_time,
+                    'requests_per_second': options['requests'] / total_time,
+                    'endpoints': [result.as_dict() for result in results.values()],
+                }, output, indent=2)
@@ -0,0 +1,89 @@
+import json
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from foody.readers import get_values_reader
+from orders.models import Order, OrderExecution, History
+from orders.views import OrderView, OrderExecutionView, HistoryView
+from products.models import Product, Availability, Category, ProductCategory, Feedback
+from products.views import ProductView, AvailabilityView, CategoryView, ProductCategoryView, FeedbackView
+from users.models import User, UserRole
+from users.views import UserRolesView, UserListView
+from utils.benchmark import run_benchmark
+
+VIEWS = [ProductView, AvailabilityView, CategoryView, ProductCategoryView, FeedbackView, OrderView,
+         OrderExecutionView, HistoryView, UserRolesView, UserListView]
+
+
+def _bulk_create(model, objects: list) -> list:
+    model.objects.bulk_create(objects)
+    # Not every database returns the primary keys of the inserted rows, so they are read back
+    return model.objects.order_by('-id')[:len(objects)][::-1]
+
+
+def _create_rows(rows: int) -> None:
+    users = _bulk_create(User, [User(email=f'benchmark-{i}@foody.local', first_name='Benchmark',
+                                     last_name='Benchmark', phone_number='0', is_email_confirmed=True)
+                                for i in range(rows)])
+    UserRole.objects.bulk_create([UserRole(user=user, role=UserRole.UserRoleChoice.client.name, is_confirmed=True)
+                                  for user in users])
+    products = _bulk_create(Product, [Product(name=f'Product {i}', description='Description', price=i * 0.5,
+                                              cooking_time=60) for i in range(rows)])
+    categories = _bulk_create(Category, [Category(name=f'Category {i}', icon_url='http://icon') for i in range(rows)])
+    Availability.objects.bulk_create([Availability(product=product, available=10) for product in products])
+    ProductCategory.objects.bulk_create([ProductCategory(product=product, category=category)
+                                         for product, category in zip(products, categories)])
+    Feedback.objects.bulk_create([Feedback(product=product, user=users[0], rating=5) for product in products])
+    orders = _bulk_create(Order, [Order(product=product, user=users[0], count=1, price=product.price,
+                                        cooking_time=60) for product in products])
+    OrderExecution.objects.bulk_create([OrderExecution(order=order, executor=users[0],
+                                                       status=OrderExecution.Status.cooking) for order in orders])
+    History.objects.bulk_create([History(product=product, user=users[0], count=1, price=product.price,
+                                         cooking_time=60, executor=users[0], finish_time=timezone.now(),
+                                         delivery_address='Address') for product in products])
+
+
+class Command(BaseCommand):
+    help = 'Compares rows per second of the list serializers and of the values readers for every list view. ' \
+           'The benchmark rows are created in a transaction which is rolled back at the end'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Number of the rows created for every model')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        results = []
+        with transaction.atomic():
+            _create_rows(options['rows'])
+            for view in VIEWS:
+                queryset, serializer_class = view.queryset, view.serializer_class
+                reader = get_values_reader(serializer_class)
+                if reader is None:
+                    self.stderr.write(f'{view.__name__} cannot be read from the values, skipped')
+                    continue
+                rows = queryset.count()
+                serializer = run_benchmark(f'{view.__name__}:serializer',
+                                           lambda: serializer_class(queryset.all(), many=True).data,
+                                           options['iterations'], warmup=2)
+                values = run_benchmark(f'{view.__name__}:values',
+                                       lambda: reader.read_many(queryset.values(*reader.columns)),
+                                       options['iterations'], warmup=2)
+                results.append({
+                    'view': view.__name__,
+                    'rows': rows,
+                    'serializer_rows_per_second': serializer.per_second * rows,
+                    'values_rows_per_second': values.per_second * rows,
+                })
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for result in results:
+                self.stdout.write(f'{result["view"]:<20} {result["rows"]:>6} rows  '
+                                  f'serializer {result["serializer_rows_per_second"]:>12.0f} rows/s  '
+                                  f'values {result["values_rows_per_second"]:>12.0f} rows/s  '
+                                  f'x{result["values_rows_per_second"] / result["serializer_rows_per_second"]:.1f}')
@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.apps import apps
+from django.core.management import BaseCommand
+from django.db import connections, transaction, OperationalError
+from django.db.models import F
+
+from orders.models import Order
+from products.models import Product, Availability
+from users.models import User
+
+PROFILES = {
+    'default': 'django.db.backends.sqlite3',
+    'production': 'foody.sqlite3',
+}
+
+
+def _create_database(alias: str, engine: str, path: str, products: int) -> None:
+    connections.databases[alias] = {'ENGINE': engine, 'NAME': path}
+    connections.ensure_defaults(alias)
+    connections.prepare_test_settings(alias)
+    with connections[alias].schema_editor() as editor:
+        for model in apps.get_models():
+            if model._meta.managed and not model._meta.proxy:
+                editor.create_model(model)
+    User.objects.using(alias).create(email='benchmark@foody.local', first_name='Benchmark', last_name='Benchmark',
+                                     phone_number='0', is_email_confirmed=True)
+    Product.objects.using(alias).bulk_create([Product(name=f'Product {i}', description='Description',
+                                                      price=i * 0.5, cooking_time=60) for i in range(products)])
+    Availability.objects.using(alias).bulk_create([Availability(product=product, available=10 ** 6)
+                                                   for product in Product.objects.using(alias).all()])
+
+
+def _create_order(alias: str, user_id: int, product_id: int) -> None:
+    # Same statements as OrderView.create and perform_create: the product is read, the stock is reserved
+    # and the order is inserted, all in one transaction
+    with transaction.atomic(using=alias):
+        product = Product.objects.using(alias).get(pk=product_id)
+        Availability.objects.using(alias).filter(product_id=product_id, available__gte=1) \
+            .update(available=F('available') - 1)
+        Order.objects.using(alias).create(product=product, user_id=user_id, count=1, price=product.price,
+                                          cooking_time=product.cooking_time)
+
+
+def _run(alias: str, workers: int, orders: int, readers: int) -> dict:
+    user_id = User.objects.using(alias).get().pk
+    product_ids = list(Product.objects.using(alias).values_list('id', flat=True))
+    created, errors = [0] * workers, [0] * workers
+    stop = threading.Event()
+
+    def write(worker: int) -> None:
+        for i in range(orders):
+            try:
+                _create_order(alias, user_id, product_ids[(worker + i) % len(product_ids)])
+                created[worker] += 1
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                errors[worker] += 1
+        connections[alias].close()
+
+    def read() -> None:
+        while not stop.is_set():
+            try:
+                list(Order.objects.using(alias).order_by('-id').values('id', 'product_id', 'price')[:50])
+            except OperationalError:
+                pass
+        connections[alias].close()
+
+    reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=write, args=(worker,)) for worker in range(workers)]
+    for thread in reader_threads:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    total_time = time.perf_counter() - start
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+
+    attempts = workers * orders
+    return {
+        'orders': sum(created),
+        'lock_errors': sum(errors),
+        'lock_error_rate': sum(errors) / attempts,
+        'orders_per_second': sum(created) / total_time,
+        'total_time': total_time,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Creates orders from concurrent threads in a temporary SQLite file, once with the default backend ' \
+           'and once with the production profile from foody.sqlite3, and compares the throughput and ' \
+           'the rate of "database is locked" errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Number of the threads creating orders')
+        parser.add_argument('--orders', type=int, default=200, help='Number of the orders created by every worker')
+        parser.add_argument('--readers', type=int, default=2, help='Number of the threads reading the orders')
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for profile, engine in PROFILES.items():
+                alias = f'benchmark_{profile}'
+                _create_database(alias, engine, os.path.join(directory, f'{profile}.sqlite3'), options['products'])
+                connections[alias].close()
+                results[profile] = _run(alias, options['workers'], options['orders'], options['readers'])
+                connections[alias].close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for profile, result in results.items():
+                self.stdout.write(f'{profile:<12} {result["orders"]:>6} orders  '
+                                  f'{result["orders_per_second"]:>10.1f} orders/s  '
+                                  f'lock errors {result["lock_errors"]:>5} ({result["lock_error_rate"]:.1%})')
@@ -1,11 +1,23 @@
-from django.test import TestCase
+import re
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from orders import eta
+from products.models import Product, Category
 from users.models import User, UserRole
+from utils.loadtest import InProcessClient, LoadTest
 
 
-class ApiTestCase(TestCase):
+class ApiTestMixin(object):
     class Decorators(object):
         @staticmethod
         def create_default_user_and_log_in(role: UserRole.UserRoleChoice = UserRole.UserRoleChoice.client,
@@ -27,6 +39,9 @@ class ApiTestCase(TestCase):
 
     def setUp(self) -> None:
         self.client = APIClient()
+        cache.clear()
+        # The tests start with an empty model of the kitchen instead of loading it in the background
+        eta.reset_engine(eta.OrderEtaEngine())
 
     def _create_default_user_and_log_in(self, is_email_confirmed: bool = True,
                                         role: UserRole.UserRoleChoice = UserRole.UserRoleChoice.client,
@@ -47,9 +62,43 @@ class ApiTestCase(TestCase):
                                         is_email_confirmed=is_email_confirmed)
 
     def _login(self, user: User, user_password: str = DEFAULT_PASSWORD):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self._get_token(user, user_password)}')
+
+    def _get_token(self, user: User, user_password: str = DEFAULT_PASSWORD) -> str:
         response = self.client.post('/api-token-auth/', {'username': user.email, 'password': user_password})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["token"]}')
+        return response.data['token']
+
+    @staticmethod
+    def _get_full_table_scans(sql: str) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        # A scan through an index, e.g. `SCAN orders_order USING INDEX ...`, reads only the rows of the index
+        return [step for step in plan if re.match(r'SCAN \w+$', step)]
+
+    def assertNoFullTableScan(self, queryset) -> None:
+        """
+        Fails if the query plan of the queryset reads a whole table. Query plans are checked on SQLite only
+        """
+        if connection.vendor == 'sqlite':
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                sql = connection.ops.last_executed_query(cursor, sql, params)
+            self.assertEqual(self._get_full_table_scans(sql), [], sql)
+
+    @contextmanager
+    def assertQueriesUseIndexes(self):
+        """
+        Fails if the query plan of any query made in the block reads a whole table. It is meant for the requests
+        to the endpoints, whose querysets are built by the views. Query plans are checked on SQLite only
+        """
+        with CaptureQueriesContext(connection) as queries:
+            yield
+        if connection.vendor == 'sqlite':
+            for query in queries.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    self.assertEqual(self._get_full_table_scans(query['sql']), [], query['sql'])
 
     def _register_user(self, email: str = DEFAULT_EMAIL, password: str = DEFAULT_PASSWORD,
                        role: UserRole.UserRoleChoice = UserRole.UserRoleChoice.client):
@@ -62,3 +111,33 @@ class ApiTestCase(TestCase):
                 }
         self.client.credentials()
         return self.client.post('/users/register', data)
+
+
+class ApiTestCase(ApiTestMixin, TestCase):
+    pass
+
+
+class ApiTransactionTestCase(ApiTestMixin, TransactionTestCase):
+    pass
+
+
+class BenchmarkApiTestCase(ApiTestCase):
+    def test_benchmark_against_server_cleans_up(self):
+        # The requests go through the Django stack in-process instead of a running server
+        with mock.patch('utils.management.commands.benchmark_api.HttpClient', lambda url: InProcessClient()):
+            for _ in range(2):
+                out = StringIO()
+                call_command('benchmark_api', '--url', 'http://testserver', '--requests', '30', '--warmup', '0',
+                             '--products', '3', stdout=out)
+                self.assertIn('30 requests', out.getvalue())
+
+        self.assertFalse(User.objects.filter(email__startswith='load-test-').exists())
+        self.assertFalse(Product.all_objects.exists())
+
+    def test_fixture_names_fit_columns(self):
+        # SQLite does not enforce the lengths, the other databases reject or truncate the longer names
+        LoadTest(InProcessClient()).create_fixtures(products=3)
+        for model in (Category, Product):
+            max_length = model._meta.get_field('name').max_length
+            self.assertTrue(all(len(name) <= max_length for name in model.objects.values_list('name', flat=True)),
+                            model)